@@ -2,3 +2,4 @@ from .data import data_app
 from .parameters import param_app
 from .finetune_utils import finetune_app
 from .main import app
+from .predict import predict
@@ -82,6 +82,11 @@ def get_fingerprints_from_model(
     pretrained_model: str,
     save_destination: str,
     output_type: str = typer.Option("torch", help="Either numpy (.npy) or torch (.pt) output"),
+    shard_size: Optional[int] = typer.Option(
+        None,
+        help="If set, stream the fingerprints to .npy shards of this many rows instead of a single file. "
+        "An interrupted run is resumed from its last completed shard.",
+    ),
     overrides: Optional[List[str]] = typer.Option(None, "--override", "-o", help="Hydra overrides"),
 ):
     """Endpoint for getting fingerprints from a pretrained model.
@@ -90,6 +95,9 @@ def get_fingerprints_from_model(
     The fingerprint layer specification should be of the format `module:layer`.
     If specified as a list, the fingerprints from all the specified layers will be concatenated.
     See the docs of the `graphium.finetuning.fingerprinting.Fingerprinter` class for more info.
+
+    For large datasets, use `--shard-size` to write the fingerprints to disk as they are computed.
+    The shards can then be loaded with `graphium.finetuning.fingerprinting.load_fingerprint_shards`.
     """
 
     if overrides is None:
@@ -119,6 +127,13 @@ def get_fingerprints_from_model(
     )
 
     ## == Fingerprinter
+    if shard_size is not None:
+        path = fs.join(save_destination, "fingerprints")
+        logger.info(f"Streaming fingerprints to {path}")
+        with Fingerprinter(model=predictor, fingerprint_spec=fingerprint_layer_spec) as fp:
+            fp.write_fingerprints_for_dataset(datamodule.predict_dataloader(), path, shard_size=shard_size)
+        return
+
     with Fingerprinter(model=predictor, fingerprint_spec=fingerprint_layer_spec, out_type=output_type) as fp:
         fps = fp.get_fingerprints_for_dataset(datamodule.predict_dataloader())
 
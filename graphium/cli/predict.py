@@ -0,0 +1,45 @@
+from typing import List, Optional
+
+import typer
+from loguru import logger
+
+from graphium.trainer.inference import InferenceEngine
+
+from .main import app
+
+
+@app.command(name="predict", help="Predict the properties of molecules with a pretrained model.")
+def predict(
+    pretrained_model: str,
+    input_path: str,
+    output_path: str,
+    smiles_col: str = typer.Option("smiles", help="Column of the SMILES in the input file"),
+    keep_cols: Optional[List[str]] = typer.Option(None, help="Input columns to copy in the output"),
+    device: str = typer.Option("cpu", help="Device of the model"),
+    precision: str = typer.Option("32", help="Either 32 or bf16"),
+    num_threads: Optional[int] = typer.Option(None, help="Number of torch threads on CPU"),
+    n_jobs: int = typer.Option(0, help="Number of processes for the featurization"),
+    chunk_size: int = typer.Option(100_000, help="Number of molecules featurized and predicted at once"),
+    max_num_nodes: int = typer.Option(8192, help="Maximum number of nodes per batch"),
+    max_batch_size: int = typer.Option(1024, help="Maximum number of molecules per batch"),
+):
+    """Predict the graph-level tasks of a pretrained model for the SMILES of a CSV or Parquet file.
+
+    The pretrained model should be a `.ckpt` path or pre-specified, named model within Graphium.
+    The molecules are streamed by chunks, without a datamodule or a featurization cache, and the
+    predictions are appended to the `.csv` or `.parquet` output file as the chunks complete.
+    See the docs of the `graphium.trainer.inference.InferenceEngine` class for more info.
+    """
+    engine = InferenceEngine.from_pretrained(
+        pretrained_model,
+        device=device,
+        max_num_nodes=max_num_nodes,
+        max_batch_size=max_batch_size,
+        featurization_n_jobs=n_jobs,
+        precision=precision,
+        num_threads=num_threads,
+    )
+    num_molecules = engine.predict_file(
+        input_path, output_path, smiles_col=smiles_col, keep_cols=keep_cols, chunk_size=chunk_size
+    )
+    logger.info(f"Saved the predictions of {num_molecules} molecules to {output_path}")
@@ -274,6 +274,9 @@ def load_architecture(
         graph_output_nn_kwargs=graph_output_nn_kwargs,
         task_heads_kwargs=task_heads_kwargs,
     )
+    if cfg_arch.get("fuse_task_heads", False):
+        model_kwargs["fuse_task_heads"] = True
+
     # Get accelerator_kwargs if they exist
     accelerator_kwargs = config["accelerator"].get("accelerator_kwargs", None)
     if accelerator_kwargs is not None:
@@ -12,19 +12,23 @@ Refer to the LICENSE file for the full terms and conditions.
 """
 
 from collections.abc import Mapping, Sequence
+from copy import copy
 
 # from pprint import pprint
+import numpy as np
 import torch
+from torch import Tensor
 from numpy import ndarray
-from scipy.sparse import spmatrix
+from scipy.sparse import spmatrix, issparse
 from torch.utils.data.dataloader import default_collate
-from typing import Union, List, Optional, Dict, Type, Any, Iterable
+from typing import Union, List, Optional, Dict, Type, Any, Iterable, Set, Tuple
 from torch_geometric.data import Data, Batch
 
 from graphium.features import GraphDict, to_dense_array
 from graphium.utils.packing import fast_packing, get_pack_sizes, node_to_pack_indices_mask
 from loguru import logger
 from graphium.data.utils import get_keys
+from graphium.data.label_store import LabelStore, MoleculeLabels
 
 
 def graphium_collate_fn(
@@ -95,10 +99,9 @@ def graphium_collate_fn(
                 batch[key] = collate_labels(labels, labels_size_dict, labels_dtype_dict)
 
             # If the features are a dictionary containing GraphDict elements,
-            # Convert to pyg graphs and use the pyg batching.
+            # batch their arrays directly into a pyg batch.
             elif isinstance(elem[key], GraphDict):
-                pyg_graphs = [d[key].make_pyg_graph(mask_nan=mask_nan) for d in elements]
-                batch[key] = collage_pyg_graph(pyg_graphs)
+                batch[key] = collate_graph_dicts([d[key] for d in elements], mask_nan=mask_nan)
 
             # If a PyG Graph is provided, use the PyG batching
             elif isinstance(elem[key], Data):
@@ -136,14 +139,13 @@ def collage_pyg_graph(pyg_graphs: Iterable[Union[Data, Dict]], batch_size_per_pa
             This is useful for using packing with the Transformer,
     """
 
-    # Calculate maximum number of nodes per graph in current batch
-    num_nodes_list = []
-    for pyg_graph in pyg_graphs:
-        num_nodes_list.append(pyg_graph["num_nodes"])
-    max_num_nodes_per_graph = max(num_nodes_list)
+    num_nodes = np.asarray([pyg_graph["num_nodes"] for pyg_graph in pyg_graphs], dtype=np.int64)
 
-    pyg_batch = []
+    # The nodepair-level positional encodings are padded together after the batching,
+    # so shallow copies of the graphs are batched, without modifying the graphs of the dataset
+    pyg_batch, nodepairs = [], {}
     for pyg_graph in pyg_graphs:
+        pyg_graph = copy(pyg_graph)
         for pyg_key in get_keys(pyg_graph):
             tensor = pyg_graph[pyg_key]
 
@@ -151,9 +153,9 @@ def collage_pyg_graph(pyg_graphs: Iterable[Union[Data, Dict]], batch_size_per_pa
             if isinstance(tensor, (ndarray, spmatrix)):
                 tensor = torch.as_tensor(to_dense_array(tensor, tensor.dtype))
 
-            # pad nodepair-level positional encodings
             if pyg_key.startswith("nodepair_"):
-                pyg_graph[pyg_key] = pad_nodepairs(tensor, pyg_graph["num_nodes"], max_num_nodes_per_graph)
+                nodepairs.setdefault(pyg_key, []).append(tensor)
+                del pyg_graph[pyg_key]
             else:
                 pyg_graph[pyg_key] = tensor
 
@@ -178,7 +180,149 @@ def collage_pyg_graph(pyg_graphs: Iterable[Union[Data, Dict]], batch_size_per_pa
             pyg_graph.pack_from_node_idx = pack_from_node_idx
             pyg_graph.pack_attn_mask = pack_attn_mask
 
-    return Batch.from_data_list(pyg_batch)
+    batch = Batch.from_data_list(pyg_batch)
+
+    # Pad the nodepair-level positional encodings of all the graphs in a single allocation
+    node_ptr = torch.from_numpy(np.concatenate([[0], np.cumsum(num_nodes)]))
+    for pyg_key, values in nodepairs.items():
+        if len(values) != len(pyg_batch):
+            raise ValueError(f"Nodepair key `{pyg_key}` is missing in some of the graphs of the batch")
+        batch[pyg_key] = batch_nodepairs(values, num_nodes)
+        batch._slice_dict[pyg_key] = node_ptr
+        batch._inc_dict[pyg_key] = torch.zeros(len(pyg_batch), dtype=torch.int64)
+
+    return batch
+
+
+def batch_nodepairs(values: List[Union[Tensor, ndarray]], num_nodes: ndarray) -> Tensor:
+    """
+    Zero-pad and concatenate the nodepair-level positional encodings of a batch of graphs,
+    with a single allocation for the whole batch. Equivalent to concatenating the outputs of
+    `pad_nodepairs` for each graph.
+
+    Parameters:
+        values: The nodepair encodings of each graph, of shape `[num_nodes, num_nodes, num_feat]`
+        num_nodes: The number of nodes of each graph
+
+    Returns:
+        padded_pe: The padded encodings, of shape `[sum(num_nodes), max(num_nodes), num_feat]`
+    """
+    values = [torch.as_tensor(val) for val in values]
+    dtype = values[0].dtype
+    for val in values[1:]:
+        dtype = torch.promote_types(dtype, val.dtype)
+
+    max_num_nodes_per_graph = int(np.max(num_nodes))
+    padded_shape = (int(np.sum(num_nodes)), max_num_nodes_per_graph) + tuple(values[0].shape[2:])
+    padded_pe = torch.zeros(padded_shape, dtype=dtype)
+    start = 0
+    for val, this_num_nodes in zip(values, num_nodes):
+        this_num_nodes = int(this_num_nodes)
+        padded_pe[start : start + this_num_nodes, :this_num_nodes] = val[:, :this_num_nodes]
+        start += this_num_nodes
+
+    return padded_pe
+
+
+def collate_graph_dicts(
+    graph_dicts: List[GraphDict], mask_nan: Union[str, float, Type[None]] = "raise"
+) -> Batch:
+    """
+    Function to collate `GraphDict` into a PyG `Batch`, identical to the one obtained by
+    converting each of them with `GraphDict.make_pyg_graph` and batching them with `collage_pyg_graph`.
+
+    Instead of building a PyG `Data` per graph, the node, edge and nodepair arrays of all the graphs
+    are concatenated directly, with a single allocation per field. The edge indices are offset
+    by the cumulative number of nodes, and the `batch` and `ptr` vectors are computed with numpy.
+    If the graphs do not share the same keys, falls back to the PyG batching.
+
+    Parameters:
+        graph_dicts: List of `GraphDict`
+        mask_nan: Passed to `GraphDict.make_pyg_graph` for the fallback. See `graphium_collate_fn`.
+    """
+
+    data_keys = [key for key in graph_dicts[0].keys if key not in ["adj", "dtype", "mask_nan"]]
+    same_keys = all(set(graph_dict.keys) == set(graph_dicts[0].keys) for graph_dict in graph_dicts)
+    if (not same_keys) or any(("index" in key) or ("face" in key) for key in data_keys):
+        pyg_graphs = [graph_dict.make_pyg_graph(mask_nan=mask_nan) for graph_dict in graph_dicts]
+        return collage_pyg_graph(pyg_graphs)
+
+    num_graphs = len(graph_dicts)
+    adjs = [graph_dict.adj.tocoo() for graph_dict in graph_dicts]
+    num_nodes = np.asarray([adj.shape[0] for adj in adjs], dtype=np.int64)
+    num_edges = np.asarray([len(adj.row) for adj in adjs], dtype=np.int64)
+    node_ptr = np.concatenate([[0], np.cumsum(num_nodes)])
+    edge_ptr = np.concatenate([[0], np.cumsum(num_edges)])
+
+    # Offset the edge indices of each graph by the number of nodes of the previous graphs
+    edge_offsets = np.repeat(node_ptr[:-1], num_edges)
+    edge_index = np.empty((2, edge_ptr[-1]), dtype=np.int64)
+    edge_index[0] = np.concatenate([adj.row for adj in adjs]) + edge_offsets
+    edge_index[1] = np.concatenate([adj.col for adj in adjs]) + edge_offsets
+
+    fields = {
+        "edge_index": torch.from_numpy(edge_index),
+        "edge_weight": torch.as_tensor(np.concatenate([adj.data for adj in adjs])),
+    }
+    slices = {"edge_index": edge_ptr, "edge_weight": edge_ptr}
+    for key in data_keys:
+        values = []
+        for graph_dict in graph_dicts:
+            val = graph_dict[key]
+            # Same conversions as `GraphDict.make_pyg_graph`
+            if isinstance(val, ndarray):
+                val = val.astype(graph_dict.dtype, copy=False)
+            elif issparse(val):
+                val = to_dense_array(val, np.float32)
+            elif isinstance(val, torch.Tensor):
+                val = val.numpy()
+            else:
+                break
+            values.append(val.reshape(1) if val.ndim == 0 else val)
+        if len(values) < num_graphs:
+            continue  # Skip the other parameters
+
+        if key.startswith("nodepair_"):
+            fields[key] = batch_nodepairs(values, num_nodes)
+        else:
+            fields[key] = torch.from_numpy(np.concatenate(values, axis=0))
+        slices[key] = np.concatenate([[0], np.cumsum([this_val.shape[0] for this_val in values])])
+
+    return _make_batch(fields, slices, num_nodes, store_num_nodes=True)
+
+
+def _make_batch(
+    fields: Dict[str, torch.Tensor],
+    slices: Dict[str, ndarray],
+    num_nodes: ndarray,
+    store_num_nodes: bool,
+) -> Batch:
+    """
+    Build a PyG `Batch` from already concatenated fields, with the same attributes as `Batch.from_data_list`.
+
+    Parameters:
+        fields: The concatenated tensors, with `"edge_index"` already offset by the number of nodes
+        slices: The boundaries of each graph in each field, of length `num_graphs + 1`
+        num_nodes: The number of nodes of each graph
+        store_num_nodes: Whether the graphs had an explicit `num_nodes` attribute
+    """
+    num_graphs = len(num_nodes)
+    node_ptr = np.concatenate([[0], np.cumsum(num_nodes)]).astype(np.int64)
+
+    batch = Batch(_base_cls=Data)
+    for key, val in fields.items():
+        batch[key] = val
+    batch.batch = torch.from_numpy(np.repeat(np.arange(num_graphs, dtype=np.int64), num_nodes))
+    batch.ptr = torch.from_numpy(node_ptr)
+    if store_num_nodes:
+        batch._store._num_nodes = num_nodes.tolist()
+        batch.num_nodes = int(node_ptr[-1])
+    batch._num_graphs = num_graphs
+    batch._slice_dict = {key: torch.as_tensor(val, dtype=torch.int64) for key, val in slices.items()}
+    batch._inc_dict = {key: torch.zeros(num_graphs, dtype=torch.int64) for key in slices.keys()}
+    if "edge_index" in fields:
+        batch._inc_dict["edge_index"] = torch.from_numpy(node_ptr[:-1])
+    return batch
 
 
 def pad_to_expected_label_size(labels: torch.Tensor, label_size: List[int]):
@@ -202,16 +346,18 @@ def pad_to_expected_label_size(labels: torch.Tensor, label_size: List[int]):
     return torch.nn.functional.pad(labels, pad_sizes, value=torch.nan)
 
 
-def collate_pyg_graph_labels(pyg_labels: List[Data]):
+def collate_pyg_graph_labels(pyg_labels: List[Union[Data, MoleculeLabels]]):
     """
     Function to collate pytorch geometric labels.
     Convert all numpy types to torch
 
     Parameters:
-        pyg_labels: Iterable of PyG label Data objects
+        pyg_labels: Iterable of PyG label Data objects, or of views of a `LabelStore`
     """
     pyg_batch = []
     for pyg_label in pyg_labels:
+        if isinstance(pyg_label, MoleculeLabels):
+            pyg_label = pyg_label.to_data()
         for pyg_key in set(get_keys(pyg_label)) - set(["x", "edge_index"]):
             tensor = pyg_label[pyg_key]
             # Convert numpy/scipy to Pytorch
@@ -241,14 +387,22 @@ def get_expected_label_size(label_data: Data, task: str, label_size: List[int]):
 
 
 def collate_labels(
-    labels: List[Data],
+    labels: List[Union[Data, MoleculeLabels]],
     labels_size_dict: Optional[Dict[str, Any]] = None,
     labels_dtype_dict: Optional[Dict[str, Any]] = None,
 ):
     """Collate labels for multitask learning.
 
+    The graph-level labels of all the tasks are written with a single scatter into a preallocated
+    NaN matrix per dtype, of shape `[batch, sum of the task sizes]`, and each task is a view of its
+    columns. The node and edge-level labels are written at the offsets of each graph into a
+    preallocated NaN tensor per task. Missing labels are thus left as NaNs.
+
+    When all the labels are views of the same `LabelStore`, the labels of each task are gathered for
+    the whole batch from the columns of the store, without a loop over the molecules.
+
     Parameters:
-        labels: List of labels
+        labels: List of labels, either PyG `Data` or views of a `LabelStore`
         labels_size_dict: Dict of the form Dict[tasks, sizes] which has task names as keys
             and the size of the label tensor as value. The size of the tensor corresponds to how many
             labels/values there are to predict for that task.
@@ -261,45 +415,212 @@ def collate_labels(
         A dictionary of the form Dict[tasks, labels] where tasks is the name of the task and labels
         is a tensor of shape (batch_size, *labels_size_dict[task]).
     """
-    if labels_size_dict is not None:
-        for this_label in labels:
-            for task in labels_size_dict.keys():
-                labels_size_dict[task] = list(labels_size_dict[task])
-                if len(labels_size_dict[task]) >= 2:
-                    labels_size_dict[task] = labels_size_dict[task][1:]
-                elif not task.startswith("graph_"):
-                    labels_size_dict[task] = [1]
-            label_keys_set = set(get_keys(this_label))
-            empty_task_labels = set(labels_size_dict.keys()) - label_keys_set
-            for task in empty_task_labels:
-                labels_size_dict[task] = get_expected_label_size(this_label, task, labels_size_dict[task])
-                dtype = labels_dtype_dict[task]
-                this_label[task] = torch.full([*labels_size_dict[task]], torch.nan, dtype=dtype)
-
-            for task in label_keys_set - set(["x", "edge_index"]) - empty_task_labels:
-                labels_size_dict[task] = get_expected_label_size(this_label, task, labels_size_dict[task])
-
-                if not isinstance(this_label[task], (torch.Tensor)):
-                    this_label[task] = torch.as_tensor(this_label[task])
-
-                # Ensure explicit task dimension also for single task labels
-                if len(this_label[task].shape) == 1:
-                    # Distinguish whether target dim or entity dim is missing
-                    if labels_size_dict[task][0] == this_label[task].shape[0]:
-                        # num graphs/nodes/edges/nodepairs already matching
-                        this_label[task] = this_label[task].unsqueeze(1)
-                    else:
-                        # data lost unless entity dim is supposed to be 1
-                        if labels_size_dict[task][0] == 1:
-                            this_label[task] = this_label[task].unsqueeze(0)
-                        else:
-                            raise ValueError(
-                                f"Labels for {labels_size_dict[task][0]} nodes/edges/nodepairs expected, got 1."
-                            )
-
-                this_label[task] = pad_to_expected_label_size(this_label[task], labels_size_dict[task])
-
-    return collate_pyg_graph_labels(labels)
+    if labels_size_dict is None:
+        return collate_pyg_graph_labels(labels)
+
+    labels_dtype_dict = {} if labels_dtype_dict is None else labels_dtype_dict
+    label_sizes = {task: _get_label_size(task, size) for task, size in labels_size_dict.items()}
+    for task in label_sizes.keys():
+        if task.startswith("nodepair_"):
+            raise NotImplementedError()
+
+    num_graphs = len(labels)
+    store = _get_label_store(labels)
+    if store is not None:
+        # All the labels are views of the same `LabelStore`, so their values are gathered per task at once
+        mol_indices = np.asarray([label.idx for label in labels], dtype=np.int64)
+        has_graph_sizes = store.num_nodes is not None
+        num_nodes = store.num_nodes[mol_indices] if has_graph_sizes else np.zeros(num_graphs, dtype=np.int64)
+        num_edges = store.num_edges[mol_indices] if has_graph_sizes else np.zeros(num_graphs, dtype=np.int64)
+        label_keys = None
+    else:
+        has_graph_sizes = False
+        label_keys = [set(get_keys(label)) for label in labels]
+        graph_sizes = [_get_label_graph_size(label, keys) for label, keys in zip(labels, label_keys)]
+        num_nodes = np.asarray([num_nodes for num_nodes, _ in graph_sizes], dtype=np.int64)
+        num_edges = np.asarray([num_edges for _, num_edges in graph_sizes], dtype=np.int64)
+    node_ptr = np.concatenate([[0], np.cumsum(num_nodes)])
+    edge_ptr = np.concatenate([[0], np.cumsum(num_edges)])
+
+    fields, slices = {}, {}
+    if not has_graph_sizes:
+        has_graph_sizes = all(isinstance(label, MoleculeLabels) and label.has_graph_sizes for label in labels)
+    if has_graph_sizes:
+        # The views of a `LabelStore` carry only the sizes, so allocate the placeholders once for the batch.
+        # IPU is not happy with zero-sized tensors, so use shape (num_nodes, 1) here
+        fields["x"] = torch.empty((int(node_ptr[-1]), 1))
+        slices["x"] = node_ptr
+        fields["edge_index"] = torch.empty((2, int(edge_ptr[-1])))
+        slices["edge_index"] = edge_ptr
+    if (label_keys is not None) and all("x" in keys for keys in label_keys):
+        fields["x"] = torch.cat([label.x for label in labels])
+        slices["x"] = node_ptr
+    if (label_keys is not None) and all("edge_index" in keys for keys in label_keys):
+        offsets = node_ptr[:-1].tolist()
+        fields["edge_index"] = torch.cat(
+            [label.edge_index + offset for label, offset in zip(labels, offsets)], dim=-1
+        )
+        slices["edge_index"] = edge_ptr
+
+    # Gather the labels of each task as the labeled graphs, the number of rows of each of their labels,
+    # and these rows concatenated, of shape `[sum of the counts, *label_size]`
+    task_values = {}
+    for task, label_size in label_sizes.items():
+        if task.startswith("graph_"):
+            num_entities = np.ones(num_graphs, dtype=np.int64)
+        elif task.startswith("node_"):
+            num_entities = num_nodes
+        else:
+            num_entities = num_edges
+        if store is not None:
+            task_values[task] = _gather_store_labels(
+                labels, store, mol_indices, task, num_entities, label_size
+            )
+        else:
+            graph_idx = [ii for ii, keys in enumerate(label_keys) if task in keys]
+            task_values[task] = _gather_labels(labels, graph_idx, task, num_entities, label_size)
+
+    # The dtype of each task, promoted as if the missing labels were concatenated with the others
+    task_dtypes = {}
+    for task, (graph_idx, _, values) in task_values.items():
+        dtype = None if values is None else values.dtype
+        if (len(graph_idx) < num_graphs) or (dtype is None):
+            default_dtype = labels_dtype_dict.get(task, torch.float32)
+            dtype = default_dtype if dtype is None else torch.promote_types(dtype, default_dtype)
+        task_dtypes[task] = dtype
+
+    # Graph-level labels: one NaN matrix per dtype, filled with a single scatter
+    graph_tasks = [task for task in label_sizes.keys() if task.startswith("graph_")]
+    for dtype in set(task_dtypes[task] for task in graph_tasks):
+        these_tasks = [task for task in graph_tasks if task_dtypes[task] == dtype]
+        widths = [int(np.prod(label_sizes[task], dtype=np.int64)) for task in these_tasks]
+        col_offsets = np.concatenate([[0], np.cumsum(widths)]).astype(np.int64)
+        matrix = torch.full((num_graphs, int(col_offsets[-1])), torch.nan, dtype=dtype)
+
+        rows, cols, values = [], [], []
+        for task, width, col_offset in zip(these_tasks, widths, col_offsets[:-1]):
+            graph_idx, _, task_rows = task_values[task]
+            if task_rows is None:
+                continue
+            rows.append(np.repeat(graph_idx, width))
+            cols.append(np.tile(np.arange(col_offset, col_offset + width, dtype=np.int64), len(graph_idx)))
+            values.append(task_rows.reshape(-1).to(dtype))
+        if len(values) > 0:
+            index = (torch.from_numpy(np.concatenate(rows)), torch.from_numpy(np.concatenate(cols)))
+            matrix.index_put_(index, torch.cat(values))
+
+        for task, width, col_offset in zip(these_tasks, widths, col_offsets[:-1]):
+            fields[task] = matrix[:, col_offset : col_offset + width].view(num_graphs, *label_sizes[task])
+            slices[task] = np.arange(num_graphs + 1)
+
+    # Node and edge-level labels: one NaN tensor per task, filled at the offsets of each graph at once
+    for task in label_sizes.keys():
+        if task.startswith("graph_"):
+            continue
+        ptr = node_ptr if task.startswith("node_") else edge_ptr
+        tensor = torch.full((int(ptr[-1]), *label_sizes[task]), torch.nan, dtype=task_dtypes[task])
+        graph_idx, counts, task_rows = task_values[task]
+        if task_rows is not None:
+            starts = ptr[graph_idx] - (np.cumsum(counts) - counts)
+            index = np.arange(len(task_rows), dtype=np.int64) + np.repeat(starts, counts)
+            tensor.index_put_((torch.from_numpy(index),), task_rows.to(task_dtypes[task]))
+        fields[task] = tensor
+        slices[task] = ptr
+
+    return _make_batch(fields, slices, num_nodes, store_num_nodes=False)
+
+
+def _get_label_store(labels: List[Union[Data, MoleculeLabels]]) -> Optional[LabelStore]:
+    """The `LabelStore` of the labels if they are all views of the same store, otherwise None"""
+    if (len(labels) == 0) or not isinstance(labels[0], MoleculeLabels):
+        return None
+    store = labels[0].store
+    for label in labels:
+        if not isinstance(label, MoleculeLabels) or (label.store is not store) or (label.idx is None):
+            return None
+    return store
+
+
+def _gather_labels(
+    labels: List[Union[Data, MoleculeLabels]],
+    graph_idx: List[int],
+    task: str,
+    num_entities: ndarray,
+    label_size: List[int],
+) -> Tuple[ndarray, ndarray, Optional[Tensor]]:
+    """Gather the labels of a task, reshaping the label of each graph to `[num_entities, *label_size]`"""
+    graph_idx = np.asarray(graph_idx, dtype=np.int64)
+    if len(graph_idx) == 0:
+        return graph_idx, graph_idx, None
+    values = [_reshape_label(labels[ii][task], [int(num_entities[ii])] + label_size) for ii in graph_idx]
+    values = torch.cat([value.reshape(-1, *label_size) for value in values])
+    return graph_idx, num_entities[graph_idx], values
+
+
+def _gather_store_labels(
+    labels: List[MoleculeLabels],
+    store: LabelStore,
+    mol_indices: ndarray,
+    task: str,
+    num_entities: ndarray,
+    label_size: List[int],
+) -> Tuple[ndarray, ndarray, Optional[Tensor]]:
+    """
+    Gather the labels of a task from the columns of the `LabelStore` of the labels, with array indexing.
+    Falls back to reshaping the label of each labeled graph if the rows do not have the expected shape.
+    """
+    if task not in store.mol_indices:
+        return _gather_labels(labels, [], task, num_entities, label_size)
+    graph_idx, counts, rows = store.gather(task, mol_indices)
+    if len(graph_idx) == 0:
+        return graph_idx, counts, None
+    if (rows.shape[1:] != tuple(label_size)) or not np.array_equal(counts, num_entities[graph_idx]):
+        return _gather_labels(labels, graph_idx, task, num_entities, label_size)
+    return graph_idx, counts, torch.from_numpy(rows)
+
+
+def _get_label_graph_size(label: Union[Data, MoleculeLabels], keys: Set[str]) -> Tuple[int, int]:
+    """Number of nodes and edges of the graph of a label, from its placeholders or from the `LabelStore`"""
+    if isinstance(label, MoleculeLabels):
+        return label.num_nodes or 0, label.num_edges or 0
+    num_nodes = label.x.size(0) if "x" in keys else label.num_nodes
+    num_edges = label.edge_index.size(1) if "edge_index" in keys else 0
+    return num_nodes, num_edges
+
+
+def _get_label_size(task: str, label_size: List[int]) -> List[int]:
+    """Get the size of a label for a single graph, node or edge, from the size of the label of a graph"""
+    label_size = list(label_size)
+    if len(label_size) >= 2:
+        return label_size[1:]
+    elif not task.startswith("graph_"):
+        return [1]
+    return label_size
+
+
+def _reshape_label(label: Union[torch.Tensor, ndarray], expected_size: List[int]) -> torch.Tensor:
+    """
+    Reshape the label of a graph to the expected size `[num_entities, *label_size]`, adding
+    the missing entity or target dimension and padding the missing values with NaNs.
+    """
+    label = torch.as_tensor(label)
+    if list(label.shape) == expected_size:
+        return label
+
+    # Ensure explicit task dimension also for single task labels
+    if len(label.shape) == 1:
+        # Distinguish whether target dim or entity dim is missing
+        if expected_size[0] == label.shape[0]:
+            # num graphs/nodes/edges/nodepairs already matching
+            label = label.unsqueeze(1)
+        else:
+            # data lost unless entity dim is supposed to be 1
+            if expected_size[0] == 1:
+                label = label.unsqueeze(0)
+            else:
+                raise ValueError(f"Labels for {expected_size[0]} nodes/edges/nodepairs expected, got 1.")
+
+    return pad_to_expected_label_size(label, expected_size)
 
 
 def pad_nodepairs(pe: torch.Tensor, num_nodes: int, max_num_nodes_per_graph: int):
@@ -13,7 +13,7 @@ Refer to the LICENSE file for the full terms and conditions.
 
 import tempfile
 from contextlib import redirect_stderr, redirect_stdout
-from typing import Type, List, Dict, Union, Any, Callable, Optional, Tuple, Iterable, Literal
+from typing import Type, List, Dict, Union, Any, Callable, Optional, Tuple, Iterable, Literal, Sequence
 from os import PathLike as Path
 
 from dataclasses import dataclass
@@ -25,6 +25,7 @@ import zipfile
 from copy import deepcopy
 import time
 import gc
+import shutil
 
 import platformdirs
 import re
@@ -39,7 +40,9 @@ import numpy as np
 import datamol as dm
 from tqdm import tqdm
 import os.path as osp
-from fastparquet import ParquetFile
+import pyarrow as pa
+import pyarrow.dataset as pa_ds
+import pyarrow.parquet as pq
 
 from sklearn.model_selection import train_test_split
 
@@ -53,20 +56,29 @@ from torch.utils.data import Subset
 from graphium.utils import fs
 from graphium.features import (
     mol_to_graph_dict,
+    mol_to_graph_dict_batch,
     GraphDict,
     mol_to_pyggraph,
+    mol_to_pyggraph_batch,
+    mol_to_graph_signature,
+    PositionalEncodingTransform,
 )
 
-from graphium.data.sampler import DatasetSubSampler
+from graphium.data.sampler import DatasetSubSampler, SizeBucketBatchSampler
 from graphium.data.utils import graphium_package_path, found_size_mismatch
 from graphium.utils.arg_checker import check_arg_iterator
 from graphium.utils.hashing import get_md5_hash
 from graphium.data.smiles_transform import (
     did_featurization_fail,
     BatchingSmilesTransform,
+    GraphStoreSmilesTransform,
     smiles_to_unique_mol_ids,
 )
 from graphium.data.collate import graphium_collate_fn
+from graphium.data.featurization_cache import FeaturizationCache
+from graphium.data.mol_id_index import MolIdIndex
+from graphium.data.graph_store import GraphStore, GraphStoreSequence, GraphStoreWriter, DEFAULT_SHARD_SIZE
+from graphium.data.label_store import LabelStore
 import graphium.data.dataset as Datasets
 from graphium.data.normalization import LabelNormalization
 from graphium.data.multilevel_utils import extract_labels
@@ -101,6 +113,29 @@ PCQM4Mv2_meta.update(
 )
 
 
+def _float_lists_to_float16(column: pa.ChunkedArray) -> np.ndarray:
+    r"""
+    Convert an arrow column of lists of floats to an object array of float16 arrays.
+    Without missing lists, the values of each chunk are converted at once, and the
+    arrays of the column are views of a single buffer.
+    """
+    out = np.empty(len(column), dtype=object)
+    start = 0
+    for chunk in column.chunks:
+        if chunk.null_count > 0:
+            arrays = [
+                None if elem is None else np.asarray(elem, dtype=np.float16) for elem in chunk.to_pylist()
+            ]
+        else:
+            values = chunk.flatten().to_numpy(zero_copy_only=False).astype(np.float16)
+            offsets = chunk.offsets.to_numpy()
+            arrays = np.split(values, offsets[1:-1] - offsets[0])
+        for ii, array in enumerate(arrays):
+            out[start + ii] = array
+        start += len(chunk)
+    return out
+
+
 class BaseDataModule(lightning.LightningDataModule):
     def __init__(
         self,
@@ -331,10 +366,11 @@ class BaseDataModule(lightning.LightningDataModule):
         datafile_type = BaseDataModule._get_data_file_type(path)
 
         if datafile_type == "parquet":
-            # Read the schema of a parquet file
-            file = ParquetFile(path)
-            schema = file.pandas_metadata["columns"]
-            column_names = [s["name"] for s in schema if s["name"] is not None]
+            # Read the schema of a parquet file, without the unnamed index saved by pandas
+            schema = pq.read_schema(path)
+            column_names = [
+                name for name in schema.names if re.fullmatch(r"__index_level_\d+__", name) is None
+            ]
         elif datafile_type == "sdf":
             df = BaseDataModule._read_sdf(path, max_num_mols=5, discard_invalud=True, n_jobs=1)
             column_names = df.columns
@@ -345,9 +381,25 @@ class BaseDataModule(lightning.LightningDataModule):
         return column_names
 
     @staticmethod
-    def _read_parquet(path, **kwargs):
+    def _read_parquet(path: Union[str, List[str]], **kwargs) -> pd.DataFrame:
+        r"""
+        Read one or several parquet files with the same columns into a single dataframe.
+
+        The files are read as a `pyarrow` dataset, such that only the requested columns are read,
+        and the row groups of all the files are decoded in parallel. The table is then converted
+        to pandas column by column, releasing the arrow buffers along the way, and the numeric
+        columns without missing values are not copied.
+
+        Parameters:
+            path: path to the parquet file, or list of paths
+            kwargs: `usecols` or `columns` to select the columns to read. Other keyword arguments
+                are passed to `pyarrow.dataset.Dataset.to_table`, such as `filter`.
+        Returns:
+            pd.DataFrame: the panda dataframe storing molecules
+        """
         kwargs.pop("dtype", None)  # Only useful for csv
-        column_names = BaseDataModule._get_table_columns(path)
+        paths = [str(this_path) for this_path in check_arg_iterator(path, enforce_type=list)]
+        column_names = BaseDataModule._get_table_columns(paths[0])
 
         # Change the 'usecols' parameter to 'columns'
         columns = kwargs.pop("columns", None)
@@ -361,36 +413,25 @@ class BaseDataModule(lightning.LightningDataModule):
                 column in column_names
             ), f"Column `{column}` is not in the parquet file with columns {column_names}"
 
-        # Read the parquet file per column, and convert the data to float16 to reduce memory consumption
-        all_series = {}
-        progress = tqdm(columns)
-        for col in progress:
-            # Read single column
-            progress.set_description(f"Reading parquet column `{col}`")
-            this_series = pd.read_parquet(path, columns=[col], engine="fastparquet", **kwargs)[col]
-
-            # Check if the data is float
-            first_elem = this_series.values[0]
-            is_float = False
-            if isinstance(first_elem, (list, tuple)):
-                is_float = isinstance(first_elem[0], float) or (first_elem[0].dtype.kind == "f")
-            elif isinstance(first_elem, np.ndarray):
-                is_float = isinstance(first_elem, float) or (first_elem.dtype.kind == "f")
-
-            # Convert floats to float16
-            if is_float:
-                if isinstance(first_elem, (np.ndarray, list)):
-                    this_series.update(
-                        pd.Series([np.asarray(elem).astype(np.float16) for elem in this_series])
-                    )
-                else:
-                    this_series = this_series.astype(np.float16)
-
-            all_series[col] = this_series
-            gc.collect()  # Reset memory after each column
-
-        # Merge columns into a dataframe
-        df = pd.concat(all_series, axis=1)
+        # Read only the needed columns, from the row groups of all files in parallel
+        dataset = pa_ds.dataset(paths, format="parquet")
+        table = dataset.to_table(columns=list(columns), use_threads=True, **kwargs)
+
+        # Convert the lists of floats to float16 to reduce memory consumption
+        float16_lists = {}
+        for col in table.column_names:
+            col_type = table.schema.field(col).type
+            is_list = pa.types.is_list(col_type) or pa.types.is_large_list(col_type)
+            if is_list and pa.types.is_floating(col_type.value_type):
+                float16_lists[col] = _float_lists_to_float16(table.column(col))
+        if len(float16_lists) > 0:
+            table = table.select([col for col in table.column_names if col not in float16_lists])
+
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+        del table
+        for col, values in float16_lists.items():
+            df.insert(list(columns).index(col), col, values)
+        gc.collect()
 
         return df
 
@@ -467,6 +508,10 @@ class BaseDataModule(lightning.LightningDataModule):
         if len(files) == 0:
             raise FileNotFoundError(f"No such file or directory `{path}`")
 
+        file_types = [self._get_data_file_type(file) for file in files]
+        if all(file_type == "parquet" for file_type in file_types):
+            return self._read_parquet(sorted(files), **kwargs)
+
         if len(files) > 1:
             files = tqdm(sorted(files), desc=f"Reading files at `{path}`")
         dfs = []
@@ -805,6 +850,15 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         featurization_batch_size: int = 1000,
         collate_fn: Optional[Callable] = None,
         prepare_dict_or_graph: str = "pyg:graph",
+        processed_graph_data_shard_size: int = DEFAULT_SHARD_SIZE,
+        featurization_cache_path: Optional[Union[str, os.PathLike]] = None,
+        mol_id_index_path: Optional[Union[str, os.PathLike]] = None,
+        pos_encoding_on_the_fly: bool = False,
+        pos_encoding_cache_size: int = 0,
+        max_num_nodes_per_batch: Optional[int] = None,
+        max_num_edges_per_batch: Optional[int] = None,
+        batch_sampler_bucket_size: int = 4096,
+        batch_sampler_seed: int = 0,
         **kwargs,
     ):
         """
@@ -847,6 +901,31 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
                   pyg `Data` will be created during data-loading, but faster with large
                   `num_workers`, and less likely to cause memory issues with the parallelization.
                 - "pyg:graph": Process molecules as `pyg.data.Data`.
+            processed_graph_data_shard_size: Number of molecules per shard of the memory-mapped
+                cache written at `processed_graph_data_path`.
+            featurization_cache_path: Path of a persistent cache of featurized molecules, keyed by
+                molecule ID and featurizer signature. Unlike `processed_graph_data_path`, it does not
+                depend on the tasks, labels or splits, and can be shared across experiments, such that
+                only the molecules not yet in the cache are featurized.
+            mol_id_index_path: Path of a persistent index from smiles to their unique molecule ID.
+                It can be shared across experiments and tasks, such that only the smiles not yet
+                in the index are converted to IDs.
+            pos_encoding_on_the_fly: Whether to compute the positional encodings from
+                `featurization["pos_encoding_as_features"]` when loading each molecule in the dataloader
+                workers, instead of computing them during the featurization and caching them.
+                This trades the disk space and preparation time of large nodepair encodings
+                for CPU time during training.
+            pos_encoding_cache_size: With `pos_encoding_on_the_fly`, the number of molecules whose
+                positional encodings are kept in a least-recently-used cache in each dataloader worker.
+            max_num_nodes_per_batch: If set, the batches are formed under a budget of nodes, instead
+                of a fixed number of molecules, with a `SizeBucketBatchSampler`. The batch sizes
+                then become the maximum number of molecules per batch. Not supported on IPU.
+            max_num_edges_per_batch: If set, the batches are formed under a budget of edges,
+                similarly to `max_num_nodes_per_batch`.
+            batch_sampler_bucket_size: With a budget of nodes or edges, the number of shuffled molecules
+                that are sorted by size before being batched, such that molecules of similar sizes
+                are batched together.
+            batch_sampler_seed: With a budget of nodes or edges, the seed of the shuffling.
         """
         BaseDataModule.__init__(
             self,
@@ -882,6 +961,11 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         self.featurization_progress = featurization_progress
         self.featurization_backend = featurization_backend
         self.featurization_batch_size = featurization_batch_size
+        self.processed_graph_data_shard_size = processed_graph_data_shard_size
+        self.max_num_nodes_per_batch = max_num_nodes_per_batch
+        self.max_num_edges_per_batch = max_num_edges_per_batch
+        self.batch_sampler_bucket_size = batch_sampler_bucket_size
+        self.batch_sampler_seed = batch_sampler_seed
 
         self.task_train_indices = None
         self.task_val_indices = None
@@ -905,17 +989,45 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
 
         self.featurization = featurization
 
+        # The positional encodings computed on the fly are not part of the cached featurization
+        featurizer_args = featurization
+        self.pos_encoding_transform = None
+        if pos_encoding_on_the_fly and featurization.get("pos_encoding_as_features", None):
+            featurizer_args = {k: v for k, v in featurization.items() if k != "pos_encoding_as_features"}
+            featurizer_defaults = mol_to_graph_signature(featurizer_args)
+            self.pos_encoding_transform = PositionalEncodingTransform(
+                featurization["pos_encoding_as_features"],
+                dtype=featurizer_defaults["dtype"],
+                mask_nan=featurizer_defaults["mask_nan"],
+                cache_size=pos_encoding_cache_size,
+            )
+
         # Whether to transform the smiles into a pyg `Data` graph or a dictionary compatible with pyg
         if prepare_dict_or_graph == "pyg:dict":
-            self.smiles_transformer = partial(mol_to_graph_dict, **featurization)
+            self.smiles_transformer = partial(mol_to_graph_dict, **featurizer_args)
+            self.smiles_batch_transformer = partial(mol_to_graph_dict_batch, **featurizer_args)
         elif prepare_dict_or_graph == "pyg:graph":
-            self.smiles_transformer = partial(mol_to_pyggraph, **featurization)
+            self.smiles_transformer = partial(mol_to_pyggraph, **featurizer_args)
+            self.smiles_batch_transformer = partial(mol_to_pyggraph_batch, **featurizer_args)
         else:
             raise ValueError(
                 f"`prepare_dict_or_graph` should be either 'pyg:dict' or 'pyg:graph', Provided: `{prepare_dict_or_graph}`"
             )
         self.data_hash = self.get_data_hash()
 
+        self.featurization_cache = None
+        if featurization_cache_path is not None:
+            self.featurization_cache = FeaturizationCache(
+                featurization_cache_path,
+                featurizer_args=featurizer_args,
+                output_type=prepare_dict_or_graph,
+                shard_size=processed_graph_data_shard_size,
+            )
+
+        self.mol_id_index = None
+        if mol_id_index_path is not None:
+            self.mol_id_index = MolIdIndex(mol_id_index_path)
+
         if self.processed_graph_data_path is not None:
             if self._ready_to_load_all_from_file():
                 self._data_is_prepared = True
@@ -1069,15 +1181,17 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
             n_jobs=self.featurization_n_jobs,
             featurization_batch_size=self.featurization_batch_size,
             backend=self.featurization_backend,
+            mol_id_index=self.mol_id_index,
         )
         _, unique_ids_idx, unique_ids_inv = np.unique(
             all_unique_mol_ids, return_index=True, return_inverse=True
         )
 
         smiles_to_featurize = [all_smiles[ii] for ii in unique_ids_idx]
+        mol_ids_to_featurize = [all_unique_mol_ids[ii] for ii in unique_ids_idx]
 
         # Convert SMILES to features
-        features, _ = self._featurize_molecules(smiles_to_featurize)
+        features, _ = self._featurize_molecules(smiles_to_featurize, mol_ids=mol_ids_to_featurize)
 
         # Store the features (including Nones, which will be filtered in the next step)
         for task in task_dataset_args.keys():
@@ -1157,6 +1271,8 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         if self.processed_graph_data_path is not None:
             self._save_data_to_files(save_smiles_and_ids)
             self._data_is_cached = True
+            # The featurized unique molecules are now saved in the stores of each stage
+            shutil.rmtree(self._path_to_featurized_store(), ignore_errors=True)
 
         self._data_is_prepared = True
 
@@ -1260,6 +1376,8 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
             data_path=self._path_to_load_from_file(stage) if processed_graph_data_path else None,
             dataloading_from=dataloading_from,
             data_is_cached=self._data_is_cached,
+            pos_encoding_transform=self.pos_encoding_transform,
+            mol_id_index=self.mol_id_index,
         )  # type: ignore
 
         # calculate statistics for the train split and used for all splits normalization
@@ -1297,6 +1415,10 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         """
         can_load_from_file = osp.exists(path) and self.get_folder_size(path) > 0
 
+        # A graph store that was only partially written must be resumed by `prepare_data`
+        if can_load_from_file and GraphStoreWriter.is_partial(path):
+            can_load_from_file = False
+
         return can_load_from_file
 
     def _save_data_to_files(self, save_smiles_and_ids: bool = False) -> None:
@@ -1333,6 +1455,8 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
     def calculate_statistics(self, dataset: Datasets.MultitaskDataset, train: bool = False):
         """
         Calculate the statistics of the labels for each task, and overwrites the `self.task_norms` attribute.
+        The statistics are reduced over the label arrays of the `LabelStore` at once, or streamed over the
+        shards of the `GraphStore` when the labels are only on disk.
 
         Parameters:
             dataset: the dataset to calculate the statistics from
@@ -1342,6 +1466,15 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
 
         if self.task_norms and train:
             for task in dataset.labels_size.keys():
+                if isinstance(dataset.labels, LabelStore):
+                    if task in dataset.labels.values:
+                        self.task_norms[task].calculate_statistics(dataset.labels.get_task_values(task))
+                    continue
+                if (dataset.labels is None) and (dataset.graph_store is not None):
+                    chunks = dataset.graph_store.iter_task_labels(task)
+                    self.task_norms[task].calculate_statistics_from_chunks(chunks)
+                    continue
+
                 # if the label type is graph_*, we need to stack them as the tensor shape is (num_labels, )
                 if task.startswith("graph"):
                     labels = np.stack(
@@ -1391,6 +1524,7 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
     def normalize_label(self, dataset: Datasets.MultitaskDataset, stage) -> Datasets.MultitaskDataset:
         """
         Normalize the labels in the dataset using the statistics in `self.task_norms`.
+        The labels of a `LabelStore` are normalized and written back with a single array operation per task.
 
         Parameters:
             dataset: the dataset to normalize the labels from
@@ -1401,6 +1535,11 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         for task in dataset.labels_size.keys():
             # we normalize the dataset if (it is train split) or (it is val/test splits and normalize_val_test is set to true)
             if (stage == "train") or (stage in ["val", "test"] and self.task_norms[task].normalize_val_test):
+                if isinstance(dataset.labels, LabelStore):
+                    if task in dataset.labels.values:
+                        values = self.task_norms[task].normalize(dataset.labels.get_task_values(task))
+                        dataset.labels.set_task_values(task, values)
+                    continue
                 for i in range(len(dataset)):
                     if task in dataset[i]["labels"]:
                         dataset[i]["labels"][task] = self.task_norms[task].normalize(
@@ -1409,26 +1548,29 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         return dataset
 
     def save_featurized_data(self, dataset: Datasets.MultitaskDataset, processed_data_path):
-        os.makedirs(processed_data_path)  # In case the len(dataset) is 0
-        for i in range(0, len(dataset), 1000):
-            os.makedirs(os.path.join(processed_data_path, format(i // 1000, "04d")), exist_ok=True)
-        process_params = [(index, datum, processed_data_path) for index, datum in enumerate(dataset)]
+        """
+        Save the featurized graphs and labels of a dataset in a sharded, memory-mapped `GraphStore`.
+        The shards are written in parallel with `featurization_n_jobs`, and the shards completed
+        by a previous interrupted run are not written again.
+
+        Parameters:
+            dataset: the dataset to save
+            processed_data_path: the folder in which to save the data
+        """
+        writer = GraphStoreWriter(processed_data_path, shard_size=self.processed_graph_data_shard_size)
 
         # Check if "about" is in the Dataset object
         about = ""
         if hasattr(dataset, "about"):
             about = dataset.about
-        for param in tqdm(process_params, desc=f"Saving featurized data {about}"):
-            self.process_func(param)
-        return
-
-    def process_func(self, param):
-        index, datum, folder = param
-        filename = os.path.join(folder, format(index // 1000, "04d"), format(index, "07d") + ".pkl")
-        torch.save(
-            {"graph_with_features": datum["features"], "labels": datum["labels"]},
-            filename,
-            pickle_protocol=4,
+        writer.write(
+            features=dataset.features,
+            labels=dataset.labels,
+            n_jobs=self.featurization_n_jobs,
+            backend=self.featurization_backend,
+            resume=True,
+            progress=True,
+            tqdm_kwargs={"desc": f"Saving featurized data {about}"},
         )
         return
 
@@ -1483,24 +1625,73 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
             The poptorch dataloader to sample from
         """
         kwargs = self.get_dataloader_kwargs(stage=stage, shuffle=shuffle)
+        is_ipu = ("ipu_options" in kwargs.keys()) and (kwargs.get("ipu_options") is not None)
+        # Not used for the predictions, since Lightning rebuilds their batch sampler to track the indices
+        use_batch_sampler = (
+            (self.max_num_nodes_per_batch is not None) or (self.max_num_edges_per_batch is not None)
+        ) and (stage != RunningStage.PREDICTING)
+        num_replicas, rank = self._get_distributed_replicas()
+
         sampler = None
         # use sampler only when sampler_task_dict is set in the config and during training
         if DatasetSubSampler.check_sampling_required(self.sampler_task_dict) and stage in [
             RunningStage.TRAINING
         ]:
+            # With the batch sampler, the batches are split across the processes instead of the indices
+            split_indices = not (is_ipu or use_batch_sampler)
             sampler = DatasetSubSampler(
-                dataset, self.sampler_task_dict, self.processed_graph_data_path, self.data_hash
+                dataset,
+                self.sampler_task_dict,
+                shuffle=shuffle,
+                num_replicas=num_replicas if split_indices else None,
+                rank=rank if split_indices else None,
             )
             # turn shuffle off when sampler is used as sampler option is mutually exclusive with shuffle
             kwargs["shuffle"] = False
-        is_ipu = ("ipu_options" in kwargs.keys()) and (kwargs.get("ipu_options") is not None)
         if is_ipu:
+            if use_batch_sampler:
+                logger.warning("The budget of nodes and edges per batch is ignored on IPU.")
             loader = IPUDataModuleModifier._dataloader(self, dataset=dataset, sampler=sampler, **kwargs)
+        elif use_batch_sampler:
+            # The batch sampler replaces the batch size, shuffling and sampler options of the dataloader,
+            # and splits the batches across the processes of the distributed training
+            if (sampler is not None) and (num_replicas is not None) and self._lightning_injects_sampler():
+                raise ValueError(
+                    "Lightning replaces the sampler of the tasks by its own distributed sampler when "
+                    "rebuilding the batch sampler. Set `use_distributed_sampler=False` in the trainer, "
+                    "the batches are split across the processes by the datamodule."
+                )
+            batch_sampler = SizeBucketBatchSampler(
+                num_nodes=dataset.num_nodes_list,
+                num_edges=dataset.num_edges_list,
+                max_num_nodes=self.max_num_nodes_per_batch,
+                max_num_edges=self.max_num_edges_per_batch,
+                max_batch_size=kwargs.pop("batch_size"),
+                shuffle=shuffle,
+                bucket_size=self.batch_sampler_bucket_size,
+                seed=self.batch_sampler_seed,
+                sampler=sampler,
+                num_replicas=num_replicas,
+                rank=rank,
+            )
+            kwargs.pop("shuffle")
+            loader = BaseDataModule._dataloader(self, dataset=dataset, batch_sampler=batch_sampler, **kwargs)
         else:
             loader = BaseDataModule._dataloader(self, dataset=dataset, sampler=sampler, **kwargs)
 
         return loader
 
+    def _get_distributed_replicas(self) -> Tuple[Optional[int], Optional[int]]:
+        """The number of processes and the rank of the current one, or `None` if not distributed"""
+        if (self.trainer is None) or (self.trainer.world_size <= 1):
+            return None, None
+        return self.trainer.world_size, self.trainer.global_rank
+
+    def _lightning_injects_sampler(self) -> bool:
+        """Whether Lightning replaces the samplers of the dataloaders by distributed samplers"""
+        connector = getattr(self.trainer, "_accelerator_connector", None)
+        return bool(getattr(connector, "use_distributed_sampler", False))
+
     def get_collate_fn(self, collate_fn):
         if collate_fn is None:
             # Some values become `inf` when changing data type. `mask_nan` deals with that
@@ -1514,7 +1705,9 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         return collate_fn
 
     # Cannot be used as is for the multitask version, because sample_idx does not apply.
-    def _featurize_molecules(self, smiles: Iterable[str]) -> Tuple[List, List]:
+    def _featurize_molecules(
+        self, smiles: Iterable[str], mol_ids: Optional[Iterable[str]] = None
+    ) -> Tuple[List, List]:
         """
         Precompute the features (graphs, fingerprints, etc.) from the SMILES.
         Features are computed from `self.smiles_transformer`.
@@ -1524,18 +1717,66 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
             (hadim): in case of very large dataset we could:
             - or cache the data and read from it during `next(iter(dataloader))`
             - or compute the features on-the-fly during `next(iter(dataloader))`
-            For now we compute in advance and hold everything in memory.
+            If `processed_graph_data_path` is provided, the features are streamed shard by shard
+            into a memory-mapped `GraphStore`, and are never all held in memory.
 
         Parameters:
             smiles: A list of all the molecular SMILES to featurize
-            sample_idx: The indexes corresponding to the sampled SMILES.
-                If not provided, computed from `numpy.arange`.
+            mol_ids: The unique ID of each molecule. If provided along with `featurization_cache_path`,
+                the molecules found in the featurization cache are not featurized again,
+                and the newly featurized molecules are written by the workers into a new segment
+                of the cache. The features are then a lazy view of the cache.
 
         Returns:
             features: A list of all the featurized molecules
             idx_none: A list of the indexes that failed featurization
         """
 
+        if (self.featurization_cache is not None) and (mol_ids is not None):
+            mol_ids = list(mol_ids)
+            features, idx_missing = self.featurization_cache.lookup(mol_ids)
+            logger.info(
+                f"Found {len(smiles) - len(idx_missing)} / {len(smiles)} molecules in the featurization cache"
+            )
+            if len(idx_missing) > 0:
+                writer = self.featurization_cache.segment_writer()
+                self._featurize_molecules_to_store([smiles[idx] for idx in idx_missing], writer)
+                missing_ids = [mol_ids[idx] for idx in idx_missing]
+                segment_path = self.featurization_cache.add_segment(writer, missing_ids)
+                features.set_segment(idx_missing, segment_path, np.arange(len(idx_missing)))
+            idx_none = features.idx_none
+        else:
+            features = self._compute_features(smiles)
+            if isinstance(features, GraphStoreSequence):
+                idx_none = features.idx_none
+            else:
+                idx_none = [ii for ii, feat in enumerate(features) if did_featurization_fail(feat)]
+
+        # Warn about None molecules
+        if len(idx_none) > 0:
+            mols_to_msg = [
+                f"idx={idx} - smiles={smiles[idx]} - Error_msg[:-200]=\n{str(features[idx])[:-200]}"
+                for idx in idx_none
+            ]
+            msg = "\n".join(mols_to_msg)
+            logger.warning(
+                (f"{len(idx_none)} molecules will be removed since they failed featurization:\n" + msg)
+            )
+
+        return features, idx_none
+
+    def _compute_features(self, smiles: List[str]) -> Sequence:
+        """
+        Featurize the SMILES with `self.smiles_batch_transformer`, either in memory or,
+        if `processed_graph_data_path` is provided, streamed into a memory-mapped `GraphStore`.
+        Failed molecules are given by their error message.
+        """
+        if self.processed_graph_data_path is not None:
+            writer = GraphStoreWriter(
+                self._path_to_featurized_store(), shard_size=self.processed_graph_data_shard_size
+            )
+            return self._featurize_molecules_to_store(smiles, writer)
+
         batch_size = BatchingSmilesTransform.parse_batch_size(
             numel=len(smiles),
             desired_batch_size=self.featurization_batch_size,
@@ -1544,7 +1785,7 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
 
         # Loop all the smiles and compute the features
         features = dm.parallelized_with_batches(
-            BatchingSmilesTransform(self.smiles_transformer),
+            BatchingSmilesTransform(self.smiles_transformer, self.smiles_batch_transformer),
             smiles,
             batch_size=batch_size,
             progress=True,
@@ -1552,20 +1793,51 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
             backend=self.featurization_backend,
             tqdm_kwargs={"desc": f"featurizing_smiles, batch={batch_size}"},
         )
+        return features
 
-        # Warn about None molecules
-        idx_none = [ii for ii, feat in enumerate(features) if did_featurization_fail(feat)]
-        if len(idx_none) > 0:
-            mols_to_msg = [
-                f"idx={idx} - smiles={smiles[idx]} - Error_msg[:-200]=\n{str(features[idx])[:-200]}"
-                for idx in idx_none
-            ]
-            msg = "\n".join(mols_to_msg)
-            logger.warning(
-                (f"{len(idx_none)} molecules will be removed since they failed featurization:\n" + msg)
-            )
+    def _featurize_molecules_to_store(
+        self, smiles: List[str], writer: GraphStoreWriter
+    ) -> GraphStoreSequence:
+        """
+        Featurize the SMILES shard by shard, with each worker writing its shard of graphs
+        directly to a memory-mapped `GraphStore`. Only a few shards are in flight at once,
+        so the memory used depends on the shard size of the writer and not on the number
+        of molecules. The shards completed by a previous interrupted run are not featurized again.
 
-        return features, idx_none
+        Parameters:
+            smiles: A list of all the molecular SMILES to featurize
+            writer: The writer of the store, e.g. of a new segment of the featurization cache
+
+        Returns:
+            features: The featurized molecules, with the error message of the ones that failed featurization
+        """
+        completed = writer.start(len(smiles), resume=True)
+        shard_params = []
+        for shard_idx in range(writer.num_shards(len(smiles))):
+            if shard_idx not in completed:
+                start = shard_idx * writer.shard_size
+                shard_params.append((shard_idx, smiles[start : start + writer.shard_size]))
+
+        writer.write_shards(
+            shard_params,
+            completed,
+            n_jobs=self.featurization_n_jobs,
+            backend=self.featurization_backend,
+            progress=True,
+            tqdm_kwargs={"desc": f"featurizing_smiles, shard={writer.shard_size}"},
+            write_fn=GraphStoreSmilesTransform(
+                self.smiles_transformer, writer, batch_transform=self.smiles_batch_transformer
+            ),
+        )
+        return GraphStoreSequence(GraphStore(writer.path))
+
+    def _path_to_featurized_store(self) -> Optional[str]:
+        """
+        Get the path of the temporary store of the featurized unique molecules
+        """
+        if self.processed_graph_data_path is None:
+            return None
+        return osp.join(self.processed_graph_data_path, f"featurized_{self.data_hash}")
 
     @staticmethod
     def _filter_none_molecules(
@@ -1731,6 +2003,8 @@ class MultitaskFromSmilesDataModule(BaseDataModule, IPUDataModuleModifier):
         trans.keywords.setdefault("on_error", "raise")
         trans.keywords.setdefault("mask_nan", 0.0)
         graph = trans(smiles)
+        if self.pos_encoding_transform is not None:
+            graph = self.pos_encoding_transform(graph)
         return graph
 
     ########################## Private methods ######################################
@@ -2672,6 +2946,7 @@ class FakeDataModule(MultitaskFromSmilesDataModule):
             n_jobs=self.featurization_n_jobs,
             featurization_batch_size=self.featurization_batch_size,
             backend=self.featurization_backend,
+            mol_id_index=self.mol_id_index,
         )
         # Convert SMILES to features
         features, _ = self._featurize_molecules(all_smiles)
@@ -2764,4 +3039,6 @@ class FakeDataModule(MultitaskFromSmilesDataModule):
             num_edges = graph.num_edges
             if (graph is not None) and (num_edges > 0) and (num_nodes > 0):
                 break
+        if (graph is not None) and (self.pos_encoding_transform is not None):
+            graph = self.pos_encoding_transform(graph)
         return graph
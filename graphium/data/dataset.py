@@ -12,22 +12,29 @@ Refer to the LICENSE file for the full terms and conditions.
 """
 
 import os
-from copy import deepcopy
+from copy import copy, deepcopy
 from functools import lru_cache
 from multiprocessing import Manager
-from typing import Any, Dict, List, Optional, Tuple, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import fsspec
 import numpy as np
 import torch
 from datamol import parallelized, parallelized_with_batches
 from loguru import logger
+from torch.utils.data import Subset
 from torch.utils.data.dataloader import Dataset
 from torch_geometric.data import Batch, Data
 
+from graphium.data.graph_store import GraphStore, _counts_to_offsets
+from graphium.data.label_store import LabelStore
+from graphium.data.mol_id_index import MolIdIndex
+from graphium.data.utils import get_keys
 from graphium.data.smiles_transform import smiles_to_unique_mol_ids
 from graphium.features import GraphDict
 
+TASK_INDICES_FILE = "task_indices.npz"
+
 
 class SingleTaskDataset(Dataset):
     def __init__(
@@ -161,6 +168,8 @@ class MultitaskDataset(Dataset):
         data_path: Optional[Union[str, os.PathLike]] = None,
         dataloading_from: str = "ram",
         data_is_cached: bool = False,
+        pos_encoding_transform: Optional[Callable] = None,
+        mol_id_index: Optional[MolIdIndex] = None,
     ):
         r"""
         This class holds the information for the multitask dataset.
@@ -168,9 +177,10 @@ class MultitaskDataset(Dataset):
         we will have a multitask dataset of the following form:
         - self.mol_ids will be a list to contain the unique molecular IDs to identify the molecules
         - self.smiles will be a list to contain the corresponding smiles for that molecular ID across all single-task datasets
-        - self.labels will be a list of dictionaries where the key is the task name and the value is the label(s) for that task.
-            At this point, any particular molecule will only have entries for tasks for which it has a label. Later, in the collate
-            function, we fill up the missing task labels with NaNs.
+        - self.labels will be a columnar `LabelStore`, giving for each molecule a dictionary-like view where
+            the key is the task name and the value is the label(s) for that task. At this point, any
+            particular molecule will only have entries for tasks for which it has a label. Later, in the
+            collate function, we fill up the missing task labels with NaNs.
         - self.features will be a list of featurized graphs corresponding to that particular unique molecule.
             However, for testing purposes we may not require features so that we can make sure that this merge function works.
 
@@ -185,6 +195,12 @@ class MultitaskDataset(Dataset):
             data_path: The location of the data if saved on disk
             dataloading_from: Whether to load the data from `"disk"` or `"ram"`
             data_is_cached: Whether the data is already cached on `"disk"`
+            pos_encoding_transform: An optional transform adding the positional encodings to the features
+                of a molecule when it is loaded, called with the features and the index of the molecule.
+                See `graphium.features.PositionalEncodingTransform`. It is copied, such that its cache
+                is keyed by the indices of this dataset only.
+            mol_id_index: Optional persistent index of the molecule IDs of the smiles, used when
+                the single-task datasets do not provide their `unique_ids`
         """
         super().__init__()
         self.n_jobs = n_jobs
@@ -195,6 +211,10 @@ class MultitaskDataset(Dataset):
         self.save_smiles_and_ids = save_smiles_and_ids
         self.data_path = data_path
         self.dataloading_from = dataloading_from
+        self.pos_encoding_transform = copy(pos_encoding_transform)
+        self.mol_id_index = mol_id_index
+        self._graph_store = None
+        self._task_indices = None
 
         logger.info(f"Dataloading from {dataloading_from.upper()}")
 
@@ -227,12 +247,20 @@ class MultitaskDataset(Dataset):
             if self.features is not None:
                 self._num_nodes_list = get_num_nodes_per_graph(self.features)
                 self._num_edges_list = get_num_edges_per_graph(self.features)
+                self.labels.set_graph_sizes(self._num_nodes_list, self._num_edges_list)
 
     def transfer_from_disk_to_ram(self, parallel_with_batches: bool = False):
         """
         Function parallelizing transfer from DISK to RAM
         """
 
+        if self.data_path is not None and GraphStore.exists(self.data_path):
+            # Load the full arrays of the store in memory. Each graph is a view on these arrays.
+            store = GraphStore(self.data_path, mmap_mode=None)
+            self.features = [store.get_features(idx) for idx in range(self.dataset_length)]
+            self.labels = store.label_store
+            return
+
         def transfer_mol_from_disk_to_ram(idx):
             """
             Function transferring single mol from DISK to RAM
@@ -287,6 +315,20 @@ class MultitaskDataset(Dataset):
 
         torch.save(attrs, path, pickle_protocol=4)
 
+        # Saved by the process preparing the data, instead of by each process building a sampler
+        task_indices = self.get_task_indices()
+        if not os.path.isfile(os.path.join(directory, TASK_INDICES_FILE)):
+            self._save_task_indices(directory, task_indices)
+
+    @staticmethod
+    def _save_task_indices(directory: str, task_indices: Dict[str, np.ndarray]) -> None:
+        """Save the indices of the labeled molecules of each task, atomically to never be read partially"""
+        path = os.path.join(directory, TASK_INDICES_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **task_indices)
+        os.replace(tmp_path, path)
+
     def _load_metadata(self):
         """
         Load everything other than features/labels
@@ -459,16 +501,85 @@ class MultitaskDataset(Dataset):
             if self.features is not None:
                 datum["features"] = self.features[idx]
 
+        if (self.pos_encoding_transform is not None) and ("features" in datum):
+            datum["features"] = self.pos_encoding_transform(datum["features"], key=idx)
+
         return datum
 
+    @property
+    def graph_store(self) -> Optional[GraphStore]:
+        """
+        The memory-mapped store of the cached graphs and labels, opened lazily in each process.
+        `None` if the cache was written in the legacy format with one pickle file per molecule.
+        """
+        if (self._graph_store is None) and (self.data_path is not None) and GraphStore.exists(self.data_path):
+            self._graph_store = GraphStore(self.data_path)
+        return self._graph_store
+
+    def get_task_indices(self) -> Dict[str, np.ndarray]:
+        r"""
+        The indices of the molecules that have a label for each task.
+        They are computed once from the labels, without loading the features, and saved
+        in `task_indices.npz` next to the metadata when the dataset is saved on disk.
+
+        Returns:
+            A dictionary with the task as key and the sorted indices of its labeled molecules as value
+        """
+        if self._task_indices is not None:
+            return self._task_indices
+
+        cache_path = None
+        if (self.data_path is not None) and os.path.isdir(self.data_path):
+            cache_path = os.path.join(self.data_path, TASK_INDICES_FILE)
+            if os.path.isfile(cache_path):
+                with np.load(cache_path, allow_pickle=False) as cached:
+                    self._task_indices = {task: cached[task] for task in cached.files}
+                return self._task_indices
+
+        tasks = list(self.labels_size.keys())
+        if isinstance(self.labels, LabelStore):
+            task_indices = self.labels.get_labeled_indices()
+            task_indices = {task: task_indices.get(task, np.zeros(0, dtype=np.int64)) for task in tasks}
+        elif (self.labels is None) and (self.graph_store is not None):
+            task_indices = self.graph_store.get_labeled_indices()
+            task_indices = {task: task_indices.get(task, np.zeros(0, dtype=np.int64)) for task in tasks}
+        else:
+            if self.labels is not None:
+                labels = self.labels
+            else:
+                # Legacy cache with one pickle file per molecule
+                labels = (self.load_graph_from_index(idx)["labels"] for idx in range(len(self)))
+            task_indices = {task: [] for task in tasks}
+            for idx, label in enumerate(labels):
+                for task in get_keys(label):
+                    if task in task_indices:
+                        task_indices[task].append(idx)
+            task_indices = {task: np.asarray(ids, dtype=np.int64) for task, ids in task_indices.items()}
+
+        if cache_path is not None:
+            # Only for the data saved before the task indices were saved with the metadata
+            self._save_task_indices(self.data_path, task_indices)
+        self._task_indices = task_indices
+        return self._task_indices
+
+    def __getstate__(self):
+        """Serialize the class for pickling, without the memory-mapped arrays."""
+        state = self.__dict__.copy()
+        state["_graph_store"] = None
+        return state
+
     def load_graph_from_index(self, data_idx):
         r"""
-        load the graph (in pickle file) from the disk
+        load the graph from the memory-mapped store on disk,
+        or from a pickle file if the cache was written in the legacy format.
         Parameters:
             data_idx: The index of the data to retrieve
         Returns:
             A dictionary containing the data for the specified index with keys "graph_with_features", "labels" and "smiles" (optional).
         """
+        if self.graph_store is not None:
+            return self.graph_store[data_idx]
+
         filename = os.path.join(
             self.data_path, format(data_idx // 1000, "04d"), format(data_idx, "07d") + ".pkl"
         )
@@ -478,71 +589,74 @@ class MultitaskDataset(Dataset):
 
     def merge(
         self, datasets: Dict[str, SingleTaskDataset]
-    ) -> Tuple[List[str], List[str], List[Dict[str, Any]], List[Any]]:
+    ) -> Tuple[List[str], List[str], LabelStore, List[Any]]:
         r"""This function merges several single task datasets into a multitask dataset.
 
         The idea: for each of the smiles, labels, features and tasks, we create a corresponding list that concatenates these items across all tasks.
+        The fields of each single-task dataset are read as whole columns, rather than element by element.
         In particular, for any index, the elements in the smiles, labels, features and task lists at that index will correspond to each other (i.e. match up).
         Over this list of all smiles (which we created by concatenating the smiles across all tasks), we compute their molecular ID using functions from Datamol.
         Once again, we will have a list of molecular IDs which is the same size as the list of smiles, labels, features and tasks.
         We then use numpy's `unique` function to find the exact list of unique molecular IDs as these will identify the molecules in our dataset. We also get the
         inverse from numpy's `unique`, which will allow us to index in addition to the list of all molecular IDs, the list of all smiles, labels, features and tasks.
-        Finally, we use this inverse to construct the list of list of smiles, list of label dictionaries (indexed by task) and the list of features such that
+        Finally, we use this inverse to construct the list of list of smiles, the label store (indexed by task) and the list of features such that
         the indices match up. This is what is needed for the `get_item` function to work.
+        The number of nodes and edges of the label store are set from the features, once they are known.
 
         Parameters:
             datasets: A dictionary of single-task datasets
         Returns:
-            A tuple of (list of molecular IDs, list of smiles, list of label dictionaries, list of features)
+            A tuple of (list of molecular IDs, list of smiles, label store, list of features)
         """
 
         # Get all the smiles, labels, features and tasks.
         all_lists = self._get_all_lists_ids(datasets=datasets)
         mol_ids, inv = self._get_inv_of_mol_ids(all_mol_ids=all_lists["mol_ids"])
+        inv = np.asarray(inv, dtype=np.int64)
+
+        # Group the entries of each molecule with a stable sort, such that they keep their order
+        order = np.argsort(inv, kind="stable")
+        offsets = _counts_to_offsets(np.bincount(inv, minlength=len(mol_ids)))
 
         # Store the smiles.
-        smiles = [[] for _ in range(len(mol_ids))]
-        for all_idx, unique_idx in enumerate(inv):
-            smiles[unique_idx].append(all_lists["smiles"][all_idx])
-
-        # Store the labels.
-        labels = [Data() for _ in range(len(mol_ids))]
-        for all_idx, unique_idx in enumerate(inv):
-            task: str = all_lists["tasks"][all_idx]
-            label = all_lists["labels"][all_idx]
-            labels[unique_idx][task] = label
-
-            if all_idx < len(all_lists["features"]):
-                features = all_lists["features"][all_idx]
-                labels[unique_idx]["x"] = torch.empty(
-                    (features.num_nodes, 1)
-                )  # IPU is not happy with zero-sized tensors, so use shape (features.num_nodes, 1) here
-                labels[unique_idx]["edge_index"] = torch.empty((2, features.num_edges))
-
-        # Store the features
+        sorted_smiles = np.asarray(all_lists["smiles"], dtype=object)[order].tolist()
+        smiles = [sorted_smiles[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+
+        # Store the labels, with one array of values per task instead of one `Data` per molecule.
+        columns = {
+            task: (inv[start:end], all_lists["labels"][task])
+            for task, (start, end) in all_lists["task_slices"].items()
+        }
+        labels = LabelStore.from_columns(len(mol_ids), columns)
+
+        # Store the features of the last entry of each molecule
         if len(all_lists["features"]) > 0:
-            features = [-1 for i in range(len(mol_ids))]
-            for all_idx, unique_idx in enumerate(inv):
-                features[unique_idx] = all_lists["features"][all_idx]
+            features = [all_lists["features"][all_idx] for all_idx in order[offsets[1:] - 1].tolist()]
             return mol_ids, smiles, labels, features
         else:
             return mol_ids, smiles, labels
 
     def _get_all_lists_ids(self, datasets: Dict[str, SingleTaskDataset]) -> Dict[str, Any]:
+        r"""
+        Concatenate the smiles, features and molecular IDs of all the single-task datasets.
+        The labels are kept as one column per task, with the slice of the concatenated lists of each task
+        under `"task_slices"`.
+        """
         all_smiles = []
         all_features = []
-        all_labels = []
+        all_labels = {}
         all_mol_ids = []
-        all_tasks = []
+        task_slices = {}
 
         for task, ds in datasets.items():
             if len(ds) == 0:
                 continue
             # Get data from single task dataset
-            ds_smiles = [ds[i]["smiles"] for i in range(len(ds))]
-            ds_labels = [ds[i]["labels"] for i in range(len(ds))]
-            if "unique_ids" in ds[0].keys():
-                ds_mol_ids = [ds[i]["unique_ids"] for i in range(len(ds))]
+            ds_columns = _get_dataset_columns(ds)
+            ds_smiles = ds_columns["smiles"]
+            ds_labels = ds_columns["labels"]
+            if ds_columns.get("unique_ids", None) is not None:
+                ds_mol_ids = ds_columns["unique_ids"]
             else:
                 ds_mol_ids = smiles_to_unique_mol_ids(
                     ds_smiles,
@@ -551,26 +665,22 @@ class MultitaskDataset(Dataset):
                     backend=self.backend,
                     progress=self.progress,
                     progress_desc=f"{task}: mol to ids",
+                    mol_id_index=self.mol_id_index,
                 )
-            if "features" in ds[0]:
-                ds_features = [ds[i]["features"] for i in range(len(ds))]
-            else:
-                ds_features = None
+            ds_features = ds_columns.get("features", None)
+            task_slices[task] = (len(all_smiles), len(all_smiles) + len(ds_smiles))
             all_smiles.extend(ds_smiles)
-            all_labels.extend(ds_labels)
+            all_labels[task] = ds_labels
             all_mol_ids.extend(ds_mol_ids)
             if ds_features is not None:
                 all_features.extend(ds_features)
 
-            task_list = [task] * ds.__len__()
-            all_tasks.extend(task_list)
-
         all_lists = {
             "smiles": all_smiles,
             "features": all_features,
             "labels": all_labels,
             "mol_ids": all_mol_ids,
-            "tasks": all_tasks,
+            "task_slices": task_slices,
         }
 
         return all_lists
@@ -708,6 +818,11 @@ class FakeDataset(MultitaskDataset):
                     self.mol_ids, self.smiles, self.labels
                 )
 
+        if self.features is not None:
+            self.labels.set_graph_sizes(
+                get_num_nodes_per_graph(self.features), get_num_edges_per_graph(self.features)
+            )
+
         self.labels_size = self.set_label_size_dict(datasets)
         self.labels_dtype = self.set_label_dtype_dict(datasets)
         self.features = self.features
@@ -735,15 +850,21 @@ class FakeDataset(MultitaskDataset):
         logger.info("Duplicating the single dataset element...")
         mol_ids = [deepcopy(mol_ids[0]) for _ in range(self.num_mols)]
         logger.info("Finished `mol_ids`")
-        labels = [deepcopy(labels[0]) for _ in range(self.num_mols)]
+        labels = self._repeat_first_elem(labels)
         logger.info("Finished `labels`")
-        smiles = [deepcopy(smiles[0]) for _ in range(self.num_mols)]
+        smiles = self._repeat_first_elem(smiles)
         logger.info("Finished `smiles`")
         if features is not None:
             features = [deepcopy(features[0]) for _ in range(self.num_mols)]
             logger.info("Finished `features`")
         return mol_ids, labels, smiles, features
 
+    def _repeat_first_elem(self, items: Union[List[Any], LabelStore]) -> Union[List[Any], LabelStore]:
+        """Repeat the first element `num_mols` times, with the labels of a `LabelStore` copied column-wise"""
+        if isinstance(items, LabelStore):
+            return items.take(np.zeros(self.num_mols, dtype=np.int64))
+        return [deepcopy(items[0]) for _ in range(self.num_mols)]
+
     def __len__(self):
         r"""
         Returns the number of molecules
@@ -771,6 +892,45 @@ class FakeDataset(MultitaskDataset):
         return datum
 
 
+def _get_dataset_columns(dataset: Union[SingleTaskDataset, Subset]) -> Dict[str, Any]:
+    r"""
+    Read the fields of a single-task dataset, or of a (nested) `Subset` of it, as whole columns.
+    Stacked arrays are indexed at once, and the smiles are fetched from the `Manager` in a single call,
+    instead of calling `dataset[i]` for every element and every field.
+
+    Parameters:
+        dataset: The single-task dataset
+
+    Returns:
+        columns: The non-missing fields among `"smiles"`, `"labels"`, `"unique_ids"` and `"features"`
+    """
+    indices = None
+    while isinstance(dataset, Subset):
+        subset_indices = np.asarray(dataset.indices, dtype=np.int64)
+        indices = subset_indices if indices is None else subset_indices[indices]
+        dataset = dataset.dataset
+
+    if not isinstance(dataset, SingleTaskDataset):
+        # Unknown dataset, read element by element
+        elements = [dataset[ii] for ii in (range(len(dataset)) if indices is None else indices.tolist())]
+        return {key: [elem[key] for elem in elements] for key in elements[0].keys()}
+
+    columns = {}
+    for key in ["smiles", "labels", "unique_ids", "features"]:
+        values = getattr(dataset, key)
+        if values is None:
+            continue
+        if key == "smiles":
+            values = list(values)
+        if indices is not None:
+            if isinstance(values, (np.ndarray, torch.Tensor)):
+                values = values[indices]
+            else:
+                values = [values[ii] for ii in indices.tolist()]
+        columns[key] = values
+    return columns
+
+
 def get_num_nodes_per_graph(graphs):
     r"""
     number of nodes per graph
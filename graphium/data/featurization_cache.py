@@ -0,0 +1,291 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+from loguru import logger
+from torch_geometric.data import Data
+
+from graphium.data.graph_store import GraphStore, GraphStoreSequence, GraphStoreWriter, DEFAULT_SHARD_SIZE
+from graphium.data.smiles_transform import did_featurization_fail
+from graphium.features import GraphDict, mol_to_graph_signature
+from graphium.utils.hashing import get_md5_hash
+
+SEGMENT_KEYS_FILE = "keys.npy"
+SIGNATURE_FILE = "signature.json"
+
+
+class CachedFeatures(Sequence):
+    def __init__(self, segment_paths: List[str], segment_idx: np.ndarray, input_idx: np.ndarray):
+        r"""
+        Lazy view of molecules of the featurization cache, given by their segment and their
+        index in the segment. The store of a segment is only opened when one of its molecules
+        is accessed, and the molecules are memory-mapped graphs.
+
+        Parameters:
+            segment_paths: The folders of the segments
+            segment_idx: The position in `segment_paths` of the segment of each molecule,
+                or `-1` for the molecules that are not in the cache
+            input_idx: The index of each molecule in its segment
+        """
+        self.segment_paths = list(segment_paths)
+        self.segment_idx = np.asarray(segment_idx, dtype=np.int64)
+        self.input_idx = np.asarray(input_idx, dtype=np.int64)
+        self._segments = {}
+
+    def _segment(self, segment_idx: int) -> GraphStoreSequence:
+        if segment_idx not in self._segments:
+            self._segments[segment_idx] = GraphStoreSequence(GraphStore(self.segment_paths[segment_idx]))
+        return self._segments[segment_idx]
+
+    def set_segment(self, indices: Sequence[int], segment_path: str, input_idx: Sequence[int]) -> None:
+        r"""
+        Point the given molecules to a segment, e.g. to the new segment of the molecules that were missing.
+
+        Parameters:
+            indices: The indices of the molecules in this view
+            segment_path: The folder of the segment
+            input_idx: The index of each of these molecules in the segment
+        """
+        self.segment_paths.append(segment_path)
+        self.segment_idx[np.asarray(indices, dtype=np.int64)] = len(self.segment_paths) - 1
+        self.input_idx[np.asarray(indices, dtype=np.int64)] = input_idx
+
+    @property
+    def idx_none(self) -> List[int]:
+        """The indices of the molecules that are not in the cache, or that failed featurization"""
+        is_none = self.segment_idx < 0
+        for segment_idx in np.unique(self.segment_idx[~is_none]):
+            failed = list(self._segment(int(segment_idx)).store.failed.keys())
+            is_none |= (self.segment_idx == segment_idx) & np.isin(self.input_idx, failed)
+        return np.flatnonzero(is_none).tolist()
+
+    def __len__(self) -> int:
+        return len(self.segment_idx)
+
+    def __getitem__(self, idx: int) -> Union[Data, GraphDict, str, None]:
+        if isinstance(idx, slice):
+            return [self[ii] for ii in range(*idx.indices(len(self)))]
+        segment_idx = int(self.segment_idx[idx])
+        if segment_idx < 0:
+            return None
+        return self._segment(segment_idx)[int(self.input_idx[idx])]
+
+
+class FeaturizationCache:
+    def __init__(
+        self,
+        path: Union[str, os.PathLike],
+        featurizer_args: Optional[Dict[str, Any]] = None,
+        output_type: str = "pyg:graph",
+        shard_size: int = DEFAULT_SHARD_SIZE,
+        max_segments: int = 16,
+    ):
+        r"""
+        Persistent cache of featurized molecules, keyed by molecule ID and featurizer signature.
+        It can be shared across experiments, such that only the molecules that are new, or that
+        were featurized with different arguments, are featurized again.
+
+        The cache of a given signature is a folder of append-only segments. Each segment is
+        a `GraphStore` of the molecules featurized in one run, along with their sorted keys,
+        such that looking up molecules only requires a vectorized search in each segment.
+        Once there are more than `max_segments`, the smallest ones are merged before the next lookup.
+
+        Parameters:
+            path: The root folder of the cache, shared by all featurizer signatures
+            featurizer_args: The arguments of the featurizer, completed with the defaults of
+                `mol_to_graph_dict` to obtain the featurizer signature
+            output_type: The type of graphs produced by the featurizer, i.e. `"pyg:graph"` or `"pyg:dict"`
+            shard_size: The number of molecules per shard of the segments
+            max_segments: The number of segments above which the smallest ones are merged
+        """
+        signature = {
+            "featurizer_args": mol_to_graph_signature(dict(featurizer_args or {})),
+            "output_type": output_type,
+        }
+        self.signature_hash = get_md5_hash(signature)
+        self.path = os.path.join(str(path), self.signature_hash)
+        self.shard_size = shard_size
+        self.max_segments = max_segments
+
+        os.makedirs(self.path, exist_ok=True)
+        signature_path = os.path.join(self.path, SIGNATURE_FILE)
+        if not os.path.isfile(signature_path):
+            with open(signature_path, "w") as f:
+                json.dump(signature, f, default=str)
+
+    def segments(self) -> List[str]:
+        """The complete segments of the cache. A segment is complete once its keys are written."""
+        segments = []
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp"):
+                continue  # Segment being written
+            if os.path.isfile(os.path.join(self.path, name, SEGMENT_KEYS_FILE)):
+                segments.append(name)
+        return sorted(segments)
+
+    def _load_segment_keys(self, segment: str) -> np.ndarray:
+        """The sorted keys of a segment, with the index of their molecule in the segment"""
+        return np.load(os.path.join(self.path, segment, SEGMENT_KEYS_FILE), allow_pickle=False)
+
+    def lookup(self, keys: Sequence[str]) -> Tuple[CachedFeatures, np.ndarray]:
+        r"""
+        Look up molecules in the cache.
+
+        Parameters:
+            keys: The unique ID of each molecule. Empty keys are never found.
+
+        Returns:
+            features: A lazy view of the cached features of each key, as memory-mapped graphs.
+                `None` for the keys that are not found.
+            idx_missing: The indices of the keys that are not found in the cache
+        """
+        if len(self.segments()) > self.max_segments:
+            self.merge_segments()
+
+        keys = np.asarray(keys, dtype=str)
+        segments = self.segments()
+        features = CachedFeatures(
+            [os.path.join(self.path, segment) for segment in segments],
+            np.full(len(keys), -1, dtype=np.int64),
+            np.zeros(len(keys), dtype=np.int64),
+        )
+        missing = keys != ""
+
+        for segment_idx, segment in enumerate(segments):
+            if not missing.any():
+                break
+            try:
+                segment_keys = self._load_segment_keys(segment)
+            except FileNotFoundError:
+                continue  # Merged by another process in the meantime
+            if len(segment_keys) == 0:
+                continue
+
+            # The keys of a segment are sorted, with the index of their molecule in the store
+            query_idx = np.flatnonzero(missing)
+            pos = np.searchsorted(segment_keys["key"], keys[query_idx])
+            pos = np.minimum(pos, len(segment_keys) - 1)
+            found = segment_keys["key"][pos] == keys[query_idx]
+            features.segment_idx[query_idx[found]] = segment_idx
+            features.input_idx[query_idx[found]] = segment_keys["idx"][pos[found]]
+            missing[query_idx[found]] = False
+
+        idx_missing = np.flatnonzero(missing | (keys == ""))
+        return features, idx_missing
+
+    def add(self, keys: Sequence[str], features: Sequence[Union[Data, GraphDict, str, None]]) -> None:
+        r"""
+        Add newly featurized molecules to the cache, as a new segment.
+        Molecules with an empty key, or with a key that appears more than once, are skipped.
+        The molecules that failed featurization are not cached, such that they are featurized
+        again by the next runs, e.g. with a fixed featurizer or after a transient error.
+
+        Parameters:
+            keys: The unique ID of each molecule
+            features: The featurized molecules, or the error message of the ones that failed featurization
+        """
+        if len(keys) != len(features):
+            raise ValueError(f"Got {len(keys)} keys for {len(features)} molecules")
+        keys = np.asarray(keys, dtype=str)
+        unique_keys, first_idx = np.unique(keys, return_index=True)
+        first_idx = first_idx[unique_keys != ""]
+        first_idx = np.asarray([idx for idx in first_idx if not did_featurization_fail(features[idx])])
+        if len(first_idx) == 0:
+            return
+
+        writer = self.segment_writer()
+        writer.start(len(first_idx), resume=False)
+        shard_infos = []
+        for shard_idx, start in enumerate(range(0, len(first_idx), self.shard_size)):
+            shard_features = [features[idx] for idx in first_idx[start : start + self.shard_size]]
+            shard_infos.append(writer.write_shard(shard_idx, shard_features))
+        writer.finalize(shard_infos)
+        self.add_segment(writer, keys[first_idx])
+
+    def segment_writer(self) -> GraphStoreWriter:
+        r"""
+        The writer of a new segment, e.g. to write the shards of the featurized molecules directly
+        from the featurization workers. The segment is only visible once added with `add_segment`.
+        """
+        tmp_path = os.path.join(self.path, uuid.uuid4().hex + ".tmp")
+        return GraphStoreWriter(tmp_path, shard_size=self.shard_size)
+
+    def add_segment(self, writer: GraphStoreWriter, keys: Sequence[str]) -> str:
+        r"""
+        Add a segment written and finalized with a writer of `segment_writer`.
+        The inputs that failed featurization, with an empty key, or with a key that appears more
+        than once, are kept in the store of the segment but are never found by `lookup`.
+
+        Parameters:
+            writer: The writer of the segment
+            keys: The unique ID of each input of the segment, including the failed ones
+
+        Returns:
+            segment_path: The folder of the segment
+        """
+        store = GraphStore(writer.path)
+        keys = np.asarray(keys, dtype=str)
+        if len(keys) != len(store) + len(store.failed):
+            raise ValueError(f"Got {len(keys)} keys for {len(store) + len(store.failed)} inputs")
+        unique_keys, first_idx = np.unique(keys, return_index=True)
+        is_cached = (unique_keys != "") & ~np.isin(first_idx, list(store.failed.keys()))
+
+        # Keys are written sorted, with the index of their input in the segment
+        segment_keys = np.empty(is_cached.sum(), dtype=[("key", keys.dtype), ("idx", np.int64)])
+        segment_keys["key"] = unique_keys[is_cached]
+        segment_keys["idx"] = first_idx[is_cached]
+        with open(os.path.join(writer.path, SEGMENT_KEYS_FILE), "wb") as f:
+            np.save(f, segment_keys, allow_pickle=False)
+
+        segment_path = writer.path[: -len(".tmp")]
+        os.rename(writer.path, segment_path)
+        logger.info(f"Added {len(segment_keys)} molecules to the featurization cache at {self.path}")
+        return segment_path
+
+    def merge_segments(self) -> None:
+        r"""
+        Merge the smallest segments into a single one, such that there are at most `max_segments // 2 + 1`
+        segments left and the cost of a lookup does not grow with the number of past runs.
+        The largest segments are not rewritten, and the molecules are copied shard by shard.
+        """
+        segments = self.segments()
+        if len(segments) <= 1:
+            return
+        try:
+            segment_keys = {segment: self._load_segment_keys(segment) for segment in segments}
+        except FileNotFoundError:
+            return  # Already being merged by another process
+        to_merge = sorted(segments, key=lambda segment: len(segment_keys[segment]))
+        to_merge = to_merge[: max(len(segments) - self.max_segments // 2, 2)]
+
+        features = CachedFeatures(
+            [os.path.join(self.path, segment) for segment in to_merge],
+            np.concatenate([np.full(len(segment_keys[seg]), ii) for ii, seg in enumerate(to_merge)]),
+            np.concatenate([segment_keys[segment]["idx"] for segment in to_merge]),
+        )
+        self.add(np.concatenate([segment_keys[segment]["key"] for segment in to_merge]), features)
+        for segment in to_merge:
+            shutil.rmtree(os.path.join(self.path, segment), ignore_errors=True)
+        logger.info(f"Merged {len(to_merge)} segments of the featurization cache at {self.path}")
+
+    def clear(self) -> None:
+        """Remove all the segments of this featurizer signature"""
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path, exist_ok=True)
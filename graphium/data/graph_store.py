@@ -0,0 +1,727 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import json
+import os
+import shutil
+
+import numpy as np
+import torch
+from datamol import parallelized
+from loguru import logger
+from scipy.sparse import coo_matrix, issparse
+from torch_geometric.data import Data
+
+from graphium.data.utils import get_keys
+from graphium.features import GraphDict, to_dense_array
+from graphium.utils.fs import start_resumable_write
+
+GRAPH_STORE_VERSION = 1
+GRAPH_STORE_INDEX_FILE = "graph_store.json"
+SHARD_INDEX_FILE = "shard.json"
+WRITER_MANIFEST_FILE = "writer.json"
+DEFAULT_SHARD_SIZE = 100_000
+
+# Names of the shard folders and index files written by `GraphStoreWriter`
+_WRITER_OWNED_PATTERNS = ["[0-9][0-9][0-9][0-9][0-9]", "[0-9][0-9][0-9][0-9][0-9].tmp", "*.json"]
+
+# Keys of the `GraphDict` that are parameters rather than arrays
+_GRAPH_DICT_PARAMS = ["adj", "dtype", "mask_nan"]
+
+# Placeholder keys of the label `Data` that only carry the number of nodes/edges
+_LABEL_SIZE_KEYS = ["x", "edge_index"]
+
+
+def get_feature_level(key: str) -> str:
+    r"""
+    Get the level of a feature from its key, following the naming convention used
+    by the featurizer, i.e. `edge_*`, `nodepair_*` and `graph_*` prefixes, while all
+    other keys are node-level.
+
+    Parameters:
+        key: The key of the feature
+
+    Returns:
+        level: One of `"node"`, `"edge"`, `"nodepair"` or `"graph"`
+    """
+    if key.startswith("nodepair_"):
+        return "nodepair"
+    elif key.startswith("edge_"):
+        return "edge"
+    elif key.startswith("graph_"):
+        return "graph"
+    return "node"
+
+
+def _to_numpy(value: Any) -> Optional[np.ndarray]:
+    r"""
+    Convert a tensor, sparse matrix or array to a numpy array. Returns `None` for other objects.
+    """
+    if isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+    elif issparse(value):
+        return np.asarray(to_dense_array(value))
+    elif isinstance(value, np.ndarray):
+        return value
+    return None
+
+
+def graph_to_arrays(graph: Union[Data, GraphDict]) -> Tuple[Dict[str, np.ndarray], int, int]:
+    r"""
+    Convert a graph into a dictionary of numpy arrays where the first dimension
+    is the one along which the graphs are concatenated.
+    The `edge_index` is stored as `[num_edges, 2]` and the nodepair features are flattened
+    to `[num_nodes * num_nodes, ...]`.
+
+    Parameters:
+        graph: A PyG graph or a `GraphDict`
+
+    Returns:
+        arrays: The dictionary of arrays
+        num_nodes: The number of nodes in the graph
+        num_edges: The number of edges in the graph
+    """
+    arrays = {}
+    if isinstance(graph, GraphDict):
+        adj = graph.adj if issparse(graph.adj) else coo_matrix(graph.adj)
+        adj = coo_matrix(adj)
+        arrays["edge_index"] = np.stack([adj.row, adj.col], axis=1)
+        arrays["edge_weight"] = adj.data
+        items = [(key, val) for key, val in graph.items() if key not in _GRAPH_DICT_PARAMS]
+    elif isinstance(graph, Data):
+        items = [(key, graph[key]) for key in get_keys(graph)]
+    else:
+        raise TypeError(f"Graphs must be a `Data` or a `GraphDict`, provided `{type(graph)}`")
+
+    num_nodes = int(graph.num_nodes)
+    for key, val in items:
+        val = _to_numpy(val)
+        if val is None:
+            continue  # Skip the non-array attributes, such as `num_nodes`
+        if key == "edge_index":
+            val = val.T
+        elif get_feature_level(key) == "nodepair":
+            val = val.reshape(num_nodes * num_nodes, *val.shape[2:])
+        arrays[key] = np.atleast_1d(val)
+    num_edges = arrays["edge_index"].shape[0] if "edge_index" in arrays else 0
+
+    return arrays, num_nodes, num_edges
+
+
+def label_to_arrays(label: Union[Data, Dict[str, Any]]) -> Dict[str, Tuple[np.ndarray, int]]:
+    r"""
+    Convert the labels of a molecule into a dictionary of arrays, one for each task,
+    with an explicit first dimension along which they are concatenated.
+
+    Parameters:
+        label: The label `Data` (or dictionary) of a single molecule
+
+    Returns:
+        arrays: A dictionary with the task as key and a tuple `(array, ndim)` as value,
+            with `ndim` the original number of dimensions of the label.
+    """
+    keys = get_keys(label) if isinstance(label, Data) else label.keys()
+    arrays = {}
+    for task in keys:
+        if task in _LABEL_SIZE_KEYS:
+            continue
+        val = _to_numpy(label[task])
+        if val is None:
+            val = np.asarray(label[task])
+        ndim = val.ndim
+        if ndim < 2:
+            val = val.reshape(1, -1)
+        arrays[task] = (val, ndim)
+    return arrays
+
+
+def _counts_to_offsets(counts: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def _save_array(path: str, array: np.ndarray) -> None:
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array), allow_pickle=False)
+
+
+class GraphStoreWriter:
+    def __init__(self, path: Union[str, os.PathLike], shard_size: int = DEFAULT_SHARD_SIZE):
+        r"""
+        Write featurized graphs and their labels into a sharded columnar store
+        that can be memory-mapped by `GraphStore`.
+
+        Each shard is a folder with one `.npy` file per feature, where the arrays of all the graphs
+        are concatenated along the first dimension, and offset arrays indicating where each graph
+        starts and ends. The labels are stored the same way, with one array per task.
+
+        Parameters:
+            path: The folder in which to write the store
+            shard_size: The number of graphs per shard
+        """
+        if shard_size <= 0:
+            raise ValueError(f"`shard_size` must be a positive integer, provided `{shard_size}`")
+        self.path = str(path)
+        self.shard_size = shard_size
+
+    def shard_path(self, shard_idx: int) -> str:
+        """Path of the folder of a given shard"""
+        return os.path.join(self.path, format(shard_idx, "05d"))
+
+    @staticmethod
+    def is_partial(path: Union[str, os.PathLike]) -> bool:
+        """Whether a store was started at the given path, but not finalized"""
+        path = str(path)
+        return os.path.isfile(os.path.join(path, WRITER_MANIFEST_FILE)) and not os.path.isfile(
+            os.path.join(path, GRAPH_STORE_INDEX_FILE)
+        )
+
+    def num_shards(self, num_graphs: int) -> int:
+        """Number of shards needed to store `num_graphs` graphs"""
+        return -(-num_graphs // self.shard_size)
+
+    def start(self, num_graphs: int, resume: bool = True) -> Dict[int, Dict[str, Any]]:
+        r"""
+        Prepare the folder of the store before writing the shards, and record the layout
+        of the store in a manifest, such that an interrupted write can be resumed.
+
+        Parameters:
+            num_graphs: The total number of graphs that will be written
+            resume: Whether to keep the shards completed by a previous write with the same layout.
+                If `False`, or if the layout differs, the shards and index files are removed.
+                A non-empty folder that was not written by a `GraphStoreWriter` is refused.
+
+        Returns:
+            completed: The information of the shards that are already completed, by shard index
+        """
+        manifest = {"version": GRAPH_STORE_VERSION, "shard_size": self.shard_size, "num_graphs": num_graphs}
+        start_resumable_write(
+            self.path,
+            manifest,
+            manifest_file=WRITER_MANIFEST_FILE,
+            index_file=GRAPH_STORE_INDEX_FILE,
+            owned_patterns=_WRITER_OWNED_PATTERNS,
+            resume=resume,
+        )
+        return self.completed_shards(num_graphs)
+
+    def completed_shards(self, num_graphs: int) -> Dict[int, Dict[str, Any]]:
+        r"""
+        Find the shards that were completely written. A shard is complete when its folder
+        contains its index file, since the folder is only renamed once fully written.
+
+        Parameters:
+            num_graphs: The total number of graphs of the store
+
+        Returns:
+            completed: The information of the completed shards, by shard index
+        """
+        completed = {}
+        for shard_idx in range(self.num_shards(num_graphs)):
+            shard_index_path = os.path.join(self.shard_path(shard_idx), SHARD_INDEX_FILE)
+            if not os.path.isfile(shard_index_path):
+                continue
+            with open(shard_index_path, "r") as f:
+                shard_info = json.load(f)
+            expected_num_inputs = min(self.shard_size, num_graphs - shard_idx * self.shard_size)
+            if shard_info["num_inputs"] == expected_num_inputs:
+                completed[shard_idx] = shard_info
+        return completed
+
+    def write_shard(
+        self,
+        shard_idx: int,
+        features: List[Union[Data, GraphDict]],
+        labels: Optional[List[Union[Data, Dict[str, Any]]]] = None,
+        failed: Optional[Dict[int, Optional[str]]] = None,
+    ) -> Dict[str, Any]:
+        r"""
+        Write a single shard. The shard is first written in a temporary folder,
+        then renamed, such that a shard folder is either complete or absent.
+
+        Parameters:
+            shard_idx: The index of the shard. The inputs of the shard are the ones with
+                indices `[shard_idx * shard_size, (shard_idx + 1) * shard_size)`.
+            features: The featurized graphs of the shard
+            labels: The labels of the shard, one per graph
+            failed: The inputs of the shard that failed featurization, with their index
+                within the shard as key and the error message as value. They are not part
+                of `features`, and are not counted as graphs of the store.
+
+        Returns:
+            shard_info: The information about the shard, also saved in the shard folder
+        """
+        failed = {} if failed is None else failed
+        num_inputs = len(features) + len(failed)
+        if num_inputs > self.shard_size:
+            raise ValueError(f"Got {num_inputs} inputs for a shard of size {self.shard_size}")
+        if (labels is not None) and (len(labels) != len(features)):
+            raise ValueError(f"Got {len(labels)} labels for {len(features)} graphs")
+
+        final_path = self.shard_path(shard_idx)
+        tmp_path = final_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        shard_info = {
+            "num_graphs": len(features),
+            "num_inputs": num_inputs,
+            "failed": {str(local_idx): msg for local_idx, msg in failed.items()},
+            "fields": {},
+            "labels": {},
+            "label_size_keys": False,
+            "graph_dict_params": None,
+        }
+        if len(features) > 0:
+            shard_info["fields"], shard_info["graph_dict_params"] = self._write_features(tmp_path, features)
+        if labels is not None:
+            shard_info["labels"], shard_info["label_size_keys"] = self._write_labels(tmp_path, labels)
+
+        with open(os.path.join(tmp_path, SHARD_INDEX_FILE), "w") as f:
+            json.dump(shard_info, f)
+
+        shutil.rmtree(final_path, ignore_errors=True)
+        os.rename(tmp_path, final_path)
+        return shard_info
+
+    def _write_features(
+        self, folder: str, features: List[Union[Data, GraphDict]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Write the concatenated feature arrays and offsets of a shard"""
+
+        all_arrays, num_nodes, num_edges = [], [], []
+        for graph in features:
+            arrays, this_num_nodes, this_num_edges = graph_to_arrays(graph)
+            all_arrays.append(arrays)
+            num_nodes.append(this_num_nodes)
+            num_edges.append(this_num_edges)
+
+        keys = list(all_arrays[0].keys())
+        for arrays in all_arrays[1:]:
+            if set(arrays.keys()) != set(keys):
+                raise ValueError(f"All graphs must have the same keys. Got {keys} and {list(arrays.keys())}")
+
+        num_nodes = np.asarray(num_nodes, dtype=np.int64)
+        num_edges = np.asarray(num_edges, dtype=np.int64)
+        _save_array(os.path.join(folder, "num_nodes.npy"), num_nodes)
+        _save_array(os.path.join(folder, "num_edges.npy"), num_edges)
+
+        # Offsets shared by all the features of a given level, when the sizes match
+        level_counts = {"node": num_nodes, "edge": num_edges, "nodepair": num_nodes**2}
+        for level, counts in level_counts.items():
+            _save_array(os.path.join(folder, f"offsets_{level}.npy"), _counts_to_offsets(counts))
+
+        fields = {}
+        for key in keys:
+            level = "edge" if key == "edge_index" else get_feature_level(key)
+            counts = np.asarray([arrays[key].shape[0] for arrays in all_arrays], dtype=np.int64)
+            offsets_name = level
+            if (level not in level_counts) or not np.array_equal(counts, level_counts[level]):
+                # i.e. edge features without the self-loops
+                offsets_name = key
+                _save_array(os.path.join(folder, f"offsets_{key}.npy"), _counts_to_offsets(counts))
+            _save_array(
+                os.path.join(folder, f"{key}.npy"), np.concatenate([arrays[key] for arrays in all_arrays])
+            )
+            fields[key] = {"level": level, "offsets": offsets_name}
+
+        graph_dict_params = None
+        if isinstance(features[0], GraphDict):
+            graph_dict_params = {
+                "dtype": np.dtype(features[0].dtype).name,
+                "mask_nan": features[0].mask_nan,
+            }
+        return fields, graph_dict_params
+
+    def _write_labels(
+        self, folder: str, labels: List[Union[Data, Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+        """Write the concatenated label arrays and offsets of a shard, with one array per task"""
+
+        os.makedirs(os.path.join(folder, "labels"), exist_ok=True)
+        per_task = {}
+        has_size_keys = False
+        for ii, label in enumerate(labels):
+            if isinstance(label, Data):
+                has_size_keys |= "x" in get_keys(label)
+            else:
+                # Views of a `LabelStore` carry the number of nodes and edges instead of placeholders
+                has_size_keys |= getattr(label, "has_graph_sizes", False)
+            for task, (array, ndim) in label_to_arrays(label).items():
+                per_task.setdefault(task, {"idx": [], "arrays": [], "ndim": ndim})
+                per_task[task]["idx"].append(ii)
+                per_task[task]["arrays"].append(array)
+
+        tasks_info = {}
+        for task, task_data in per_task.items():
+            counts = np.zeros(len(labels), dtype=np.int64)
+            counts[task_data["idx"]] = [array.shape[0] for array in task_data["arrays"]]
+            _save_array(os.path.join(folder, "labels", f"{task}.offsets.npy"), _counts_to_offsets(counts))
+            _save_array(os.path.join(folder, "labels", f"{task}.npy"), np.concatenate(task_data["arrays"]))
+            tasks_info[task] = {"ndim": task_data["ndim"]}
+        return tasks_info, has_size_keys
+
+    def finalize(self, shard_infos: List[Dict[str, Any]]) -> None:
+        r"""
+        Write the index of the store, once all shards are written.
+
+        Parameters:
+            shard_infos: The information returned by `write_shard` for each shard, in order.
+                All the shards, except the last one, must contain `shard_size` inputs.
+        """
+        index = {
+            "version": GRAPH_STORE_VERSION,
+            "shard_size": self.shard_size,
+            "num_graphs": sum(info["num_graphs"] for info in shard_infos),
+            "shard_num_graphs": [info["num_graphs"] for info in shard_infos],
+            "fields": {},
+            "labels": {},
+            "shard_labels": [list(info["labels"].keys()) for info in shard_infos],
+            "label_size_keys": any(info["label_size_keys"] for info in shard_infos),
+            "graph_dict_params": None,
+            "failed": {},
+        }
+        for shard_idx, info in enumerate(shard_infos):
+            for local_idx, msg in info["failed"].items():
+                index["failed"][str(shard_idx * self.shard_size + int(local_idx))] = msg
+            index["fields"].update(info["fields"])
+            index["labels"].update(info["labels"])
+            if info["graph_dict_params"] is not None:
+                index["graph_dict_params"] = info["graph_dict_params"]
+
+        with open(os.path.join(self.path, GRAPH_STORE_INDEX_FILE), "w") as f:
+            json.dump(index, f)
+
+    def write(
+        self,
+        features: List[Union[Data, GraphDict]],
+        labels: Optional[List[Union[Data, Dict[str, Any]]]] = None,
+        n_jobs: Optional[int] = 0,
+        backend: str = "loky",
+        resume: bool = True,
+        progress: bool = False,
+        tqdm_kwargs: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        r"""
+        Write all the graphs and labels to the store, shard by shard, then finalize it.
+        The shards are written in parallel, and the shards already completed by a previous
+        interrupted write are skipped.
+
+        Parameters:
+            features: The featurized graphs
+            labels: The labels, one per graph
+            n_jobs: Number of jobs used to write the shards. `0` writes them sequentially,
+                `-1` uses all the available cores.
+            backend: The joblib backend used for parallelization
+            resume: Whether to skip the shards completed by a previous write
+            progress: Whether to display a progress bar over the shards
+            tqdm_kwargs: The arguments of the progress bar
+        """
+        if (labels is not None) and (len(labels) != len(features)):
+            raise ValueError(f"Got {len(labels)} labels for {len(features)} graphs")
+
+        completed = self.start(len(features), resume=resume)
+        shard_params = []
+        for shard_idx in range(self.num_shards(len(features))):
+            if shard_idx in completed:
+                continue
+            start, end = shard_idx * self.shard_size, (shard_idx + 1) * self.shard_size
+            this_labels = labels[start:end] if labels is not None else None
+            shard_params.append((shard_idx, features[start:end], this_labels))
+        self.write_shards(shard_params, completed, n_jobs, backend, progress, tqdm_kwargs)
+
+    def write_shards(
+        self,
+        shard_params: List[Tuple],
+        completed: Dict[int, Dict[str, Any]],
+        n_jobs: Optional[int] = 0,
+        backend: str = "loky",
+        progress: bool = False,
+        tqdm_kwargs: Optional[Dict[str, Any]] = None,
+        write_fn: Optional[Callable[..., Dict[str, Any]]] = None,
+    ) -> None:
+        r"""
+        Write the missing shards, in parallel if `n_jobs != 0`, then finalize the store.
+
+        Only the parameters of the shards are dispatched to the workers, and joblib only
+        dispatches a few tasks ahead of the running ones, so the memory used depends on
+        the size of the shards and the number of jobs, not on the size of the store.
+
+        Parameters:
+            shard_params: The arguments of `write_fn` for each missing shard, starting with the shard index
+            completed: The information of the shards already completed, as returned by `start`
+            n_jobs: Number of jobs used to write the shards. `0` writes them sequentially.
+            backend: The joblib backend used for parallelization
+            progress: Whether to display a progress bar over the shards
+            tqdm_kwargs: The arguments of the progress bar
+            write_fn: The function writing a single shard and returning its information.
+                Defaults to `self.write_shard`. Must be picklable to be used with processes.
+        """
+        if len(completed) > 0:
+            logger.info(
+                f"Resuming the graph store at {self.path}, skipping {len(completed)} completed shards"
+            )
+        if write_fn is None:
+            write_fn = self.write_shard
+
+        shard_infos = parallelized(
+            write_fn,
+            shard_params,
+            n_jobs=n_jobs,
+            backend=backend,
+            arg_type="args",
+            progress=progress,
+            tqdm_kwargs=tqdm_kwargs,
+        )
+        completed = dict(completed)
+        completed.update({params[0]: info for params, info in zip(shard_params, shard_infos)})
+        self.finalize([completed[shard_idx] for shard_idx in sorted(completed.keys())])
+
+
+class GraphStore:
+    def __init__(self, path: Union[str, os.PathLike], mmap_mode: Optional[str] = "c"):
+        r"""
+        Read the featurized graphs and labels written by `GraphStoreWriter`.
+
+        Opening the store only reads its index. The arrays of each shard are
+        memory-mapped the first time the shard is accessed, and the graphs are
+        built from slices of these arrays, without copying the data.
+
+        Parameters:
+            path: The folder of the store
+            mmap_mode: The `mmap_mode` passed to `numpy.load`. The default `"c"` (copy-on-write)
+                gives writable arrays that are never written back to disk, and that can be
+                converted to torch tensors without a copy. Use `None` to load the whole
+                arrays in memory.
+        """
+        self.path = str(path)
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(self.path, GRAPH_STORE_INDEX_FILE), "r") as f:
+            self.index = json.load(f)
+        if self.index["version"] != GRAPH_STORE_VERSION:
+            raise ValueError(
+                f"The graph store at {self.path} has version {self.index['version']}, "
+                f"but version {GRAPH_STORE_VERSION} is expected. Try deleting the cache and preparing the data again."
+            )
+        self.shard_size = self.index["shard_size"]
+        self.fields = self.index["fields"]
+        self.label_tasks = self.index["labels"]
+        self.shard_labels = [set(tasks) for tasks in self.index["shard_labels"]]
+        self.failed = {int(idx): msg for idx, msg in self.index["failed"].items()}
+        self._shard_offsets = _counts_to_offsets(np.asarray(self.index["shard_num_graphs"], dtype=np.int64))
+        self._shards = {}
+        self._label_store = None
+
+    @staticmethod
+    def exists(path: Union[str, os.PathLike]) -> bool:
+        """Whether a complete store exists at the given path"""
+        return os.path.isfile(os.path.join(str(path), GRAPH_STORE_INDEX_FILE))
+
+    def __len__(self) -> int:
+        return self.index["num_graphs"]
+
+    def __getstate__(self):
+        """Do not pickle the memory-mapped arrays, they are re-opened lazily by each process"""
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        state["_label_store"] = None
+        return state
+
+    def _load(self, shard_idx: int, name: str) -> np.ndarray:
+        """Load (memory-map) a single array of a shard"""
+        shard = self._shards.setdefault(shard_idx, {})
+        if name not in shard:
+            path = os.path.join(self.path, format(shard_idx, "05d"), f"{name}.npy")
+            shard[name] = np.load(path, mmap_mode=self.mmap_mode, allow_pickle=False)
+        return shard[name]
+
+    def _locate(self, idx: int) -> Tuple[int, int]:
+        if idx < 0:
+            idx += len(self)
+        if (idx < 0) or (idx >= len(self)):
+            raise IndexError(f"Index {idx} out of range for a store of {len(self)} graphs")
+        # Shards can hold fewer than `shard_size` graphs when some inputs failed featurization
+        shard_idx = int(np.searchsorted(self._shard_offsets, idx, side="right")) - 1
+        return shard_idx, idx - int(self._shard_offsets[shard_idx])
+
+    def _slice(self, shard_idx: int, local_idx: int, name: str, offsets_name: str) -> np.ndarray:
+        offsets = self._load(shard_idx, offsets_name)
+        return self._load(shard_idx, name)[offsets[local_idx] : offsets[local_idx + 1]]
+
+    def get_num_nodes_and_edges(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Number of nodes and edges of every graph in the store"""
+        num_shards = len(self.index["shard_num_graphs"])
+        if (num_shards == 0) or (len(self.fields) == 0):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        num_nodes = np.concatenate([self._load(ii, "num_nodes") for ii in range(num_shards)])
+        num_edges = np.concatenate([self._load(ii, "num_edges") for ii in range(num_shards)])
+        return num_nodes, num_edges
+
+    def get_labeled_indices(self) -> Dict[str, np.ndarray]:
+        """Indices of the molecules that have a label, for each task, read from the label offsets only"""
+        indices = {}
+        for task in self.label_tasks.keys():
+            task_indices = []
+            for shard_idx, tasks in enumerate(self.shard_labels):
+                if task not in tasks:
+                    continue
+                offsets = self._load(shard_idx, os.path.join("labels", f"{task}.offsets"))
+                task_indices.append(np.flatnonzero(np.diff(offsets) > 0) + self._shard_offsets[shard_idx])
+            indices[task] = np.concatenate(task_indices) if task_indices else np.zeros(0, dtype=np.int64)
+        return indices
+
+    def iter_task_labels(self, task: str) -> Iterator[np.ndarray]:
+        r"""
+        Iterate over the labels of a task one shard at a time, without loading the whole column in memory.
+        The labels of each shard are stacked along the first dimension, as by `LabelStore.get_task_values`.
+
+        Parameters:
+            task: The task
+
+        Returns:
+            labels: An iterator over the memory-mapped labels of each shard that contains the task
+        """
+        ndim = self.label_tasks[task]["ndim"]
+        for shard_idx, tasks in enumerate(self.shard_labels):
+            if task not in tasks:
+                continue
+            array = self._load(shard_idx, os.path.join("labels", task))
+            yield array.reshape(-1) if ndim == 0 else array
+
+    def get_task_label_columns(self, task: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        r"""
+        The labels of a task for all the molecules of the store, as the columns of a `LabelStore`.
+        With a single shard, the labels are the memory-mapped array of the shard, without a copy.
+
+        Parameters:
+            task: The task
+
+        Returns:
+            mol_indices: The sorted indices of the molecules labeled for the task
+            offsets: The offsets of the rows of each labeled molecule in `values`
+            values: The concatenated labels of the task, with an explicit first dimension
+        """
+        mol_indices, counts, values = [], [], []
+        for shard_idx, tasks in enumerate(self.shard_labels):
+            if task not in tasks:
+                continue
+            offsets = self._load(shard_idx, os.path.join("labels", f"{task}.offsets"))
+            shard_counts = np.diff(offsets)
+            labeled = np.flatnonzero(shard_counts > 0)
+            mol_indices.append(labeled + self._shard_offsets[shard_idx])
+            counts.append(shard_counts[labeled])
+            values.append(self._load(shard_idx, os.path.join("labels", task)))
+
+        offsets = _counts_to_offsets(np.concatenate(counts))
+        values = values[0] if len(values) == 1 else np.concatenate(values)
+        return np.concatenate(mol_indices), offsets, values
+
+    @property
+    def label_store(self) -> "LabelStore":
+        r"""
+        The labels of the store as a columnar `LabelStore`, built once per process from the label
+        arrays of each task, such that no label object is created per molecule.
+        """
+        if self._label_store is None:
+            from graphium.data.label_store import LabelStore
+
+            self._label_store = LabelStore.from_graph_store(self)
+        return self._label_store
+
+    def get_features(self, idx: int) -> Union[Data, GraphDict]:
+        r"""
+        Get the featurized graph at a given index
+
+        Parameters:
+            idx: The index of the graph
+
+        Returns:
+            graph: A PyG graph, or a `GraphDict` if the store was written from `GraphDict`
+        """
+        shard_idx, local_idx = self._locate(idx)
+        num_nodes = int(self._load(shard_idx, "num_nodes")[local_idx])
+
+        arrays = {}
+        for key, field in self.fields.items():
+            array = self._slice(shard_idx, local_idx, key, f"offsets_{field['offsets']}")
+            if key == "edge_index":
+                array = array.T
+            elif field["level"] == "nodepair":
+                array = array.reshape(num_nodes, num_nodes, *array.shape[1:])
+            arrays[key] = array
+
+        graph_dict_params = self.index["graph_dict_params"]
+        if graph_dict_params is not None:
+            edge_index = arrays.pop("edge_index")
+            edge_weight = arrays.pop("edge_weight")
+            adj = coo_matrix((edge_weight, (edge_index[0], edge_index[1])), shape=(num_nodes, num_nodes))
+            graph = {"adj": adj, "data": arrays}
+            graph.update(graph_dict_params)
+            graph["dtype"] = np.dtype(graph["dtype"]).type
+            return GraphDict(graph)
+
+        return Data(num_nodes=num_nodes, **{key: torch.from_numpy(array) for key, array in arrays.items()})
+
+    def get_labels(self, idx: int) -> "MoleculeLabels":
+        r"""
+        Get the labels at a given index, with only the tasks for which the molecule has a label.
+
+        Parameters:
+            idx: The index of the molecule
+
+        Returns:
+            labels: A view of the labels of the molecule in `label_store`, with one key per task
+        """
+        return self.label_store[idx]
+
+    def __getitem__(self, idx: int) -> Dict[str, Any]:
+        r"""
+        Get the graph and labels at a given index, with keys `"graph_with_features"` and `"labels"`
+        """
+        return {"graph_with_features": self.get_features(idx), "labels": self.get_labels(idx)}
+
+
+class GraphStoreSequence(Sequence):
+    def __init__(self, store: GraphStore):
+        r"""
+        View of the featurized graphs of a `GraphStore` as a sequence indexed by input,
+        where the inputs that failed featurization are given by their error message,
+        as returned by the featurizer.
+
+        Parameters:
+            store: The store, written with the `failed` inputs of each shard
+        """
+        self.store = store
+        self.num_inputs = len(store) + len(store.failed)
+        self._failed_idx = np.asarray(sorted(store.failed.keys()), dtype=np.int64)
+
+    @property
+    def idx_none(self) -> List[int]:
+        """The indices of the inputs that failed featurization"""
+        return self._failed_idx.tolist()
+
+    def __len__(self) -> int:
+        return self.num_inputs
+
+    def __getitem__(self, idx: int) -> Union[Data, GraphDict, str, None]:
+        if isinstance(idx, slice):
+            return [self[ii] for ii in range(*idx.indices(len(self)))]
+        if idx < 0:
+            idx += len(self)
+        if idx in self.store.failed:
+            return self.store.failed[idx]
+        num_failed_before = int(np.searchsorted(self._failed_idx, idx))
+        return self.store.get_features(idx - num_failed_before)
@@ -0,0 +1,399 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import torch
+from torch_geometric.data import Data
+
+from graphium.data.graph_store import GraphStore, _counts_to_offsets
+
+
+def _label_to_rows(label: Any) -> Tuple[np.ndarray, int]:
+    r"""
+    Convert the label of a molecule for one task to an array with an explicit first dimension,
+    along which the labels of all the molecules are concatenated.
+
+    Returns:
+        rows: The label, with at least 2 dimensions
+        ndim: The original number of dimensions of the label
+    """
+    if isinstance(label, torch.Tensor):
+        label = label.detach().cpu().numpy()
+    label = np.asarray(label)
+    ndim = label.ndim
+    if ndim < 2:
+        label = label.reshape(1, -1)
+    return label, ndim
+
+
+def _gather_label_rows(labels: Union[np.ndarray, torch.Tensor, Sequence[Any]], entries: np.ndarray):
+    r"""
+    Gather the labels of the given entries of a task into a single array of rows.
+    Labels stacked in a single array are gathered at once, while a list of labels is converted label by label.
+
+    Returns:
+        values: The concatenated rows of the labels
+        counts: The number of rows of each label
+        ndim: The number of dimensions of a single label
+    """
+    if isinstance(labels, torch.Tensor):
+        labels = labels.detach().cpu().numpy()
+    if isinstance(labels, np.ndarray) and (labels.dtype != object):
+        rows = labels[entries]
+        ndim = rows.ndim - 1
+        if ndim < 2:
+            return rows.reshape(len(entries), -1), np.ones(len(entries), dtype=np.int64), ndim
+        counts = np.full(len(entries), rows.shape[1], dtype=np.int64)
+        return rows.reshape(-1, *rows.shape[2:]), counts, ndim
+
+    rows = [_label_to_rows(labels[entry]) for entry in entries]
+    counts = np.asarray([len(row) for row, _ in rows], dtype=np.int64)
+    return np.concatenate([row for row, _ in rows]), counts, rows[0][1]
+
+
+class LabelStore:
+    def __init__(
+        self,
+        num_mols: int,
+        mol_indices: Optional[Dict[str, np.ndarray]] = None,
+        offsets: Optional[Dict[str, np.ndarray]] = None,
+        values: Optional[Dict[str, np.ndarray]] = None,
+        ndims: Optional[Dict[str, int]] = None,
+    ):
+        r"""
+        Columnar store of the labels of a multitask dataset, replacing one label `Data` per molecule.
+        For each task, the labels of the molecules labeled for it are concatenated into a single
+        array of values, with the sorted indices of these molecules and the offsets of their rows.
+        Indexing the store returns a lightweight `MoleculeLabels` view of the labels of a molecule.
+
+        The number of nodes and edges of the molecules, used to collate the node and edge-level
+        labels, are set with `set_graph_sizes` from the features of the dataset.
+
+        Parameters:
+            num_mols: The number of molecules
+            mol_indices: The sorted indices of the molecules labeled for each task
+            offsets: The offsets of the rows of each labeled molecule in `values`,
+                of length `len(mol_indices[task]) + 1`
+            values: The concatenated labels of each task
+            ndims: The number of dimensions of the label of a single molecule, for each task
+        """
+        self.num_mols = num_mols
+        self.mol_indices = {} if mol_indices is None else mol_indices
+        self.offsets = {} if offsets is None else offsets
+        self.values = {} if values is None else values
+        self.ndims = {} if ndims is None else ndims
+        self.num_nodes = None
+        self.num_edges = None
+
+    @classmethod
+    def from_columns(
+        cls,
+        num_mols: int,
+        columns: Dict[str, Tuple[Sequence[int], Union[np.ndarray, torch.Tensor, Sequence[Any]]]],
+    ) -> "LabelStore":
+        r"""
+        Build the store from the labels of each task, with the molecule of each label.
+        The labels are grouped by molecule with a stable sort, and if a molecule is labeled
+        more than once for a task, the last label is kept.
+
+        Parameters:
+            num_mols: The number of molecules
+            columns: For each task, a tuple `(mol_indices, labels)` with the index of the molecule
+                of each label, and the labels, either stacked in a single array or as a list
+
+        Returns:
+            store: The label store
+        """
+        store = cls(num_mols)
+        for task, (mol_indices, labels) in columns.items():
+            mol_indices = np.asarray(mol_indices, dtype=np.int64)
+            if len(mol_indices) == 0:
+                continue
+            entries = np.argsort(mol_indices, kind="stable")
+            task_mol_indices = mol_indices[entries]
+            is_last = np.append(task_mol_indices[1:] != task_mol_indices[:-1], True)
+            entries, task_mol_indices = entries[is_last], task_mol_indices[is_last]
+
+            values, counts, ndim = _gather_label_rows(labels, entries)
+            store.mol_indices[task] = task_mol_indices
+            store.offsets[task] = _counts_to_offsets(counts)
+            store.values[task] = values
+            store.ndims[task] = ndim
+        return store
+
+    @classmethod
+    def from_graph_store(cls, graph_store: GraphStore) -> "LabelStore":
+        r"""
+        Build the store from the label arrays of a `GraphStore`, without building the labels of each
+        molecule. The number of nodes and edges are set if the store was written with them.
+
+        Parameters:
+            graph_store: The graph store
+
+        Returns:
+            store: The label store, with views on the arrays of the graph store when possible
+        """
+        store = cls(len(graph_store))
+        for task, info in graph_store.label_tasks.items():
+            mol_indices, offsets, values = graph_store.get_task_label_columns(task)
+            store.mol_indices[task] = mol_indices
+            store.offsets[task] = offsets
+            store.values[task] = values
+            store.ndims[task] = info["ndim"]
+        if graph_store.index["label_size_keys"]:
+            store.set_graph_sizes(*graph_store.get_num_nodes_and_edges())
+        return store
+
+    @classmethod
+    def from_entries(
+        cls, num_mols: int, mol_indices: Sequence[int], tasks: Sequence[str], labels: Sequence[Any]
+    ) -> "LabelStore":
+        r"""
+        Build the store from a flat list of labels, each one for a molecule and a task.
+        If a molecule is labeled more than once for a task, the last label is kept.
+
+        Parameters:
+            num_mols: The number of molecules
+            mol_indices: The index of the molecule of each label
+            tasks: The task of each label
+            labels: The labels
+
+        Returns:
+            store: The label store
+        """
+        mol_indices = np.asarray(mol_indices, dtype=np.int64)
+        tasks = np.asarray(tasks)
+        columns = {}
+        for task in dict.fromkeys(tasks.tolist()):
+            entries = np.flatnonzero(tasks == task)
+            columns[task] = (mol_indices[entries], [labels[entry] for entry in entries])
+        return cls.from_columns(num_mols, columns)
+
+    def set_graph_sizes(self, num_nodes: Sequence[int], num_edges: Sequence[int]) -> None:
+        r"""
+        Set the number of nodes and edges of each molecule, such as `MultitaskDataset._num_nodes_list`
+        and `MultitaskDataset._num_edges_list`.
+        """
+        self.num_nodes = np.asarray(num_nodes, dtype=np.int64)
+        self.num_edges = np.asarray(num_edges, dtype=np.int64)
+
+    @property
+    def tasks(self) -> List[str]:
+        return list(self.values.keys())
+
+    def get_task_values(self, task: str) -> np.ndarray:
+        r"""
+        The labels of all the molecules labeled for a task, as a view stacked along the first dimension.
+        Scalar labels give a 1D array, labels of shape `[num_targets]` give `[num_labeled, num_targets]`,
+        and node or edge-level labels are concatenated along the nodes or edges.
+        """
+        values = self.values[task]
+        return values.reshape(-1) if self.ndims[task] == 0 else values
+
+    def set_task_values(self, task: str, values: np.ndarray) -> None:
+        r"""
+        Replace the labels of all the molecules labeled for a task at once,
+        with an array of the same shape as returned by `get_task_values`.
+        """
+        values = np.asarray(values)
+        if values.size != self.values[task].size:
+            raise ValueError(f"Expected {self.values[task].size} values for task `{task}`, got {values.size}")
+        self.values[task] = values.reshape(self.values[task].shape)
+
+    def get_labeled_indices(self) -> Dict[str, np.ndarray]:
+        """Indices of the molecules that have a label, for each task"""
+        return dict(self.mol_indices)
+
+    def _locate(self, task: str, idx: int) -> Optional[Tuple[int, int]]:
+        """The rows of the label of a molecule for a task, or `None` if it is not labeled"""
+        mol_indices = self.mol_indices[task]
+        pos = int(np.searchsorted(mol_indices, idx))
+        if (pos == len(mol_indices)) or (mol_indices[pos] != idx):
+            return None
+        offsets = self.offsets[task]
+        return int(offsets[pos]), int(offsets[pos + 1])
+
+    def gather(self, task: str, indices: Sequence[int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        r"""
+        Gather the labels of a task for the given molecules at once, e.g. for a batch.
+
+        Parameters:
+            task: The task
+            indices: The indices of the molecules
+
+        Returns:
+            positions: The positions in `indices` of the molecules labeled for the task
+            counts: The number of rows of the label of each of these molecules
+            values: The concatenated rows of their labels, copied
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        mol_indices = self.mol_indices[task]
+        if len(mol_indices) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, self.values[task][:0]
+        pos = np.searchsorted(mol_indices, indices).clip(max=len(mol_indices) - 1)
+        found = mol_indices[pos] == indices
+        pos = pos[found]
+
+        # Gather the rows of each molecule, from its start in the values of the task
+        starts = self.offsets[task][pos]
+        counts = self.offsets[task][pos + 1] - starts
+        offsets = _counts_to_offsets(counts)
+        rows = np.arange(offsets[-1], dtype=np.int64) + np.repeat(starts - offsets[:-1], counts)
+        return np.flatnonzero(found), counts, self.values[task][rows]
+
+    def take(self, indices: Sequence[int]) -> "LabelStore":
+        r"""
+        Build a new store with the labels of the given molecules, in the given order.
+        The same molecule can be taken several times.
+
+        Parameters:
+            indices: The indices of the molecules to take
+
+        Returns:
+            store: The label store of these molecules, with the labels copied
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        store = LabelStore(len(indices))
+        for task, mol_indices in self.mol_indices.items():
+            if len(mol_indices) == 0:
+                continue
+            positions, counts, values = self.gather(task, indices)
+            store.mol_indices[task] = positions
+            store.offsets[task] = _counts_to_offsets(counts)
+            store.values[task] = values
+            store.ndims[task] = self.ndims[task]
+
+        if self.num_nodes is not None:
+            store.set_graph_sizes(self.num_nodes[indices], self.num_edges[indices])
+        return store
+
+    def __len__(self) -> int:
+        return self.num_mols
+
+    def __iter__(self) -> Iterator["MoleculeLabels"]:
+        for idx in range(len(self)):
+            yield self[idx]
+
+    def __getitem__(self, idx: Union[int, slice]) -> Union["MoleculeLabels", "LabelStore"]:
+        r"""
+        Get a view of the labels of a molecule, or a new store with the molecules of a slice
+        """
+        if isinstance(idx, slice):
+            return self.take(np.arange(self.num_mols)[idx])
+        idx = int(idx)
+        if idx < 0:
+            idx += self.num_mols
+        if not (0 <= idx < self.num_mols):
+            raise IndexError(f"Index {idx} out of range for {self.num_mols} molecules")
+
+        rows = {}
+        for task in self.values.keys():
+            task_rows = self._locate(task, idx)
+            if task_rows is not None:
+                rows[task] = task_rows
+        num_nodes = int(self.num_nodes[idx]) if self.num_nodes is not None else None
+        num_edges = int(self.num_edges[idx]) if self.num_edges is not None else None
+        return MoleculeLabels(self, rows, num_nodes=num_nodes, num_edges=num_edges, idx=idx)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(num_mols={self.num_mols}, tasks={self.tasks})"
+
+
+class MoleculeLabels(MutableMapping):
+    def __init__(
+        self,
+        store: LabelStore,
+        rows: Dict[str, Tuple[int, int]],
+        num_nodes: Optional[int] = None,
+        num_edges: Optional[int] = None,
+        idx: Optional[int] = None,
+    ):
+        r"""
+        View of the labels of a single molecule in a `LabelStore`, with one key per labeled task.
+        Setting the label of a task writes it back into the store, with the same shape.
+
+        Parameters:
+            store: The label store
+            rows: The start and end rows of the label of each labeled task in the values of the store
+            num_nodes: The number of nodes of the molecule, if known
+            num_edges: The number of edges of the molecule, if known
+            idx: The index of the molecule in the store, used to gather the labels of a batch at once
+        """
+        self._store = store
+        self._rows = rows
+        self.num_nodes = num_nodes
+        self.num_edges = num_edges
+        self.idx = idx
+
+    @property
+    def store(self) -> LabelStore:
+        return self._store
+
+    @property
+    def has_graph_sizes(self) -> bool:
+        return (self.num_nodes is not None) and (self.num_edges is not None)
+
+    def __getitem__(self, task: str) -> np.ndarray:
+        start, end = self._rows[task]
+        array = self._store.values[task][start:end]
+        ndim = self._store.ndims[task]
+        if ndim == 0:
+            array = array.reshape(())
+        elif ndim == 1:
+            array = array[0]
+        return array
+
+    def __setitem__(self, task: str, value: Any) -> None:
+        if task not in self._rows:
+            raise KeyError(f"Task `{task}` is not labeled for this molecule")
+        start, end = self._rows[task]
+        self._store.values[task][start:end] = _label_to_rows(value)[0]
+
+    def __delitem__(self, task: str) -> None:
+        raise TypeError("The labels of a `LabelStore` cannot be removed")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def to_data(self) -> Data:
+        r"""
+        Convert the labels to a PyG `Data`, with the placeholders of the graph sizes if they are known
+        """
+        data = Data()
+        for task, value in self.items():
+            data[task] = value.copy()
+        if self.has_graph_sizes:
+            data["x"] = torch.empty((self.num_nodes, 1))
+            data["edge_index"] = torch.empty((2, self.num_edges))
+        return data
+
+    def __reduce__(self):
+        # Pickle only the labels of this molecule, not the full store
+        return (_labels_from_dict, (dict(self.items()), self.num_nodes, self.num_edges))
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(tasks={list(self._rows.keys())}, num_nodes={self.num_nodes})"
+
+
+def _labels_from_dict(labels: Dict[str, Any], num_nodes: Optional[int], num_edges: Optional[int]):
+    store = LabelStore.from_entries(1, [0] * len(labels), list(labels.keys()), list(labels.values()))
+    if (num_nodes is not None) and (num_edges is not None):
+        store.set_graph_sizes([num_nodes], [num_edges])
+    return store[0]
@@ -0,0 +1,152 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+from typing import List, Sequence, Tuple, Union
+
+import hashlib
+import os
+import uuid
+
+import numpy as np
+from loguru import logger
+
+# The molecule IDs are the 32 characters of an MD5 hex digest, or empty if the smiles could not be parsed
+MOL_ID_LENGTH = 32
+MOL_ID_DTYPE = f"S{MOL_ID_LENGTH}"
+SEGMENT_SUFFIX = ".npy"
+
+
+def smiles_to_index_keys(smiles: Sequence[str]) -> np.ndarray:
+    r"""
+    Fixed-size keys of the smiles in the index, as the 16 bytes of their MD5 digest,
+    such that the index does not depend on the length of the smiles.
+    """
+    keys = np.empty(len(smiles), dtype="S16")
+    for ii, this_smiles in enumerate(smiles):
+        keys[ii] = hashlib.md5(this_smiles.encode("utf-8")).digest()
+    return keys
+
+
+class MolIdIndex:
+    def __init__(self, path: Union[str, os.PathLike], max_segments: int = 16):
+        r"""
+        Persistent index from smiles to their unique molecule ID, such that the IDs of the smiles
+        seen in previous runs, or by other tasks, do not need to be computed again.
+
+        The index is a folder of append-only segments, each one a `.npy` array of the keys of
+        the smiles and their molecule IDs, sorted by key. Looking up smiles only requires
+        a vectorized search in each segment. The segments are merged into one once there
+        are more than `max_segments`.
+
+        Parameters:
+            path: The folder of the index
+            max_segments: The number of segments above which they are merged
+        """
+        self.path = str(path)
+        self.max_segments = max_segments
+        os.makedirs(self.path, exist_ok=True)
+
+    def segments(self) -> List[str]:
+        """The complete segments of the index"""
+        return sorted(name for name in os.listdir(self.path) if name.endswith(SEGMENT_SUFFIX))
+
+    def _load_segment(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), allow_pickle=False)
+
+    def lookup(self, smiles: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        r"""
+        Look up the molecule ID of each smiles.
+
+        Parameters:
+            smiles: The smiles to look up
+
+        Returns:
+            mol_ids: The molecule ID of each smiles, as an array of strings.
+                Empty for the smiles that are not found, or that could not be parsed.
+            idx_missing: The indices of the smiles that are not found in the index
+        """
+        keys = smiles_to_index_keys(smiles)
+        mol_ids = np.zeros(len(keys), dtype=MOL_ID_DTYPE)
+        missing = np.ones(len(keys), dtype=bool)
+
+        for segment in self.segments():
+            if not missing.any():
+                break
+            try:
+                segment_entries = self._load_segment(segment)
+            except FileNotFoundError:
+                continue  # Merged by another process in the meantime
+            if len(segment_entries) == 0:
+                continue
+
+            query_idx = np.flatnonzero(missing)
+            pos = np.searchsorted(segment_entries["key"], keys[query_idx])
+            pos = np.minimum(pos, len(segment_entries) - 1)
+            found = segment_entries["key"][pos] == keys[query_idx]
+            mol_ids[query_idx[found]] = segment_entries["mol_id"][pos[found]]
+            missing[query_idx[found]] = False
+
+        return mol_ids.astype(str), np.flatnonzero(missing)
+
+    def add(self, smiles: Sequence[str], mol_ids: Sequence[str]) -> None:
+        r"""
+        Add the molecule IDs of new smiles to the index, as a new segment.
+
+        Parameters:
+            smiles: The smiles
+            mol_ids: The molecule ID of each smiles, empty if it could not be parsed
+        """
+        if len(smiles) != len(mol_ids):
+            raise ValueError(f"Got {len(mol_ids)} molecule IDs for {len(smiles)} smiles")
+        if len(smiles) == 0:
+            return
+        mol_ids = np.asarray([mol_id.encode("ascii") for mol_id in mol_ids], dtype=object)
+        if any(len(mol_id) > MOL_ID_LENGTH for mol_id in mol_ids):
+            raise ValueError(f"The molecule IDs must have at most {MOL_ID_LENGTH} characters")
+        entries = np.empty(len(smiles), dtype=[("key", "S16"), ("mol_id", MOL_ID_DTYPE)])
+        entries["key"] = smiles_to_index_keys(smiles)
+        entries["mol_id"] = mol_ids
+        self._write_segment(entries)
+        logger.info(f"Added {len(smiles)} molecule IDs to the index at {self.path}")
+
+        if len(self.segments()) > self.max_segments:
+            self.merge_segments()
+
+    def _write_segment(self, entries: np.ndarray) -> str:
+        """Write a segment sorted by key, without duplicated keys, atomically"""
+        entries = np.sort(entries, order="key", kind="stable")
+        is_first = np.append(True, entries["key"][1:] != entries["key"][:-1])
+        name = uuid.uuid4().hex + SEGMENT_SUFFIX
+        tmp_path = os.path.join(self.path, name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            np.save(f, entries[is_first], allow_pickle=False)
+        os.replace(tmp_path, os.path.join(self.path, name))
+        return name
+
+    def merge_segments(self) -> None:
+        """Merge all the segments into a single one, to keep the number of searches per lookup low"""
+        segments = self.segments()
+        if len(segments) <= 1:
+            return
+        entries = []
+        for segment in segments:
+            try:
+                entries.append(self._load_segment(segment))
+            except FileNotFoundError:
+                return  # Already being merged by another process
+        self._write_segment(np.concatenate(entries))
+        for segment in segments:
+            try:
+                os.remove(os.path.join(self.path, segment))
+            except FileNotFoundError:
+                pass
@@ -56,6 +56,17 @@ def extract_labels(df: pd.DataFrame, task_level: str, label_cols: List[str]):
         data = np.stack(list(padded_data), 1).T
         return data
 
+    if task_level == "graph":
+        label_df = df[label_cols]
+        if all(pd.api.types.is_numeric_dtype(dtype) for dtype in label_df.dtypes):
+            # Scalar labels are converted at once, without unpacking each element, and keep the floating
+            # dtype of the columns, e.g. float32 when read as such. Other columns are converted to float64,
+            # such that the missing labels are NaNs.
+            dtype = np.result_type(*[getattr(dtype, "numpy_dtype", dtype) for dtype in label_df.dtypes])
+            if not np.issubdtype(dtype, np.floating):
+                dtype = np.float64
+            return label_df.to_numpy(dtype=dtype, na_value=np.nan)
+
     unpacked_df: pd.DataFrame = df[label_cols].apply(unpack_column)
     output = unpacked_df.apply(merge_columns, axis="columns").to_list()
 
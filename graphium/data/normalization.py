@@ -11,7 +11,7 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Optional
+from typing import Iterable, Optional
 from loguru import logger
 import numpy as np
 import torch
@@ -65,6 +65,48 @@ class LabelNormalization:
         self.data_min = np.nanmin(array, axis=0).tolist()
         self.data_mean = np.nanmean(array, axis=0).tolist()  # 5.380503871833475 for pcqm4mv2
         self.data_std = np.nanstd(array, axis=0).tolist()  # 1.17850688410978995 for pcqm4mv2
+        self._log_statistics()
+
+    def calculate_statistics_from_chunks(self, chunks: Iterable[np.ndarray]):
+        """
+        Same as `calculate_statistics`, but streaming over chunks of the labels concatenated along the
+        first axis, such that all the labels are never held in memory at once. The means and variances
+        of the chunks are merged with the parallel algorithm of Chan et al., in float64.
+        """
+        count, mean, m2, data_max, data_min = None, None, None, None, None
+        for chunk in chunks:
+            chunk = np.asarray(chunk, dtype=np.float64)
+            if len(chunk) == 0:
+                continue
+            is_valid = ~np.isnan(chunk)
+            chunk_count = is_valid.sum(axis=0)
+            chunk_mean = np.divide(
+                np.nansum(chunk, axis=0), chunk_count, out=np.zeros(chunk.shape[1:]), where=chunk_count > 0
+            )
+            chunk_m2 = np.where(is_valid, (chunk - chunk_mean) ** 2, 0.0).sum(axis=0)
+            chunk_max, chunk_min = np.fmax.reduce(chunk, axis=0), np.fmin.reduce(chunk, axis=0)
+            if count is None:
+                count, mean, m2, data_max, data_min = chunk_count, chunk_mean, chunk_m2, chunk_max, chunk_min
+                continue
+
+            new_count = count + chunk_count
+            weight = np.divide(chunk_count, new_count, out=np.zeros(mean.shape), where=new_count > 0)
+            delta = chunk_mean - mean
+            mean = mean + delta * weight
+            m2 = m2 + chunk_m2 + delta**2 * count * weight
+            count = new_count
+            data_max, data_min = np.fmax(data_max, chunk_max), np.fmin(data_min, chunk_min)
+
+        if count is None:
+            raise ValueError("Cannot calculate the statistics of empty labels")
+        nan = np.full(np.shape(mean), np.nan)
+        self.data_max = data_max.tolist()
+        self.data_min = data_min.tolist()
+        self.data_mean = np.where(count > 0, mean, nan).tolist()
+        self.data_std = np.sqrt(np.divide(m2, count, out=nan, where=count > 0)).tolist()
+        self._log_statistics()
+
+    def _log_statistics(self):
         if self.verbose:
             logger.info(f"Max value for normalization '{self.data_max}'")
             logger.info(f"Min value for normalization '{self.data_min}'")
@@ -11,63 +11,121 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Dict, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
 from torch.utils.data.dataloader import Dataset
+from torch.utils.data.distributed import DistributedSampler
 
 import torch.utils.data as data_utils
+from loguru import logger
 import numpy as np
 import time
-import os
-import torch
 
 
-class DatasetSubSampler(data_utils.Sampler):
+class DatasetSubSampler(DistributedSampler):
     def __init__(
-        self, dataset: Dataset, sampler_task_dict: Dict[str, Optional[float]], data_path: str, data_hash: str
+        self,
+        dataset: Dataset,
+        sampler_task_dict: Dict[str, Optional[float]],
+        data_path: Optional[str] = None,
+        data_hash: Optional[str] = None,
+        shuffle: bool = True,
+        seed: int = 0,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
     ):
         """
         Random sample a subset of the dataset for each task each epoch and combine them for training.
 
+        The indices of the molecules labeled for each task are computed once by `dataset.get_task_indices()`,
+        and cached next to the metadata of the dataset. A molecule is sampled if it is drawn for any
+        of the tasks it is labeled for. The sampling is deterministic given the `seed` and the epoch,
+        set with `set_epoch`, or incremented at each iteration otherwise.
+
         Parameters:
-            dataset: the whole training dataset
-            sampler_task_dict: a dict which indicates the sampled amount of data for each task.
-            data_path: path to save the data indices.
-            data_hash: hash folder name for the data indices.
+            dataset: the whole training dataset, a `MultitaskDataset`
+            sampler_task_dict: a dict which indicates the sampled fraction of data for each task.
+            data_path: Deprecated and ignored, the indices are cached with the dataset
+            data_hash: Deprecated and ignored, the indices are cached with the dataset
+            shuffle: Whether to shuffle the sampled indices
+            seed: The seed of the sampling
+            num_replicas: The number of processes of the distributed training, such that each process
+                iterates over a different part of the sampled indices. By default, the indices are not split.
+            rank: The rank of the current process, required with `num_replicas`
+
+        It is a `DistributedSampler`, such that Lightning does not wrap it in a second distributed sampler.
+        Its `num_samples` and `total_size` are the numbers of indices sampled for the current epoch,
+        for the current process and for all the processes.
         """
-        self.dataset = dataset
+        if (num_replicas is not None) and (rank is None):
+            raise ValueError("`rank` is required with `num_replicas`")
+        # The default number of processes is 1 rather than the world size, since the indices are not split
+        super().__init__(
+            dataset,
+            num_replicas=1 if num_replicas is None else num_replicas,
+            rank=0 if rank is None else rank,
+            shuffle=shuffle,
+            seed=seed,
+            drop_last=False,
+        )
         self.sampler_task_dict = sampler_task_dict
-        self.task_indices = {}
+
         now = time.time()
-        path_with_hash = os.path.join(data_path, data_hash)
-        os.makedirs(path_with_hash, exist_ok=True)
-        filename = os.path.join(path_with_hash, "dataset_indices.pkl")
-        # if file dataset_indices.pkl exists, load indices from file.
-        if os.path.isfile(filename):
-            print(f"Sampler--loading dataset indices from disk.")
-            self.task_indices = torch.load(filename)
-        # if not, iterate through all data items in dataset and save indices to disk
-        else:
-            for i in range(len(dataset)):
-                # the dataset[i]["labels"].keys() are not deterministic, need to sort by key length
-                task_name = sorted(dataset[i]["labels"].keys(), key=len)[-1]
-                if task_name not in self.task_indices:
-                    self.task_indices[task_name] = []
-                self.task_indices[task_name].append(i)
-            elapsed = round(time.time() - now)
-            print(f"Sampler-->time spent on getting indices: {elapsed}.")
-            torch.save(self.task_indices, filename, pickle_protocol=4)
-
-    def __iter__(self):
-        indices = []
-        for task_name in self.task_indices.keys():
-            task_size = int(len(self.task_indices[task_name]) * self.sampler_task_dict[task_name])
-            indices += np.random.choice(self.task_indices[task_name], task_size, replace=False).tolist()
-            indices_set = set(indices)
-            self.total_size = len(indices_set)
-        return iter(indices_set)
-
-    def __len__(self):
-        return self.total_size
+        self.task_indices = dataset.get_task_indices()
+        logger.info(f"Sampler--time spent on getting indices: {time.time() - now:.2f}s")
+
+        self._epoch_is_set = False
+        self._indices = None
+        self._indices_epoch = None
+        self._get_indices()
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to seed the sampling"""
+        self.epoch = epoch
+        self._epoch_is_set = True
+
+    def __iter__(self) -> Iterator[int]:
+        indices = self._get_indices()
+        self._indices = None
+        if not self._epoch_is_set:
+            self.epoch += 1
+        return iter(indices.tolist())
+
+    def __len__(self) -> int:
+        return len(self._get_indices())
+
+    def _get_indices(self) -> np.ndarray:
+        """Get the sampled indices of the current epoch, computed once per epoch"""
+        if (self._indices is None) or (self._indices_epoch != self.epoch):
+            self._indices = self._sample_indices(np.random.default_rng([self.seed, self.epoch]))
+            self._indices_epoch = self.epoch
+            self.num_samples = len(self._indices)
+            self.total_size = self.num_samples * self.num_replicas
+        return self._indices
+
+    def _sample_indices(self, rng: np.random.Generator) -> np.ndarray:
+        # Union of the indices drawn for each task, with a mask over the dataset
+        mask = np.zeros(len(self.dataset), dtype=bool)
+        for task_name, task_indices in self.task_indices.items():
+            fraction = self.sampler_task_dict.get(task_name, None)
+            if fraction is None:
+                fraction = 1.0
+            task_size = int(len(task_indices) * fraction)
+            if task_size >= len(task_indices):
+                mask[task_indices] = True
+            elif task_size > 0:
+                chosen = rng.choice(len(task_indices), task_size, replace=False, shuffle=False)
+                mask[task_indices[chosen]] = True
+        indices = np.flatnonzero(mask)
+        if self.shuffle:
+            indices = rng.permutation(indices)
+
+        # Each process takes one part of the indices, padded to have the same length on all processes
+        if self.num_replicas > 1:
+            total_size = -(-len(indices) // self.num_replicas) * self.num_replicas
+            if len(indices) > 0:
+                indices = np.resize(indices, total_size)
+            indices = indices[self.rank : total_size : self.num_replicas]
+        return indices
 
     @classmethod
     def check_sampling_required(cls, sampler_task_dict):
@@ -76,3 +134,165 @@ class DatasetSubSampler(data_utils.Sampler):
         skip subsampling.
         """
         return not all(value == 1.0 for value in sampler_task_dict.values())
+
+
+class SizeBucketBatchSampler(data_utils.BatchSampler):
+    def __init__(
+        self,
+        num_nodes: Sequence[int],
+        num_edges: Optional[Sequence[int]] = None,
+        max_num_nodes: Optional[int] = None,
+        max_num_edges: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        shuffle: bool = True,
+        bucket_size: int = 4096,
+        seed: int = 0,
+        drop_last: bool = False,
+        sampler: Optional[Iterable[int]] = None,
+        num_replicas: Optional[int] = None,
+        rank: Optional[int] = None,
+    ):
+        """
+        Batch sampler forming batches of graphs under a budget of nodes and edges, instead of a fixed
+        number of graphs, such that the memory used and the cost of the layers are stable across batches.
+
+        When shuffling, the indices are shuffled, split into buckets of `bucket_size` graphs, and sorted
+        by number of nodes within each bucket, such that graphs of similar sizes are batched together,
+        which reduces the padding after `to_dense_batch`. The order of the batches is then shuffled.
+        The shuffling is deterministic given the `seed` and the epoch, set with `set_epoch`, or incremented
+        at each iteration otherwise. Without shuffling, the batches follow the order of the indices.
+
+        A graph larger than the budget is put alone in its batch.
+
+        With `num_replicas`, all the processes form the same batches, and each one iterates over a
+        different part of them, padded such that all the processes have the same number of batches.
+        When Lightning injects its own `DistributedSampler` as `sampler`, with `use_distributed_sampler`,
+        only its number of processes and rank are used, and the batches are split the same way.
+
+        Parameters:
+            num_nodes: The number of nodes of each graph of the dataset
+            num_edges: The number of edges of each graph of the dataset. Required with `max_num_edges`.
+            max_num_nodes: The maximum total number of nodes in a batch
+            max_num_edges: The maximum total number of edges in a batch
+            max_batch_size: The maximum number of graphs in a batch
+            shuffle: Whether to shuffle the graphs and bucket them by size
+            bucket_size: The number of graphs per bucket, sorted by size
+            seed: The seed of the shuffling
+            drop_last: Whether to drop the last batch of each bucket if it is not full, meaning that it
+                reaches neither `max_batch_size` graphs nor one of the budgets of nodes and edges
+            sampler: An optional sampler of the indices of the graphs to batch, such as `DatasetSubSampler`.
+                By default, all the graphs are batched. It must not be split across processes.
+            num_replicas: The number of processes of the distributed training, such that each process
+                iterates over a different part of the batches. By default, the batches are not split.
+            rank: The rank of the current process, required with `num_replicas`
+        """
+        if (max_num_nodes is None) and (max_num_edges is None) and (max_batch_size is None):
+            raise ValueError("One of `max_num_nodes`, `max_num_edges` or `max_batch_size` is required")
+        if (max_num_edges is not None) and (num_edges is None):
+            raise ValueError("`num_edges` is required with `max_num_edges`")
+        if isinstance(sampler, DistributedSampler) and not isinstance(sampler, DatasetSubSampler):
+            # Sampler injected by Lightning to split the graphs across processes. The batches are split
+            # instead, such that all the processes have the same number of batches.
+            num_replicas, rank, sampler = sampler.num_replicas, sampler.rank, None
+        if (num_replicas is not None) and (rank is None):
+            raise ValueError("`rank` is required with `num_replicas`")
+
+        self.num_nodes = np.asarray(num_nodes, dtype=np.int64)
+        self.num_edges = None if num_edges is None else np.asarray(num_edges, dtype=np.int64)
+        self.max_num_nodes = max_num_nodes
+        self.max_num_edges = max_num_edges
+        self.max_batch_size = max_batch_size
+        self.batch_size = max_batch_size
+        self.shuffle = shuffle
+        self.bucket_size = bucket_size
+        self.seed = seed
+        self.drop_last = drop_last
+        self.sampler = sampler
+        self.num_replicas = 1 if num_replicas is None else num_replicas
+        self.rank = 0 if rank is None else rank
+
+        self.epoch = 0
+        self._epoch_is_set = False
+        self._batches = None
+        self._batches_epoch = None
+
+    def set_epoch(self, epoch: int) -> None:
+        """Set the epoch used to seed the shuffling"""
+        self.epoch = epoch
+        self._epoch_is_set = True
+        if hasattr(self.sampler, "set_epoch"):
+            self.sampler.set_epoch(epoch)
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._get_batches()
+        self._batches = None
+        if not self._epoch_is_set:
+            self.epoch += 1
+        return iter(batches)
+
+    def __len__(self) -> int:
+        return len(self._get_batches())
+
+    def _get_batches(self) -> List[List[int]]:
+        """Get the batches of the current epoch, computed once per epoch"""
+        if (self._batches is None) or (self._batches_epoch != self.epoch):
+            self._batches = self._make_batches(np.random.default_rng([self.seed, self.epoch]))
+            self._batches_epoch = self.epoch
+        return self._batches
+
+    def _make_batches(self, rng: np.random.Generator) -> List[List[int]]:
+        if self.sampler is None:
+            indices = np.arange(len(self.num_nodes), dtype=np.int64)
+        else:
+            indices = np.fromiter(iter(self.sampler), dtype=np.int64)
+
+        if self.shuffle:
+            indices = rng.permutation(indices)
+
+        batches = []
+        for start in range(0, len(indices), self.bucket_size):
+            bucket = indices[start : start + self.bucket_size]
+            if self.shuffle:
+                bucket = bucket[np.argsort(self.num_nodes[bucket], kind="stable")]
+            batches.extend(self._split_bucket(bucket))
+
+        if self.shuffle:
+            batches = [batches[ii] for ii in rng.permutation(len(batches))]
+
+        # Each process takes one part of the batches, padded to have the same number on all processes
+        if self.num_replicas > 1:
+            total_size = -(-len(batches) // self.num_replicas) * self.num_replicas
+            if len(batches) > 0:
+                batches = [batches[ii % len(batches)] for ii in range(total_size)]
+            batches = batches[self.rank : total_size : self.num_replicas]
+        return batches
+
+    def _split_bucket(self, bucket: np.ndarray) -> List[List[int]]:
+        """Greedily split a bucket of indices into consecutive batches under the budget"""
+        budgets = []
+        if self.max_num_nodes is not None:
+            budgets.append((np.concatenate([[0], np.cumsum(self.num_nodes[bucket])]), self.max_num_nodes))
+        if self.max_num_edges is not None:
+            budgets.append((np.concatenate([[0], np.cumsum(self.num_edges[bucket])]), self.max_num_edges))
+
+        batches = []
+        start = 0
+        while start < len(bucket):
+            end = len(bucket)
+            if self.max_batch_size is not None:
+                end = min(end, start + self.max_batch_size)
+            for cumsum, budget in budgets:
+                end = min(end, int(np.searchsorted(cumsum, cumsum[start] + budget, side="right")) - 1)
+            end = max(end, start + 1)  # A graph larger than the budget is alone in its batch
+            batches.append(bucket[start:end].tolist())
+            start = end
+
+        # Only the last batch can stop before reaching a limit, when there are no more graphs in the bucket
+        if self.drop_last and (len(batches) > 0):
+            start = len(bucket) - len(batches[-1])
+            is_full = (self.max_batch_size is not None) and (len(batches[-1]) >= self.max_batch_size)
+            for cumsum, budget in budgets:
+                is_full = is_full or (cumsum[-1] - cumsum[start] >= budget)
+            if not is_full:
+                batches = batches[:-1]
+        return batches
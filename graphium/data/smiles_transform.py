@@ -14,7 +14,12 @@ Refer to the LICENSE file for the full terms and conditions.
 from typing import Type, List, Dict, Union, Any, Callable, Optional, Tuple, Iterable
 
 import os
+import numpy as np
 import datamol as dm
+from loguru import logger
+
+from graphium.data.graph_store import GraphStoreWriter
+from graphium.data.mol_id_index import MolIdIndex
 
 
 def smiles_to_unique_mol_id(smiles: str) -> Optional[str]:
@@ -49,17 +54,22 @@ class BatchingSmilesTransform:
     Class to transform a list of smiles using a transform function
     """
 
-    def __init__(self, transform: Callable):
+    def __init__(self, transform: Callable, batch_transform: Optional[Callable] = None):
         """
         Parameters:
             transform: Callable function to transform a single smiles
+            batch_transform: Optional callable function to transform a list of smiles at once,
+                with the same outputs as `transform` on each smiles. Used instead of `transform` if provided.
         """
         self.transform = transform
+        self.batch_transform = batch_transform
 
     def __call__(self, smiles_list: Iterable[str]) -> Any:
         """
         Function to transform a list of smiles
         """
+        if self.batch_transform is not None:
+            return self.batch_transform(list(smiles_list))
         mol_id_list = []
         for smiles in smiles_list:
             mol_id_list.append(self.transform(smiles))
@@ -88,6 +98,46 @@ class BatchingSmilesTransform:
         return batch_size
 
 
+class GraphStoreSmilesTransform:
+    """
+    Class to transform a shard of smiles using a transform function, and write the
+    resulting graphs directly into a `GraphStoreWriter`, such that the graphs are never
+    sent back to the main process.
+    """
+
+    def __init__(
+        self, transform: Callable, writer: GraphStoreWriter, batch_transform: Optional[Callable] = None
+    ):
+        """
+        Parameters:
+            transform: Callable function to transform a single smiles
+            writer: The writer of the store in which to save the graphs
+            batch_transform: Optional callable function to transform a list of smiles at once,
+                with the same outputs as `transform` on each smiles. Used instead of `transform` if provided.
+        """
+        self.transform = transform
+        self.writer = writer
+        self.batch_transform = batch_transform
+
+    def __call__(self, shard_idx: int, smiles_list: Iterable[str]) -> Dict[str, Any]:
+        """
+        Function to transform a shard of smiles and write it.
+        The molecules that failed featurization are recorded in the shard with their error message.
+        """
+        if self.batch_transform is not None:
+            all_features = self.batch_transform(list(smiles_list))
+        else:
+            all_features = [self.transform(smiles) for smiles in smiles_list]
+
+        features, failed = [], {}
+        for ii, feat in enumerate(all_features):
+            if did_featurization_fail(feat):
+                failed[ii] = feat
+            else:
+                features.append(feat)
+        return self.writer.write_shard(shard_idx, features, failed=failed)
+
+
 def smiles_to_unique_mol_ids(
     smiles: Iterable[str],
     n_jobs=-1,
@@ -95,6 +145,7 @@ def smiles_to_unique_mol_ids(
     backend="loky",
     progress=True,
     progress_desc="mols to ids",
+    mol_id_index: Optional[MolIdIndex] = None,
 ) -> List[Optional[str]]:
     """
     This function takes a list of smiles and finds the corresponding datamol unique_id
@@ -104,28 +155,61 @@ def smiles_to_unique_mol_ids(
     by `dm.to_inchikey_non_standard()`. It guarantees uniqueness for
     different tautomeric forms of the same molecule.
 
+    Duplicated smiles are only converted once. If a `mol_id_index` is provided, the IDs
+    of the smiles already in the index are looked up, and only the other ones are converted
+    in parallel, then added to the index.
+
     Parameters:
         smiles: a list of smiles to be converted to mol ids
         n_jobs: number of jobs to run in parallel
         backend: Parallelization backend
         progress: Whether to display the progress bar
+        mol_id_index: Optional persistent index of the IDs of the smiles seen in previous runs
 
     Returns:
         ids: A list of MD5 hash ids
     """
 
-    batch_size = BatchingSmilesTransform.parse_batch_size(
-        numel=len(smiles), desired_batch_size=featurization_batch_size, n_jobs=n_jobs
-    )
-
-    unique_mol_ids = dm.parallelized_with_batches(
-        BatchingSmilesTransform(smiles_to_unique_mol_id),
-        smiles,
-        batch_size=batch_size,
-        progress=progress,
-        n_jobs=n_jobs,
-        backend=backend,
-        tqdm_kwargs={"desc": f"{progress_desc}, batch={batch_size}"},
-    )
-
-    return unique_mol_ids
+    # Find the unique smiles, in order of first appearance
+    unique_pos = {}
+    codes = [unique_pos.setdefault(this_smiles, len(unique_pos)) for this_smiles in smiles]
+    codes = np.asarray(codes, dtype=np.int64)
+    unique_smiles = list(unique_pos.keys())
+    unique_mol_ids = np.full(len(unique_smiles), "", dtype=object)
+    is_missing = np.ones(len(unique_smiles), dtype=bool)
+
+    # Only the string smiles are kept in the index
+    if mol_id_index is not None:
+        idx_str = [ii for ii, this_smiles in enumerate(unique_smiles) if isinstance(this_smiles, str)]
+        idx_str = np.asarray(idx_str, dtype=np.int64)
+        if len(idx_str) > 0:
+            found_ids, idx_str_missing = mol_id_index.lookup([unique_smiles[idx] for idx in idx_str])
+            unique_mol_ids[idx_str] = found_ids.tolist()
+            is_missing[idx_str] = False
+            is_missing[idx_str[idx_str_missing]] = True
+        num_found = len(unique_smiles) - int(is_missing.sum())
+        logger.info(f"Found {num_found} / {len(unique_smiles)} unique smiles in the molecule ID index")
+    idx_missing = np.flatnonzero(is_missing)
+
+    if len(idx_missing) > 0:
+        missing_smiles = [unique_smiles[idx] for idx in idx_missing]
+        batch_size = BatchingSmilesTransform.parse_batch_size(
+            numel=len(missing_smiles), desired_batch_size=featurization_batch_size, n_jobs=n_jobs
+        )
+
+        missing_mol_ids = dm.parallelized_with_batches(
+            BatchingSmilesTransform(smiles_to_unique_mol_id),
+            missing_smiles,
+            batch_size=batch_size,
+            progress=progress,
+            n_jobs=n_jobs,
+            backend=backend,
+            tqdm_kwargs={"desc": f"{progress_desc}, batch={batch_size}"},
+        )
+        unique_mol_ids[idx_missing] = missing_mol_ids
+
+        if mol_id_index is not None:
+            new_pos = [ii for ii, this_smiles in enumerate(missing_smiles) if isinstance(this_smiles, str)]
+            mol_id_index.add([missing_smiles[ii] for ii in new_pos], [missing_mol_ids[ii] for ii in new_pos])
+
+    return unique_mol_ids[codes].tolist()
@@ -1,9 +1,13 @@
 from .featurizer import get_mol_atomic_features_onehot
+from .featurizer import get_mols_atomic_features_onehot
 from .featurizer import get_mol_atomic_features_float
 from .featurizer import get_mol_edge_features
 from .featurizer import mol_to_adj_and_features
 from .featurizer import mol_to_graph_dict
+from .featurizer import mol_to_graph_dict_batch
 from .featurizer import mol_to_graph_signature
 from .featurizer import GraphDict
+from .featurizer import PositionalEncodingTransform
 from .featurizer import mol_to_pyggraph
+from .featurizer import mol_to_pyggraph_batch
 from .featurizer import to_dense_array
@@ -11,12 +11,13 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Tuple, Union, Dict, Any
+from typing import Tuple, Union, Dict, Any, Optional
 
 import numpy as np
 
 from scipy.sparse import spmatrix, issparse
-from scipy.linalg import pinv
+
+from graphium.features.spectral import get_laplacian_pinv, get_laplacian_pinv_batch
 
 
 def compute_commute_distances(
@@ -47,22 +48,39 @@ def compute_commute_distances(
         if issparse(adj):
             adj = adj.toarray()
 
-        volG = adj.sum()
+        pinvL = get_laplacian_pinv(adj, cache)
+        dist = commute_distances_from_pinv(pinvL, adj.sum())
+        cache["commute"] = dist
 
-        if "pinvL" in cache:
-            pinvL = cache["pinvL"]
+    return dist, base_level, cache
 
-        else:
-            L = np.diagflat(np.sum(adj, axis=1)) - adj
-            pinvL = pinv(L)
-            cache["pinvL"] = pinvL
 
-        dist = volG * np.asarray(
-            [
-                [pinvL[i, i] + pinvL[j, j] - 2 * pinvL[i, j] for j in range(num_nodes)]
-                for i in range(num_nodes)
-            ]
-        )
-        cache["commute"] = dist
+def commute_distances_from_pinv(pinvL: np.ndarray, volG: Union[float, np.ndarray]) -> np.ndarray:
+    """
+    Compute the avg. commute distances from the pseudo-inverse of the Laplacian.
 
-    return dist, base_level, cache
+    Parameters:
+        pinvL [..., num_nodes, num_nodes]: Pseudo-inverse of the Laplacian, possibly stacked for a batch
+        volG [...]: Volume of the graphs, i.e. the sum of their adjacency matrix
+    Returns:
+        dist [..., num_nodes, num_nodes]: avg. commute distances between nodepairs
+    """
+    diag = np.diagonal(pinvL, axis1=-2, axis2=-1)
+    volG = np.asarray(volG)[..., None, None]
+    return volG * (diag[..., :, None] + diag[..., None, :] - 2 * pinvL)
+
+
+def compute_commute_distances_batch(adjs: np.ndarray, pinvL: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Compute avg. commute distances of a batch of graphs of the same size.
+    Equivalent to calling `compute_commute_distances` on each graph.
+
+    Parameters:
+        adjs [batch, num_nodes, num_nodes]: Dense adjacency matrices of the graphs
+        pinvL [batch, num_nodes, num_nodes]: Pseudo-inverses of the Laplacians, computed if not provided
+    Returns:
+        dist [batch, num_nodes, num_nodes]: avg. commute distances between nodepairs
+    """
+    if pinvL is None:
+        pinvL = get_laplacian_pinv_batch(adjs)
+    return commute_distances_from_pinv(pinvL, adjs.sum(axis=(-2, -1)))
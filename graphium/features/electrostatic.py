@@ -11,12 +11,13 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Tuple, Union, Dict, Any
+from typing import Tuple, Union, Dict, Any, Optional
 
 import numpy as np
 
-from scipy.linalg import pinv
-from scipy.sparse import spmatrix, issparse
+from scipy.sparse import spmatrix
+
+from graphium.features.spectral import get_laplacian_pinv, get_laplacian_pinv_batch
 
 
 def compute_electrostatic_interactions(
@@ -40,18 +41,39 @@ def compute_electrostatic_interactions(
         electrostatic = cache["electrostatic"]
 
     else:
-        if "pinvL" in cache:
-            pinvL = cache["pinvL"]
+        pinvL = get_laplacian_pinv(adj, cache)
+        electrostatic = electrostatic_interactions_from_pinv(pinvL)
+        cache["electrostatic"] = electrostatic
 
-        else:
-            if issparse(adj):
-                adj = adj.toarray()
+    return electrostatic, base_level, cache
 
-            L = np.diagflat(np.sum(adj, axis=1)) - adj
-            pinvL = pinv(L)
-            cache["pinvL"] = pinvL
 
-        electrostatic = pinvL - np.diag(pinvL)  # This means that the "ground" is set to any given atom
-        cache["electrostatic"] = electrostatic
+def electrostatic_interactions_from_pinv(pinvL: np.ndarray) -> np.ndarray:
+    """
+    Compute the electrostatic interactions from the pseudo-inverse of the Laplacian.
 
-    return electrostatic, base_level, cache
+    Parameters:
+        pinvL [..., num_nodes, num_nodes]: Pseudo-inverse of the Laplacian, possibly stacked for a batch
+    Returns:
+        electrostatic [..., num_nodes, num_nodes]: electrostatic interactions of node nodepairs
+    """
+    # This means that the "ground" is set to any given atom
+    return pinvL - np.diagonal(pinvL, axis1=-2, axis2=-1)[..., None, :]
+
+
+def compute_electrostatic_interactions_batch(
+    adjs: np.ndarray, pinvL: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """
+    Compute electrostatic interactions of a batch of graphs of the same size.
+    Equivalent to calling `compute_electrostatic_interactions` on each graph.
+
+    Parameters:
+        adjs [batch, num_nodes, num_nodes]: Dense adjacency matrices of the graphs
+        pinvL [batch, num_nodes, num_nodes]: Pseudo-inverses of the Laplacians, computed if not provided
+    Returns:
+        electrostatic [batch, num_nodes, num_nodes]: electrostatic interactions of node nodepairs
+    """
+    if pinvL is None:
+        pinvL = get_laplacian_pinv_batch(adjs)
+    return electrostatic_interactions_from_pinv(pinvL)
@@ -14,6 +14,9 @@ Refer to the LICENSE file for the full terms and conditions.
 from typing import Union, List, Callable, Dict, Tuple, Any, Optional
 
 import inspect
+from collections import OrderedDict
+from copy import copy
+from functools import lru_cache
 from loguru import logger
 import numpy as np
 from scipy.sparse import issparse, coo_matrix
@@ -27,7 +30,10 @@ import datamol as dm
 
 from graphium.features import nmp
 from graphium.utils.tensor import one_of_k_encoding
-from graphium.features.positional_encoding import get_all_positional_encodings
+from graphium.features.positional_encoding import (
+    get_all_positional_encodings,
+    get_all_positional_encodings_batch,
+)
 
 
 def to_dense_array(array: np.ndarray, dtype: str = None) -> np.ndarray:
@@ -100,6 +106,138 @@ def _mask_nans_inf(mask_nan: Optional[str], array: np.ndarray, array_name: str)
     return new_array
 
 
+def _parse_onehot_property(prop: str) -> Tuple[str, str]:
+    r"""
+    Parse the name of a one-hot atomic property.
+
+    Parameters:
+        prop: The name of the property, as given in the `property_list`
+
+    Returns:
+        prop_key: The key of the property in `_ONEHOT_ATOM_PROPERTIES`, or `"chirality"`
+        prop_name: The key of the property in the output dictionary
+    """
+    prop = prop.lower()
+    if prop in ["valence", "total-valence"]:
+        return "valence", "valence"
+    elif prop in ["atomic-number", "degree", "implicit-valence", "hybridization", "chirality"]:
+        return prop, prop
+    for periodic_prop in ["phase", "type", "group", "period"]:
+        if prop in periodic_prop:
+            return periodic_prop, prop
+    raise ValueError(f"Unsupported property `{prop}`")
+
+
+def _periodic_table_values(values: List[Any]) -> List[Any]:
+    """Values of a periodic table property for each atomic number, with `values[atomic_num - 1]`"""
+    return [values[atomic_num - 1] for atomic_num in range(len(values) + 1)]
+
+
+# For each one-hot property, the integer atomic attribute it is computed from, a function returning
+# the value of the property for each possible integer attribute, and the classes of the one-hot encoding.
+_ONEHOT_ATOM_PROPERTIES = {
+    "atomic-number": (
+        "atomic_num",
+        lambda: [Chem.GetPeriodicTable().GetElementSymbol(ii) for ii in range(119)],
+        nmp.ATOM_LIST,
+    ),
+    "degree": ("degree", lambda: list(range(max(nmp.ATOM_DEGREE_LIST) + 1)), nmp.ATOM_DEGREE_LIST),
+    "valence": ("total_valence", lambda: list(range(max(nmp.VALENCE) + 1)), nmp.VALENCE),
+    "implicit-valence": ("implicit_valence", lambda: list(range(max(nmp.VALENCE) + 1)), nmp.VALENCE),
+    "hybridization": (
+        "hybridization",
+        lambda: [
+            Chem.rdchem.HybridizationType.values.get(ii)
+            for ii in range(max(Chem.rdchem.HybridizationType.values.keys()) + 1)
+        ],
+        nmp.HYBRIDIZATION_LIST,
+    ),
+    "phase": ("atomic_num", lambda: _periodic_table_values(nmp.PHASE), nmp.PHASE_SET),
+    "type": ("atomic_num", lambda: _periodic_table_values(nmp.TYPE), nmp.TYPE_SET),
+    "group": ("atomic_num", lambda: _periodic_table_values(nmp.GROUP), nmp.GROUP_SET),
+    "period": ("atomic_num", lambda: _periodic_table_values(nmp.PERIOD), nmp.PERIOD_SET),
+}
+
+# Getters of the integer atomic attributes used by the one-hot properties
+_ATOM_INT_ATTRIBUTES = {
+    "atomic_num": lambda atom: atom.GetAtomicNum(),
+    "degree": lambda atom: atom.GetDegree(),
+    "total_valence": lambda atom: atom.GetTotalValence(),
+    "implicit_valence": lambda atom: atom.GetImplicitValence(),
+    "hybridization": lambda atom: int(atom.GetHybridization()),
+}
+
+
+@lru_cache(maxsize=None)
+def _get_onehot_lookup_table(prop_key: str) -> np.ndarray:
+    r"""
+    Lookup table from the integer atomic attribute to the index of the one-hot class,
+    as given by `one_of_k_encoding`. Attributes outside the table fall in the last class.
+    """
+    _, get_values, classes = _ONEHOT_ATOM_PROPERTIES[prop_key]
+    return np.asarray([one_of_k_encoding(val, classes).index(True) for val in get_values()], dtype=np.int64)
+
+
+def _get_atoms_chirality_onehot(atoms: List[Chem.Atom]) -> np.ndarray:
+    """One-hot encoding of the CIP code of the atoms, and whether their chirality is possible"""
+    one_hots = []
+    for atom in atoms:
+        chirality_possible = int(atom.HasProp("_ChiralityPossible"))
+        if atom.HasProp("_CIPCode"):
+            one_hot = one_of_k_encoding(atom.GetProp("_CIPCode"), nmp.CHIRALITY_LIST)
+            one_hot.append(chirality_possible)
+        else:
+            one_hot = [0, 0, chirality_possible]
+        one_hots.append(one_hot)
+    return np.asarray(one_hots, dtype=np.float16).reshape(len(atoms), len(nmp.CHIRALITY_LIST) + 2)
+
+
+def get_mols_atomic_features_onehot(mols: List[dm.Mol], property_list: List[str]) -> Dict[str, np.ndarray]:
+    r"""
+    Get the one-hot atomic features of a chunk of molecules at once, with the atoms
+    of all molecules concatenated along the first dimension.
+    See `get_mol_atomic_features_onehot` for the accepted properties.
+
+    The integer attributes of the atoms are extracted once into arrays, and the one-hot
+    encodings are obtained with precomputed lookup tables built from the `nmp` lists.
+
+    Parameters:
+        mols: molecules from which to extract the properties
+        property_list: A list of integer atomic properties to get from the molecules.
+
+    Returns:
+        prop_dict:
+            A dictionnary where the element of ``property_list`` are the keys
+            and the values are np.ndarray of shape (N, OH). N is the total number of atoms
+            in ``mols`` and OH the lenght of the one-hot encoding.
+    """
+
+    atoms = [atom for mol in mols for atom in mol.GetAtoms()]
+    attributes = {}
+    prop_dict = {}
+
+    for prop in property_list:
+        prop_key, prop_name = _parse_onehot_property(prop)
+        if prop_key == "chirality":
+            prop_dict[prop_name] = _get_atoms_chirality_onehot(atoms)
+            continue
+
+        attr_name, _, classes = _ONEHOT_ATOM_PROPERTIES[prop_key]
+        if attr_name not in attributes:
+            get_attr = _ATOM_INT_ATTRIBUTES[attr_name]
+            attributes[attr_name] = np.fromiter(
+                (get_attr(atom) for atom in atoms), dtype=np.int64, count=len(atoms)
+            )
+        attr = attributes[attr_name]
+
+        table = _get_onehot_lookup_table(prop_key)
+        in_table = (attr >= 0) & (attr < len(table))
+        class_idx = np.where(in_table, table[np.clip(attr, 0, len(table) - 1)], len(classes))
+        prop_dict[prop_name] = np.eye(len(classes) + 1, dtype=np.float16)[class_idx]
+
+    return prop_dict
+
+
 def get_mol_atomic_features_onehot(mol: dm.Mol, property_list: List[str]) -> Dict[str, Tensor]:
     r"""
     Get the following set of features for any given atom
@@ -148,47 +286,7 @@ def get_mol_atomic_features_onehot(mol: dm.Mol, property_list: List[str]) -> Dic
 
     """
 
-    prop_dict = {}
-
-    for prop in property_list:
-        prop = prop.lower()
-        prop_name = prop
-
-        property_array = []
-        for ii, atom in enumerate(mol.GetAtoms()):
-            if prop in ["atomic-number"]:
-                one_hot = one_of_k_encoding(atom.GetSymbol(), nmp.ATOM_LIST)
-            elif prop in ["degree"]:
-                one_hot = one_of_k_encoding(atom.GetDegree(), nmp.ATOM_DEGREE_LIST)
-            elif prop in ["valence", "total-valence"]:
-                prop_name = "valence"
-                one_hot = one_of_k_encoding(atom.GetTotalValence(), nmp.VALENCE)
-            elif prop in ["implicit-valence"]:
-                one_hot = one_of_k_encoding(atom.GetImplicitValence(), nmp.VALENCE)
-            elif prop in ["hybridization"]:
-                one_hot = one_of_k_encoding(atom.GetHybridization(), nmp.HYBRIDIZATION_LIST)
-            elif prop in ["chirality"]:
-                try:
-                    one_hot = one_of_k_encoding(atom.GetProp("_CIPCode"), nmp.CHIRALITY_LIST)
-                    one_hot.append(int(atom.HasProp("_ChiralityPossible")))
-                except:
-                    one_hot = [0, 0, int(atom.HasProp("_ChiralityPossible"))]
-            elif prop in "phase":
-                one_hot = one_of_k_encoding(nmp.PHASE[atom.GetAtomicNum() - 1], nmp.PHASE_SET)
-            elif prop in "type":
-                one_hot = one_of_k_encoding(nmp.TYPE[atom.GetAtomicNum() - 1], nmp.TYPE_SET)
-            elif prop in "group":
-                one_hot = one_of_k_encoding(nmp.GROUP[atom.GetAtomicNum() - 1], nmp.GROUP_SET)
-            elif prop in "period":
-                one_hot = one_of_k_encoding(nmp.PERIOD[atom.GetAtomicNum() - 1], nmp.PERIOD_SET)
-            else:
-                raise ValueError(f"Unsupported property `{prop}`")
-
-            property_array.append(np.asarray(one_hot, dtype=np.float16))
-
-        prop_dict[prop_name] = np.stack(property_array, axis=0)
-
-    return prop_dict
+    return get_mols_atomic_features_onehot([mol], property_list)
 
 
 def get_mol_conformer_features(
@@ -1069,15 +1167,7 @@ def mol_to_graph_dict(
 
     input_mol = mol
     try:
-        if isinstance(mol, str):
-            mol = dm.to_mol(mol, ordered=True)
-        if explicit_H:
-            mol = Chem.AddHs(mol)
-        else:
-            mol = Chem.RemoveHs(mol)
-        num_atoms = mol.GetNumAtoms()
-        if (max_num_atoms is not None) and (num_atoms > max_num_atoms):
-            raise ValueError(f"Maximum number of atoms greater than permitted {num_atoms}>{max_num_atoms}")
+        mol = _prepare_mol(mol, explicit_H=explicit_H, max_num_atoms=max_num_atoms)
         (
             adj,
             ndata,
@@ -1097,17 +1187,7 @@ def mol_to_graph_dict(
             mask_nan=mask_nan,
         )
     except Exception as e:
-        if on_error.lower() == "raise":
-            raise e
-        elif on_error.lower() == "warn":
-            smiles = input_mol
-            if isinstance(smiles, dm.Mol):
-                smiles = Chem.MolToSmiles(input_mol)
-            msg = str(e) + "\nIgnoring following molecule:" + smiles
-            logger.warning(msg)
-            return str(e)
-        elif on_error.lower() == "ignore":
-            return str(e)
+        return _handle_featurization_error(e, input_mol, on_error)
 
     graph_dict = {"adj": adj, "data": {}, "dtype": dtype}
 
@@ -1135,6 +1215,181 @@ def mol_to_graph_dict(
     return graph_dict
 
 
+def _prepare_mol(mol: Union[str, dm.Mol], explicit_H: bool, max_num_atoms: Optional[int]) -> dm.Mol:
+    r"""
+    Parse a molecule, add or remove its explicit hydrogens, and check its number of atoms.
+    See `mol_to_graph_dict` for the parameters.
+    """
+    if isinstance(mol, str):
+        mol = dm.to_mol(mol, ordered=True)
+    if explicit_H:
+        mol = Chem.AddHs(mol)
+    else:
+        mol = Chem.RemoveHs(mol)
+    num_atoms = mol.GetNumAtoms()
+    if (max_num_atoms is not None) and (num_atoms > max_num_atoms):
+        raise ValueError(f"Maximum number of atoms greater than permitted {num_atoms}>{max_num_atoms}")
+    return mol
+
+
+def _add_mols_atomic_features_onehot(
+    graph_dicts: List[GraphDict], mols: List[dm.Mol], property_list: List[str]
+) -> None:
+    r"""
+    Compute the one-hot atomic features of a chunk of molecules with `get_mols_atomic_features_onehot`,
+    split them by number of atoms, and append them to the node features of the `GraphDict` of each
+    molecule, after the float features, as done by `mol_to_adj_and_features`.
+    The `GraphDict` are only modified once the features of all the molecules are computed.
+    """
+    onehot = list(get_mols_atomic_features_onehot(mols, property_list).values())
+    onehot = np.concatenate([d[:, np.newaxis] if d.ndim == 1 else d for d in onehot], axis=1)
+    splits = np.cumsum([mol.GetNumAtoms() for mol in mols])[:-1]
+    feats = []
+    for graph_dict, mol_onehot in zip(graph_dicts, np.split(onehot, splits)):
+        feat = graph_dict["data"].get("feat", None)
+        feats.append(mol_onehot if feat is None else np.concatenate([feat, mol_onehot], axis=1))
+
+    for graph_dict, feat in zip(graph_dicts, feats):
+        # The node features are the first key of the data, as in `mol_to_graph_dict`
+        data = {key: val for key, val in graph_dict["data"].items() if key != "feat"}
+        graph_dict["data"] = {"feat": feat, **data}
+
+
+def _handle_featurization_error(e: Exception, input_mol: Union[str, dm.Mol], on_error: str) -> str:
+    r"""
+    Raise, warn or ignore an error of featurization, according to `on_error`.
+    See `mol_to_graph_dict` for the options.
+
+    Returns:
+        The error message, when the error is not raised
+    """
+    if on_error.lower() == "raise":
+        raise e
+    elif on_error.lower() == "warn":
+        smiles = input_mol
+        if isinstance(smiles, dm.Mol):
+            smiles = Chem.MolToSmiles(input_mol)
+        msg = str(e) + "\nIgnoring following molecule:" + smiles
+        logger.warning(msg)
+        return str(e)
+    elif on_error.lower() == "ignore":
+        return str(e)
+
+
+def mol_to_graph_dict_batch(
+    mols: List[Union[str, dm.Mol]],
+    atom_property_list_onehot: List[str] = [],
+    atom_property_list_float: List[Union[str, Callable]] = [],
+    conformer_property_list: List[str] = [],
+    edge_property_list: List[str] = [],
+    add_self_loop: bool = False,
+    explicit_H: bool = False,
+    use_bonds_weights: bool = False,
+    pos_encoding_as_features: Dict[str, Any] = None,
+    dtype: np.dtype = np.float16,
+    on_error: str = "ignore",
+    mask_nan: Union[str, float, type(None)] = "raise",
+    max_num_atoms: Optional[int] = None,
+) -> List[Union[GraphDict, str]]:
+    r"""
+    Transforms a list of molecules into `GraphDict`, with the same outputs as
+    calling `mol_to_graph_dict` on each molecule.
+
+    The one-hot atomic features are computed together for the atoms of all the molecules
+    with `get_mols_atomic_features_onehot`, then split by number of atoms.
+    The positional encodings are computed together for the whole list with
+    `get_all_positional_encodings_batch`, which stacks the graphs of the same size
+    to compute the random-walks, Laplacian eigendecompositions and pseudo-inverses
+    in a few batched operations instead of one call per molecule.
+    If a batched computation fails, it falls back to the per-molecule computation.
+
+    Parameters:
+        mols: The molecules to be converted
+        others: See `mol_to_graph_dict`
+
+    Returns:
+        graph_dicts:
+            A `GraphDict` for each molecule, or a string with the error if the
+            featurization of the molecule failed.
+    """
+
+    # The molecules are parsed here, such that their one-hot atomic features can be computed together
+    batch_onehot = len(atom_property_list_onehot) > 0
+    graph_dicts, prepared_mols = [], []
+    for mol in mols:
+        try:
+            prepared_mol = _prepare_mol(mol, explicit_H=explicit_H, max_num_atoms=max_num_atoms)
+        except Exception as e:
+            graph_dicts.append(_handle_featurization_error(e, mol, on_error))
+            prepared_mols.append(None)
+            continue
+        graph_dict = mol_to_graph_dict(
+            mol=prepared_mol,
+            atom_property_list_onehot=[] if batch_onehot else atom_property_list_onehot,
+            atom_property_list_float=atom_property_list_float,
+            conformer_property_list=conformer_property_list,
+            edge_property_list=edge_property_list,
+            add_self_loop=add_self_loop,
+            explicit_H=explicit_H,
+            use_bonds_weights=use_bonds_weights,
+            pos_encoding_as_features=None,
+            dtype=dtype,
+            on_error=on_error,
+            mask_nan=mask_nan,
+            max_num_atoms=max_num_atoms,
+        )
+        graph_dicts.append(graph_dict)
+        prepared_mols.append(prepared_mol)
+
+    idx_valid = [ii for ii, graph_dict in enumerate(graph_dicts) if isinstance(graph_dict, GraphDict)]
+    if batch_onehot and (len(idx_valid) > 0):
+        try:
+            _add_mols_atomic_features_onehot(
+                [graph_dicts[ii] for ii in idx_valid],
+                [prepared_mols[ii] for ii in idx_valid],
+                atom_property_list_onehot,
+            )
+        except Exception:
+            for ii in idx_valid:
+                try:
+                    _add_mols_atomic_features_onehot(
+                        [graph_dicts[ii]], [prepared_mols[ii]], atom_property_list_onehot
+                    )
+                except Exception as e:
+                    graph_dicts[ii] = _handle_featurization_error(e, mols[ii], on_error)
+            idx_valid = [ii for ii in idx_valid if isinstance(graph_dicts[ii], GraphDict)]
+
+    if (pos_encoding_as_features is None) or (len(pos_encoding_as_features) == 0):
+        return graph_dicts
+
+    adjs = [graph_dicts[ii]["adj"] for ii in idx_valid]
+    num_nodes = [adj.shape[0] for adj in adjs]
+    try:
+        pe_dicts = get_all_positional_encodings_batch(adjs, num_nodes, pos_encoding_as_features)
+    except Exception:
+        pe_dicts = [None] * len(idx_valid)
+
+    for ii, adj, this_num_nodes, pe_dict in zip(idx_valid, adjs, num_nodes, pe_dicts):
+        graph_dict = graph_dicts[ii]
+        try:
+            if pe_dict is None:
+                pe_dict = get_all_positional_encodings(adj, this_num_nodes, pos_encoding_as_features)
+            for pe_key, pe_val in pe_dict.items():
+                pe_val = np.asarray(pe_val, dtype=dtype)
+                pe_dict[pe_key] = _mask_nans_inf(mask_nan, pe_val, pe_key)
+        except Exception as e:
+            graph_dicts[ii] = _handle_featurization_error(e, mols[ii], on_error)
+            continue
+
+        # Same ordering of the data as `mol_to_graph_dict`, with the positional encodings before the conformer
+        conf_keys = [key for key in conformer_property_list if key in graph_dict["data"]]
+        conf_dict = {key: graph_dict["data"].pop(key) for key in conf_keys}
+        graph_dict["data"].update(pe_dict)
+        graph_dict["data"].update(conf_dict)
+
+    return graph_dicts
+
+
 def mol_to_pyggraph(
     mol: dm.Mol,
     atom_property_list_onehot: List[str] = [],
@@ -1249,6 +1504,146 @@ def mol_to_pyggraph(
         return graph_dict
 
 
+def mol_to_pyggraph_batch(
+    mols: List[Union[str, dm.Mol]],
+    atom_property_list_onehot: List[str] = [],
+    atom_property_list_float: List[Union[str, Callable]] = [],
+    conformer_property_list: List[str] = [],
+    edge_property_list: List[str] = [],
+    add_self_loop: bool = False,
+    explicit_H: bool = False,
+    use_bonds_weights: bool = False,
+    pos_encoding_as_features: Dict[str, Any] = None,
+    dtype: np.dtype = np.float16,
+    on_error: str = "ignore",
+    mask_nan: Union[str, float, type(None)] = "raise",
+    max_num_atoms: Optional[int] = None,
+) -> List[Union[Data, str]]:
+    r"""
+    Transforms a list of molecules into PyG graphs, with the same outputs as
+    calling `mol_to_pyggraph` on each molecule, but with the positional encodings
+    computed in batch. See `mol_to_graph_dict_batch`.
+
+    Parameters:
+        mols: The molecules to be converted
+        others: See `mol_to_pyggraph`
+
+    Returns:
+        graphs:
+            A PyG graph for each molecule, or a string with the error if the
+            featurization of the molecule failed.
+    """
+    graph_dicts = mol_to_graph_dict_batch(
+        mols=mols,
+        atom_property_list_onehot=atom_property_list_onehot,
+        atom_property_list_float=atom_property_list_float,
+        conformer_property_list=conformer_property_list,
+        edge_property_list=edge_property_list,
+        add_self_loop=add_self_loop,
+        explicit_H=explicit_H,
+        use_bonds_weights=use_bonds_weights,
+        pos_encoding_as_features=pos_encoding_as_features,
+        dtype=dtype,
+        on_error=on_error,
+        mask_nan=mask_nan,
+        max_num_atoms=max_num_atoms,
+    )
+
+    return [
+        graph_dict.make_pyg_graph() if isinstance(graph_dict, GraphDict) else graph_dict
+        for graph_dict in graph_dicts
+    ]
+
+
+class PositionalEncodingTransform:
+    def __init__(
+        self,
+        pos_encoding_as_features: Dict[str, Any],
+        dtype: np.dtype = np.float16,
+        mask_nan: Union[str, float, type(None)] = "raise",
+        cache_size: int = 0,
+    ):
+        r"""
+        Add the positional encodings to an already featurized graph, such that they can be
+        computed on demand when loading the data, instead of being computed during the
+        featurization and stored in the cache. This is useful for the nodepair encodings,
+        which take O(num_nodes^2) memory per molecule.
+
+        Parameters:
+            pos_encoding_as_features: keyword arguments for function `graph_positional_encoder`
+                to generate positional encoding for node features. See `mol_to_graph_dict`.
+            dtype: The numpy data type of the positional encodings
+            mask_nan: How to deal with NaNs in the positional encodings. See `mol_to_graph_dict`.
+                Molecules with NaNs are not filtered out as during the featurization, so an error
+                is raised when loading them with `"raise"`.
+            cache_size: Maximum number of positional encodings to keep in a least-recently-used cache,
+                keyed by the `key` provided when calling the transform. The cache is not shared
+                between processes, such that each dataloader worker has its own. `0` to disable.
+        """
+        self.pos_encoding_as_features = pos_encoding_as_features
+        self.dtype = dtype
+        self.mask_nan = mask_nan
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __getstate__(self):
+        """Serialize the transform for pickling, without the cached positional encodings."""
+        state = self.__dict__.copy()
+        state["_cache"] = OrderedDict()
+        return state
+
+    def __copy__(self) -> "PositionalEncodingTransform":
+        """Copy the transform with an empty cache, such that the copies never share their keys."""
+        other = self.__class__.__new__(self.__class__)
+        other.__dict__.update(self.__getstate__())
+        return other
+
+    def __call__(self, graph: Union[Data, GraphDict], key: Optional[Any] = None) -> Union[Data, GraphDict]:
+        r"""
+        Compute the positional encodings of a graph.
+
+        Parameters:
+            graph: The featurized graph, without the positional encodings. It is not modified.
+            key: The key of the graph in the LRU cache, such as its index in the dataset
+
+        Returns:
+            graph: A shallow copy of the graph, with the positional encodings added
+        """
+        pe_dict = None
+        if (key is not None) and (key in self._cache):
+            pe_dict = self._cache[key]
+            self._cache.move_to_end(key)
+
+        if pe_dict is None:
+            pe_dict = self._compute(graph)
+            if (key is not None) and (self.cache_size > 0):
+                self._cache[key] = pe_dict
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        graph = copy(graph)
+        for pe_key, pe_val in pe_dict.items():
+            graph[pe_key] = torch.as_tensor(pe_val) if isinstance(graph, Data) else pe_val
+        return graph
+
+    def _compute(self, graph: Union[Data, GraphDict]) -> Dict[str, np.ndarray]:
+        """Compute the positional encodings from the adjacency matrix of the graph"""
+        if isinstance(graph, Data):
+            num_nodes = graph.num_nodes
+            row, col = graph.edge_index.numpy()
+            edge_weight = graph.get("edge_weight", None)
+            edge_weight = np.ones(len(row)) if edge_weight is None else edge_weight.numpy()
+            adj = coo_matrix((edge_weight, (row, col)), shape=(num_nodes, num_nodes))
+        else:
+            adj, num_nodes = graph.adj, graph.num_nodes
+
+        pe_dict = get_all_positional_encodings(adj, num_nodes, self.pos_encoding_as_features)
+        for pe_key, pe_val in pe_dict.items():
+            pe_val = np.asarray(pe_val, dtype=self.dtype)
+            pe_dict[pe_key] = _mask_nans_inf(self.mask_nan, pe_val, pe_key)
+        return pe_dict
+
+
 def mol_to_graph_signature(featurizer_args: Dict[str, Any] = None) -> Dict[str, Any]:
     """
     Get the default arguments of `mol_to_graph_dict` and update it
@@ -11,18 +11,26 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Tuple, Union, Optional, Dict, Any, OrderedDict
+from typing import Tuple, Union, Optional, Dict, Any, OrderedDict, List
 from copy import deepcopy
 import numpy as np
 import torch
-from scipy.sparse import spmatrix
+from scipy.sparse import spmatrix, issparse, csr_matrix
+from scipy.sparse.csgraph import connected_components
 from collections import OrderedDict as OderedDictClass
 
-from graphium.features.spectral import compute_laplacian_pe
-from graphium.features.rw import compute_rwse
-from graphium.features.electrostatic import compute_electrostatic_interactions
-from graphium.features.commute import compute_commute_distances
-from graphium.features.graphormer import compute_graphormer_distances
+from graphium.features.spectral import (
+    compute_laplacian_pe,
+    get_laplacian_eigvecs_batch,
+    get_laplacian_pinv_batch,
+)
+from graphium.features.rw import compute_rwse, get_Pks_batch
+from graphium.features.electrostatic import (
+    compute_electrostatic_interactions,
+    compute_electrostatic_interactions_batch,
+)
+from graphium.features.commute import compute_commute_distances, compute_commute_distances_batch
+from graphium.features.graphormer import compute_graphormer_distances, get_shortest_path_distances_batch
 from graphium.features.transfer_pos_level import transfer_pos_level
 
 
@@ -30,6 +38,7 @@ def get_all_positional_encodings(
     adj: Union[np.ndarray, spmatrix],
     num_nodes: int,
     pos_kwargs: Optional[Dict] = None,
+    cache: Optional[Dict[str, Any]] = None,
 ) -> Tuple["OrderedDict[str, np.ndarray]"]:
     r"""
     Get features positional encoding.
@@ -39,6 +48,7 @@ def get_all_positional_encodings(
         num_nodes: Number of nodes in the graph
         pos_encoding_as_features: keyword arguments for function `graph_positional_encoder`
             to generate positional encoding for node features.
+        cache: Dictionary of cached objects, possibly pre-computed by `get_all_positional_encodings_batch`
 
     Returns:
         pe_dict: Dictionary of positional and structural encodings
@@ -49,16 +59,18 @@ def get_all_positional_encodings(
     pe_dict = OderedDictClass()
 
     # Initialize cache
-    cache = {}
+    cache = {} if cache is None else cache
 
     # Get the positional encoding for the features
     if len(pos_kwargs) > 0:
+        # The adjacency is converted once, and never modified by the positional encoders
+        adj = _to_float64_adj(adj)
         for pos_name, this_pos_kwargs in pos_kwargs["pos_types"].items():
             this_pos_kwargs = deepcopy(this_pos_kwargs)
             pos_type = this_pos_kwargs.pop("pos_type", None)
             pos_level = this_pos_kwargs.pop("pos_level", None)
             this_pe, cache = graph_positional_encoder(
-                deepcopy(adj),
+                adj,
                 num_nodes,
                 pos_type=pos_type,
                 pos_level=pos_level,
@@ -134,11 +146,7 @@ def graph_positional_encoder(
     assert pos_level is not None, "Either `pos_level` or `pos_kwargs['pos_level']` must be provided."
 
     # Convert to numpy array
-    if isinstance(adj, torch.sparse.Tensor):
-        adj = adj.to_dense().numpy()
-    elif isinstance(adj, torch.Tensor):
-        adj = adj.numpy()
-    adj = adj.astype(np.float64)
+    adj = _to_float64_adj(adj)
 
     # Calculate positional encoding
     if pos_type == "laplacian_eigvec":
@@ -178,3 +186,125 @@ def graph_positional_encoder(
         pe = transfer_pos_level(pe, base_level, pos_level, adj, num_nodes, cache)
 
     return pe, cache
+
+
+def _to_float64_adj(adj: Union[np.ndarray, spmatrix, torch.Tensor]) -> Union[np.ndarray, spmatrix]:
+    """Convert the adjacency to a float64 numpy array or sparse matrix, without copying if already float64"""
+    if isinstance(adj, torch.sparse.Tensor):
+        adj = adj.to_dense().numpy()
+    elif isinstance(adj, torch.Tensor):
+        adj = adj.numpy()
+    return adj.astype(np.float64, copy=False)
+
+
+def get_all_positional_encodings_batch(
+    adjs: List[Union[np.ndarray, spmatrix]],
+    num_nodes: List[int],
+    pos_kwargs: Optional[Dict] = None,
+) -> List["OrderedDict[str, np.ndarray]"]:
+    r"""
+    Get features positional encoding for a chunk of graphs.
+
+    The graphs are grouped by number of nodes, and the random-walk powers, Laplacian
+    eigendecompositions and Laplacian pseudo-inverses are computed with stacked operations
+    for each group. They are then split back into the cache of each graph, from which
+    `get_all_positional_encodings` computes the final encodings.
+
+    Parameters:
+        adjs: Adjacency matrices of the graphs, each of shape [num_nodes, num_nodes]
+        num_nodes: Number of nodes in each graph
+        pos_kwargs: keyword arguments for function `graph_positional_encoder`
+            to generate positional encoding for node features.
+
+    Returns:
+        pe_dicts: Dictionary of positional and structural encodings for each graph
+    """
+
+    pos_kwargs = {} if pos_kwargs is None else pos_kwargs
+    adjs = [_to_float64_adj(adj) for adj in adjs]
+    caches = [{} for _ in adjs]
+
+    if len(pos_kwargs) > 0:
+        groups = {}
+        for idx, this_num_nodes in enumerate(num_nodes):
+            groups.setdefault(this_num_nodes, []).append(idx)
+        pos_types = [deepcopy(this_pos_kwargs) for this_pos_kwargs in pos_kwargs["pos_types"].values()]
+        for this_num_nodes, group in groups.items():
+            group_adjs = [adjs[idx] for idx in group]
+            _fill_caches_batch(group_adjs, this_num_nodes, pos_types, [caches[idx] for idx in group])
+
+    return [
+        get_all_positional_encodings(adj, this_num_nodes, pos_kwargs, cache=cache)
+        for adj, this_num_nodes, cache in zip(adjs, num_nodes, caches)
+    ]
+
+
+def _fill_caches_batch(
+    adjs: List[Union[np.ndarray, spmatrix]],
+    num_nodes: int,
+    pos_types: List[Dict[str, Any]],
+    caches: List[Dict[str, Any]],
+) -> None:
+    r"""
+    Fill the caches of a group of graphs of the same size with the objects that are shared by
+    the positional encodings, computed with stacked operations. Objects that cannot be batched,
+    such as the eigendecomposition of graphs with disconnected components, are left to
+    the per-graph positional encoders.
+
+    Parameters:
+        adjs: Adjacency matrices of the graphs
+        num_nodes: Number of nodes of every graph of the group
+        pos_types: The keyword arguments of each positional encoding
+        caches: The cache of each graph, updated in place
+    """
+
+    dense_adjs = np.stack([adj.toarray() if issparse(adj) else adj for adj in adjs], axis=0)
+
+    # Random-walk transition probabilities, for all the steps of all the random-walk encodings
+    rw_ksteps = []
+    for this_pos_kwargs in pos_types:
+        if this_pos_kwargs.get("pos_type") in ["rw_return_probs", "rw_transition_probs"]:
+            ksteps = this_pos_kwargs["ksteps"]
+            rw_ksteps.extend(ksteps if isinstance(ksteps, (list, tuple)) else range(1, ksteps + 1))
+    if (len(rw_ksteps) > 0) and (num_nodes > 1):
+        Pk_dict = get_Pks_batch(dense_adjs, rw_ksteps)
+        for ii, cache in enumerate(caches):
+            cache["ksteps"] = list(Pk_dict.keys())
+            cache["Pk"] = {k: Pk[ii] for k, Pk in Pk_dict.items()}
+
+    # Laplacian eigendecomposition, computed by the first Laplacian encoding and re-used by the others
+    lap_kwargs = [kw for kw in pos_types if kw.get("pos_type") in ["laplacian_eigvec", "laplacian_eigval"]]
+    if len(lap_kwargs) > 0:
+        disconnected_comp = lap_kwargs[0].get("disconnected_comp", True)
+        connected = np.ones(len(adjs), dtype=bool)
+        if disconnected_comp:
+            num_comps = [connected_components(csr_matrix(adj), directed=False)[0] for adj in dense_adjs]
+            connected = np.asarray(num_comps) == 1
+        if connected.any():
+            eigvals, eigvecs = get_laplacian_eigvecs_batch(dense_adjs[connected], lap_kwargs[0]["num_pos"])
+            for ii, idx in enumerate(np.flatnonzero(connected)):
+                caches[idx]["lap_eig"] = (eigvals[ii], eigvecs[ii])
+                if disconnected_comp:
+                    caches[idx]["components"] = [set(range(num_nodes))]
+
+    # Shortest-path distances. Graphs with disconnected components are left to the per-graph encoder.
+    if any(kw.get("pos_type") == "graphormer" for kw in pos_types):
+        dist = get_shortest_path_distances_batch(dense_adjs)
+        for ii, cache in enumerate(caches):
+            if np.isfinite(dist[ii]).all():
+                cache["graphormer"] = dist[ii].astype(np.int64)
+
+    # Pseudo-inverse of the Laplacian, shared by the commute and electrostatic encodings
+    pinv_types = set(kw.get("pos_type") for kw in pos_types) & {"commute", "electrostatic"}
+    if len(pinv_types) > 0:
+        pinvL = get_laplacian_pinv_batch(dense_adjs)
+        commute = compute_commute_distances_batch(dense_adjs, pinvL) if "commute" in pinv_types else None
+        electrostatic = None
+        if "electrostatic" in pinv_types:
+            electrostatic = compute_electrostatic_interactions_batch(dense_adjs, pinvL)
+        for ii, cache in enumerate(caches):
+            cache["pinvL"] = pinvL[ii]
+            if commute is not None:
+                cache["commute"] = commute[ii]
+            if electrostatic is not None:
+                cache["electrostatic"] = electrostatic[ii]
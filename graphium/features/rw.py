@@ -166,3 +166,31 @@ def get_Pks(
         Pk = Pk @ P
 
     return Pk_dict
+
+
+def get_Pks_batch(adjs: np.ndarray, ksteps: List[int]) -> Dict[int, torch.Tensor]:
+    """
+    Compute Random Walk landing probabilities for a batch of graphs of the same size,
+    with stacked matrix products. Equivalent to calling `get_Pks` on each graph.
+
+    Parameters:
+        adjs [batch, num_nodes, num_nodes]: Dense adjacency matrices of the graphs
+        ksteps: List of numbers of k-steps for which to compute the RW landings
+
+    Returns:
+        Dictionary with the k-steps as keys, and the RW landing probs of shape
+        [batch, num_nodes, num_nodes] as values, for all k-steps between `min(ksteps)` and `max(ksteps)`
+    """
+    # Out degrees are weighted, while the transitions only use the edges, as in `get_Pks`
+    with np.errstate(divide="ignore"):
+        deg_inv = 1.0 / adjs.sum(axis=-1)
+    deg_inv[np.isinf(deg_inv)] = 0
+    P = torch.from_numpy(deg_inv.astype(np.float32)[:, :, None] * (adjs != 0).astype(np.float32))
+
+    Pk = torch.linalg.matrix_power(P, min(ksteps))
+    Pk_dict = {}
+    for k in range(min(ksteps), max(ksteps) + 1):
+        Pk_dict[k] = Pk
+        Pk = Pk @ P
+
+    return Pk_dict
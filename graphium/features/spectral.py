@@ -12,7 +12,7 @@ Refer to the LICENSE file for the full terms and conditions.
 """
 
 from typing import Tuple, Union, Dict, Any
-from scipy.linalg import eig
+from scipy.linalg import eig, pinv
 from scipy.sparse import csr_matrix, diags, issparse, spmatrix
 import numpy as np
 import torch
@@ -155,6 +155,87 @@ def _get_positional_eigvecs(
     return eigvals, eigvecs
 
 
+def get_laplacian_eigvecs_batch(adjs: np.ndarray, num_pos: int) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Compute the eigenvalues and eigenvectors of the (non-normalized) Laplacian of a batch of
+    connected graphs of the same size, with a stacked eigendecomposition. Equivalent to
+    the single-component path of `compute_laplacian_pe`.
+
+    Parameters:
+        adjs [batch, num_nodes, num_nodes]: Dense adjacency matrices of the graphs
+        num_pos: Number of eigenvalues and eigenvectors to compute
+
+    Returns:
+        eigvals [batch, num_nodes, num_pos]: Eigenvalues of the Laplacian repeated for each node
+        eigvecs [batch, num_nodes, num_pos]: Eigenvectors of the Laplacian
+    """
+    batch, mat_len = adjs.shape[0], adjs.shape[-1]
+    L = -adjs + np.eye(mat_len)[None, :, :] * adjs.sum(axis=-1)[:, None, :]
+    eigvals, eigvecs = np.linalg.eig(L)
+    eigvals = eigvals.astype(np.complex128)  # Sorted as complex, like `scipy.linalg.eig`
+
+    # Pad with non-sense eigenvectors if required
+    if num_pos > mat_len:
+        temp_EigVal = np.ones((batch, num_pos - mat_len), dtype=np.float64) + float("inf")
+        temp_EigVec = np.zeros((batch, mat_len, num_pos - mat_len), dtype=np.float64)
+        eigvals = np.concatenate([eigvals, temp_EigVal], axis=-1)
+        eigvecs = np.concatenate([eigvecs, temp_EigVec], axis=-1)
+
+    # Sort and keep only the first `num_pos` elements
+    sort_idx = eigvals.argsort(axis=-1)
+    eigvals = np.take_along_axis(eigvals, sort_idx, axis=-1)[:, :num_pos]
+    eigvecs = np.take_along_axis(eigvecs, sort_idx[:, None, :], axis=-1)[:, :, :num_pos]
+
+    # Normalize the eigvecs
+    eigvecs = eigvecs / np.maximum(np.sqrt(np.sum(eigvecs**2, axis=-2, keepdims=True)), 1e-4)
+
+    # Eigenvalues previously set to infinity are now set to 0
+    # Any NaN in the eigvals or eigvecs will be set to 0
+    eigvecs[~np.isfinite(eigvecs)] = 0.0
+    eigvals[~np.isfinite(eigvals)] = 0.0
+    eigvals = np.repeat(np.expand_dims(eigvals, axis=1), mat_len, axis=1)
+
+    return eigvals, eigvecs
+
+
+def get_laplacian_pinv(adj: Union[np.ndarray, spmatrix], cache: Dict[str, Any]) -> np.ndarray:
+    r"""
+    Get the pseudo-inverse of the (non-normalized) Laplacian of the graph,
+    shared by the commute and electrostatic encodings through the cache.
+
+    Parameters:
+        adj [num_nodes, num_nodes]: Adjacency matrix of the graph
+        cache: Dictionary of cached objects, updated with the key `"pinvL"`
+
+    Returns:
+        pinvL [num_nodes, num_nodes]: Pseudo-inverse of the Laplacian
+    """
+    if "pinvL" not in cache:
+        if issparse(adj):
+            adj = adj.toarray()
+        L = np.diagflat(np.sum(adj, axis=1)) - adj
+        cache["pinvL"] = pinv(L)
+    return cache["pinvL"]
+
+
+def get_laplacian_pinv_batch(adjs: np.ndarray) -> np.ndarray:
+    r"""
+    Compute the pseudo-inverse of the (non-normalized) Laplacian of a batch of graphs
+    of the same size, with a stacked `numpy.linalg.pinv`. Equivalent to calling
+    `get_laplacian_pinv` on each graph.
+
+    Parameters:
+        adjs [batch, num_nodes, num_nodes]: Dense adjacency matrices of the graphs
+
+    Returns:
+        pinvL [batch, num_nodes, num_nodes]: Pseudo-inverse of the Laplacian of each graph
+    """
+    num_nodes = adjs.shape[-1]
+    L = -adjs + np.eye(num_nodes)[None, :, :] * adjs.sum(axis=-1)[:, None, :]
+    # Same cutoff on the singular values as `scipy.linalg.pinv`
+    return np.linalg.pinv(L, rcond=num_nodes * np.finfo(np.float64).eps)
+
+
 def normalize_matrix(
     matrix: Union[np.ndarray, spmatrix],
     degree_vector=None,
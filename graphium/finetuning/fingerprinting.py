@@ -11,15 +11,198 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
+import json
+import os
+
+import numpy as np
 import torch
 
 from collections import defaultdict
-from typing import Literal, Union, List
+from typing import Any, Dict, Iterable, List, Literal, Optional, Tuple, Union
 
 import tqdm
+from loguru import logger
 
 from graphium.nn.architectures.global_architectures import FullGraphMultiTaskNetwork
 from graphium.trainer.predictor import PredictorModule
+from graphium.utils.fs import start_resumable_write
+
+FINGERPRINT_WRITER_MANIFEST_FILE = "writer.json"
+FINGERPRINT_INDEX_FILE = "fingerprints.json"
+
+# Names of the shard and index files written by `FingerprintShardWriter`
+_WRITER_OWNED_PATTERNS = ["*.npy", "*.json", "*.tmp"]
+
+
+class FingerprintShardWriter:
+    def __init__(self, path: Union[str, os.PathLike], shard_size: int = 1_000_000):
+        r"""
+        Write fingerprints into `.npy` shards of `shard_size` rows as they are computed,
+        such that the fingerprints of a full dataset never need to fit in memory.
+
+        The position of the next row in the stream of batches is saved with each shard,
+        such that an interrupted write can be resumed from the last completed shard.
+        Once finalized, the shards can be memory-mapped with `load_fingerprint_shards`.
+
+        Parameters:
+            path: The local folder in which to write the shards
+            shard_size: The number of fingerprints per shard. Only the last shard can be smaller.
+        """
+        if shard_size <= 0:
+            raise ValueError(f"`shard_size` must be a positive integer, provided `{shard_size}`")
+        self.path = str(path)
+        self.shard_size = shard_size
+        self._num_shards = 0
+        self._num_rows = 0
+        self._buffer: List[Tuple[np.ndarray, int, int]] = []
+        self._num_buffered = 0
+
+    def shard_path(self, shard_idx: int) -> str:
+        """Path of the `.npy` file of a given shard"""
+        return os.path.join(self.path, format(shard_idx, "05d") + ".npy")
+
+    def _shard_info_path(self, shard_idx: int) -> str:
+        return os.path.join(self.path, format(shard_idx, "05d") + ".json")
+
+    def start(self, manifest: Optional[Dict[str, Any]] = None, resume: bool = True) -> Tuple[int, int]:
+        r"""
+        Prepare the folder of the shards, and find where to resume a previous write.
+
+        Parameters:
+            manifest: Any information identifying the fingerprints, e.g. the fingerprint specification.
+                The shards of a previous write are only kept if it had the same manifest and shard size.
+            resume: Whether to keep the shards completed by a previous write.
+                Otherwise, the shards and index files are removed. A non-empty folder
+                that was not written by a `FingerprintShardWriter` is refused.
+
+        Returns:
+            batch_idx: The index of the first batch that still needs to be fingerprinted
+            offset: The number of fingerprints of that batch that are already written
+        """
+        start_resumable_write(
+            self.path,
+            {"shard_size": self.shard_size, "manifest": manifest},
+            manifest_file=FINGERPRINT_WRITER_MANIFEST_FILE,
+            index_file=FINGERPRINT_INDEX_FILE,
+            owned_patterns=_WRITER_OWNED_PATTERNS,
+            resume=resume,
+        )
+
+        # Only the first contiguous completed shards are kept, the following ones are written again
+        self._num_shards, self._num_rows, next_position = 0, 0, (0, 0)
+        while os.path.isfile(self._shard_info_path(self._num_shards)):
+            with open(self._shard_info_path(self._num_shards), "r") as f:
+                shard_info = json.load(f)
+            self._num_shards += 1
+            self._num_rows += shard_info["num_rows"]
+            next_position = (shard_info["next_batch"], shard_info["next_offset"])
+        self._buffer, self._num_buffered = [], 0
+
+        if self._num_shards > 0:
+            logger.info(f"Resuming after {self._num_shards} completed shards of fingerprints")
+        return next_position
+
+    def append(self, fingerprints: np.ndarray, batch_idx: int, offset: int = 0) -> None:
+        r"""
+        Add the fingerprints of a batch, and write all the shards that are full.
+
+        Parameters:
+            fingerprints: The fingerprints of the batch, with one row per fingerprint
+            batch_idx: The index of the batch
+            offset: The index, within the batch, of the first row of `fingerprints`.
+                Non-zero when the first rows of the batch were written before resuming.
+        """
+        if len(fingerprints) > 0:
+            self._buffer.append((fingerprints, batch_idx, offset))
+            self._num_buffered += len(fingerprints)
+        while self._num_buffered >= self.shard_size:
+            self._write_shard(self.shard_size, next_position=self._buffer_position(self.shard_size))
+
+    def _buffer_position(self, num_rows: int) -> Tuple[int, int]:
+        """Position `(batch_idx, offset)` of the row following the first `num_rows` buffered rows"""
+        for fingerprints, batch_idx, offset in self._buffer:
+            if num_rows < len(fingerprints):
+                return batch_idx, offset + num_rows
+            num_rows -= len(fingerprints)
+        return self._buffer[-1][1] + 1, 0
+
+    def _write_shard(self, num_rows: int, next_position: Tuple[int, int]) -> None:
+        r"""
+        Write the first `num_rows` buffered fingerprints. The shard is first written in a temporary file,
+        then renamed, and its information is written last, such that a shard is either complete or ignored.
+        """
+        arrays, remaining = [], num_rows
+        while remaining > 0:
+            fingerprints, batch_idx, offset = self._buffer.pop(0)
+            if len(fingerprints) > remaining:
+                self._buffer.insert(0, (fingerprints[remaining:], batch_idx, offset + remaining))
+                fingerprints = fingerprints[:remaining]
+            arrays.append(fingerprints)
+            remaining -= len(fingerprints)
+        self._num_buffered -= num_rows
+
+        shard_path = self.shard_path(self._num_shards)
+        with open(shard_path + ".tmp", "wb") as f:
+            np.save(f, np.concatenate(arrays, axis=0), allow_pickle=False)
+        os.replace(shard_path + ".tmp", shard_path)
+
+        shard_info = {"num_rows": num_rows, "next_batch": next_position[0], "next_offset": next_position[1]}
+        info_path = self._shard_info_path(self._num_shards)
+        with open(info_path + ".tmp", "w") as f:
+            json.dump(shard_info, f)
+        os.replace(info_path + ".tmp", info_path)
+
+        self._num_shards += 1
+        self._num_rows += num_rows
+
+    def finalize(self, num_batches: int) -> Dict[str, Any]:
+        r"""
+        Write the remaining fingerprints as a last, smaller shard, and the index of the shards.
+
+        Parameters:
+            num_batches: The total number of batches that were fingerprinted
+
+        Returns:
+            index: The index of the shards, also saved in the folder
+        """
+        if self._num_buffered > 0:
+            self._write_shard(self._num_buffered, next_position=(num_batches, 0))
+
+        index = {
+            "num_shards": self._num_shards,
+            "num_rows": self._num_rows,
+            "shard_sizes": [self._read_shard_info(ii)["num_rows"] for ii in range(self._num_shards)],
+        }
+        with open(os.path.join(self.path, FINGERPRINT_INDEX_FILE), "w") as f:
+            json.dump(index, f)
+        return index
+
+    def _read_shard_info(self, shard_idx: int) -> Dict[str, Any]:
+        with open(self._shard_info_path(shard_idx), "r") as f:
+            return json.load(f)
+
+
+def load_fingerprint_shards(
+    path: Union[str, os.PathLike], mmap_mode: Optional[str] = "r"
+) -> List[np.ndarray]:
+    r"""
+    Load the shards written by `FingerprintShardWriter`, in order.
+
+    Parameters:
+        path: The folder of the shards
+        mmap_mode: The memory-map mode of `np.load`. Use `None` to load the shards in memory.
+
+    Returns:
+        The fingerprints of each shard. Use `np.concatenate` to get a single array.
+    """
+    path = str(path)
+    index_path = os.path.join(path, FINGERPRINT_INDEX_FILE)
+    if not os.path.isfile(index_path):
+        raise FileNotFoundError(f"No finalized fingerprint shards found in `{path}`")
+    with open(index_path, "r") as f:
+        index = json.load(f)
+    writer = FingerprintShardWriter(path)
+    return [np.load(writer.shard_path(ii), mmap_mode=mmap_mode) for ii in range(index["num_shards"])]
 
 
 class Fingerprinter:
@@ -84,6 +267,13 @@ class Fingerprinter:
         with Fingerprinter(predictor, ["gcn:0", "gcn:1"], out_type="numpy") as fingerprinter:
             fps = fp.get_fingerprints_for_dataset(dataloader)
         ```
+
+        Streaming the fingerprints of a large dataset to `.npy` shards on disk:
+        ```python
+        with Fingerprinter(predictor, ["gcn:0", "gcn:1"]) as fingerprinter:
+            fp.write_fingerprints_for_dataset(dataloader, "path/to/shards", shard_size=1_000_000)
+        shards = load_fingerprint_shards("path/to/shards")
+        ```
     """
 
     def __init__(
@@ -122,6 +312,7 @@ class Fingerprinter:
 
         if isinstance(fingerprint_spec, str):
             fingerprint_spec = [fingerprint_spec]
+        self._fingerprint_spec = list(fingerprint_spec)
 
         self._spec = defaultdict(list)
         for spec_str in fingerprint_spec:
@@ -139,6 +330,11 @@ class Fingerprinter:
 
     def get_fingerprints_for_batch(self, batch):
         """Get the fingerprints for a single batch"""
+        feats = self._get_device_fingerprints_for_batch(batch).cpu()
+        return self._convert_output_type(feats)
+
+    def _get_device_fingerprints_for_batch(self, batch) -> torch.Tensor:
+        """Get the fingerprints for a single batch, on the device of the network"""
 
         if not self.network._cache_readouts:
             raise RuntimeError(
@@ -156,11 +352,10 @@ class Fingerprinter:
         readout_list = []
         for module_name, layers in self._spec.items():
             readout_list.extend(
-                [self.network._module_map[module_name]._readout_cache[layer].cpu() for layer in layers]
+                [self.network._module_map[module_name]._readout_cache[layer] for layer in layers]
             )
 
-        feats = torch.cat(readout_list, dim=-1)
-        return self._convert_output_type(feats)
+        return torch.cat(readout_list, dim=-1)
 
     def get_fingerprints_for_dataset(self, dataloader):
         """Return the fingerprints for an entire dataset"""
@@ -178,6 +373,82 @@ class Fingerprinter:
         self._out_type = original_out_type
         return self._convert_output_type(fps)
 
+    def write_fingerprints_for_dataset(
+        self,
+        dataloader: Iterable,
+        path: Union[str, os.PathLike],
+        shard_size: int = 1_000_000,
+        resume: bool = True,
+    ) -> Dict[str, Any]:
+        r"""
+        Stream the fingerprints of an entire dataset to `.npy` shards of `shard_size` rows,
+        without keeping them in memory. The copy of the fingerprints of a batch to the host
+        overlaps with the forward pass of the next batch.
+
+        If a previous write with the same fingerprint specification was interrupted, it is resumed
+        after its last completed shard. The batches before that point are still loaded from the
+        dataloader, but are not passed through the network. This requires the dataloader to
+        produce the batches in the same order, i.e. without shuffling.
+
+        Parameters:
+            dataloader: The dataloader of the dataset, expecting PyG batches
+            path: The folder in which to write the shards. See `FingerprintShardWriter`.
+            shard_size: The number of fingerprints per shard
+            resume: Whether to resume a previous write. Otherwise, the folder is cleared.
+
+        Returns:
+            index: The index of the written shards
+        """
+        writer = FingerprintShardWriter(path, shard_size=shard_size)
+        manifest = {"fingerprint_spec": self._fingerprint_spec}
+        start_batch, start_offset = writer.start(manifest=manifest, resume=resume)
+
+        pending = None
+        num_batches = 0
+        for batch_idx, batch in enumerate(tqdm.tqdm(dataloader, desc="Fingerprinting batches")):
+            num_batches = batch_idx + 1
+            if batch_idx < start_batch:
+                continue
+            offset = start_offset if batch_idx == start_batch else 0
+            feats = self._get_device_fingerprints_for_batch(batch)[offset:]
+            host_feats, copy_event = self._copy_to_host_async(feats)
+
+            # Wait for the copy of the previous batch only once the current one is launched
+            if pending is not None:
+                self._append_host_copy(writer, *pending)
+            pending = (host_feats, copy_event, batch_idx, offset)
+
+        if pending is not None:
+            self._append_host_copy(writer, *pending)
+        return writer.finalize(num_batches=num_batches)
+
+    @staticmethod
+    def _copy_to_host_async(feats: torch.Tensor) -> Tuple[torch.Tensor, Optional[Any]]:
+        """Start copying the fingerprints to pinned host memory, returning the copy and its CUDA event"""
+        if feats.device.type != "cuda":
+            return feats.cpu(), None
+        with torch.inference_mode():
+            host_feats = torch.empty(feats.shape, dtype=feats.dtype, pin_memory=True)
+            host_feats.copy_(feats, non_blocking=True)
+        event = torch.cuda.Event()
+        event.record()
+        return host_feats, event
+
+    @staticmethod
+    def _append_host_copy(
+        writer: FingerprintShardWriter,
+        host_feats: torch.Tensor,
+        copy_event: Optional[Any],
+        batch_idx: int,
+        offset: int,
+    ) -> None:
+        """Wait for the copy of the fingerprints of a batch to the host, then pass them to the writer"""
+        if copy_event is not None:
+            copy_event.synchronize()
+        if host_feats.dtype == torch.bfloat16:
+            host_feats = host_feats.float()  # Not supported by numpy
+        writer.append(host_feats.numpy(), batch_idx=batch_idx, offset=offset)
+
     def teardown(self):
         """Restore the network to its original state"""
         self.network._disable_readout_cache()
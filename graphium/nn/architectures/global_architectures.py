@@ -29,7 +29,7 @@ from omegaconf import DictConfig, OmegaConf
 
 # graphium imports
 from graphium.data.utils import get_keys
-from graphium.nn.base_layers import FCLayer, get_activation, get_norm
+from graphium.nn.base_layers import FCLayer, MuReadoutGraphium, get_activation, get_norm
 from graphium.nn.architectures.encoder_manager import EncoderManager
 from graphium.nn.pyg_layers import VirtualNodePyg, parse_pooling_layer_pyg
 from graphium.nn.base_graph_layer import BaseGraphModule, BaseGraphStructure
@@ -37,6 +37,7 @@ from graphium.nn.residual_connections import (
     ResidualConnectionBase,
     ResidualConnectionWeighted,
     ResidualConnectionRandom,
+    ResidualConnectionNone,
 )
 from graphium.nn.utils import MupMixin
 from graphium.ipu.ipu_utils import import_poptorch, is_running_on_ipu
@@ -1364,6 +1365,7 @@ class FullGraphMultiTaskNetwork(nn.Module, MupMixin):
         accelerator_kwargs: Optional[Dict[str, Any]] = None,
         num_inference_to_average: int = 1,
         last_layer_is_readout: bool = False,
+        fuse_task_heads: bool = False,
         name: str = "FullGNN",
     ):
         r"""
@@ -1415,6 +1417,10 @@ class FullGraphMultiTaskNetwork(nn.Module, MupMixin):
             last_layer_is_readout: Whether the last layer should be treated as a readout layer.
                 Allows to use the `mup.MuReadout` from the muTransfer method https://github.com/microsoft/mup
 
+            fuse_task_heads:
+                Whether to run the compatible task heads together with batched matrix multiplications.
+                See the class `TaskHeads` for more details.
+
             name:
                 Name attributed to the current network, for display and printing
                 purposes.
@@ -1424,6 +1430,7 @@ class FullGraphMultiTaskNetwork(nn.Module, MupMixin):
         self.name = name
         self.num_inference_to_average = num_inference_to_average
         self.last_layer_is_readout = last_layer_is_readout
+        self.fuse_task_heads = fuse_task_heads
         self._concat_last_layers = None
         self.pre_nn, self.pre_nn_edges, self.task_heads = None, None, None
         self.pe_encoders_kwargs = deepcopy(pe_encoders_kwargs)
@@ -1468,6 +1475,7 @@ class FullGraphMultiTaskNetwork(nn.Module, MupMixin):
                 in_dim_edges=self.out_dim_edges,
                 task_heads_kwargs=task_heads_kwargs,
                 graph_output_nn_kwargs=graph_output_nn_kwargs,
+                fuse_heads=fuse_task_heads,
             )
             self._task_heads_kwargs = task_heads_kwargs
 
@@ -1729,6 +1737,7 @@ class FullGraphMultiTaskNetwork(nn.Module, MupMixin):
             pe_encoders_kwargs=None,
             num_inference_to_average=self.num_inference_to_average,
             last_layer_is_readout=self.last_layer_is_readout,
+            fuse_task_heads=self.fuse_task_heads,
             name=self.name,
         )
 
@@ -2167,6 +2176,7 @@ class TaskHeads(nn.Module, MupMixin):
         task_heads_kwargs: Dict[str, Any],
         graph_output_nn_kwargs: Dict[str, Any],
         last_layer_is_readout: bool = True,
+        fuse_heads: bool = False,
     ):
         r"""
         Class that groups all multi-task output heads together to provide the task-specific outputs.
@@ -2184,9 +2194,19 @@ class TaskHeads(nn.Module, MupMixin):
             graph_output_nn_kwargs:
                 key-word arguments to use for the initialization of the post-processing
                 MLP network after the GNN, using the class `FeedForwardNN`.
+            fuse_heads:
+                Whether to run together the heads of a same task level having the same layer dimensions,
+                activations and dropouts, by stacking their weights into a single batched matrix
+                multiplication per layer, as done by `EnsembleLinear`. The parameters are still stored
+                per head, so the checkpoints are identical. Only the heads made of plain `FCLayer`,
+                without normalization, residual connections or drop-path, are fused.
+                In evaluation mode without gradients, the stacked weights are cached between the forward
+                passes, until the heads are put back in training mode, moved, or loaded from a state dict.
         """
         super().__init__()
+        self._fused_weights_cache: Dict[Tuple[str, ...], List[Tuple[Tensor, Optional[Tensor]]]] = {}
         self.last_layer_is_readout = last_layer_is_readout
+        self.fuse_heads = fuse_heads
         self.task_heads_kwargs = deepcopy(task_heads_kwargs)
         self.graph_output_nn_kwargs = deepcopy(graph_output_nn_kwargs)
         self.task_levels = {head_kwargs["task_level"] for _, head_kwargs in self.task_heads_kwargs.items()}
@@ -2212,6 +2232,132 @@ class TaskHeads(nn.Module, MupMixin):
             filtered_kwargs["in_dim"] = self.graph_output_nn_kwargs[task_level]["out_dim"]
             self.task_heads[task_name] = FeedForwardNN(**filtered_kwargs)
 
+        self._fused_groups = self._group_fusable_heads() if fuse_heads else []
+
+    @staticmethod
+    def _is_fusable_head(head: nn.Module) -> bool:
+        r"""
+        Whether a head is a plain MLP of `FCLayer`, such that its layers can be stacked with other heads
+        """
+        if (type(head) is not FeedForwardNN) or (head.first_normalization is not None):
+            return False
+        if not isinstance(head.residual_layer, ResidualConnectionNone):
+            return False
+        for layer in head.layers:
+            if type(layer) is not FCLayer:
+                return False
+            if (layer.normalization is not None) or (layer.drop_path is not None):
+                return False
+        return True
+
+    @staticmethod
+    def _fusion_signature(head: FeedForwardNN) -> Tuple:
+        r"""
+        Signature of the layers of a head. Heads with the same signature can be fused together.
+        """
+        return tuple(
+            (
+                layer.in_dim,
+                layer.out_dim,
+                layer.bias,
+                repr(layer.activation),
+                None if layer.dropout is None else layer.dropout.p,
+            )
+            for layer in head.layers
+        )
+
+    def _group_fusable_heads(self) -> List[List[str]]:
+        r"""
+        Group the names of the fusable heads that share the same task level and layer signature.
+        Only the groups of at least 2 heads are returned.
+        """
+        groups = OrderedDict()
+        for task_name, head in self.task_heads.items():
+            if not self._is_fusable_head(head):
+                continue
+            task_level = self.task_heads_kwargs[task_name]["task_level"]
+            groups.setdefault((task_level, self._fusion_signature(head)), []).append(task_name)
+        return [task_names for task_names in groups.values() if len(task_names) > 1]
+
+    def _get_fused_weights(self, task_names: List[str]) -> List[Tuple[Tensor, Optional[Tensor]]]:
+        r"""
+        Stack the weights of each layer of a group of compatible heads. They are cached in evaluation
+        mode without gradients, e.g. under `torch.inference_mode`, since the parameters do not change.
+
+        Parameters:
+            task_names: The names of the heads
+
+        Returns:
+            The stacked weights `[K, Din, Dout]` and biases `[K, 1, Dout]` of each layer.
+            The biases are `None` for the layers without bias.
+        """
+        use_cache = (not self.training) and (not torch.is_grad_enabled())
+        key = tuple(task_names)
+        if use_cache and (key in self._fused_weights_cache):
+            return self._fused_weights_cache[key]
+
+        heads = [self.task_heads[task_name] for task_name in task_names]
+        fused_weights = []
+        for layers in zip(*[head.layers for head in heads]):
+            # The `MuReadout` layers multiply their input by a constant, which is moved to the weights
+            weights = []
+            for layer in layers:
+                weight = layer.linear.weight
+                if isinstance(layer.linear, MuReadoutGraphium):
+                    weight = weight * (layer.linear.output_mult / layer.linear.width_mult())
+                weights.append(weight.transpose(0, 1))
+            biases = None
+            if layers[0].bias:
+                biases = torch.stack([layer.linear.bias for layer in layers]).unsqueeze(1)
+            fused_weights.append((torch.stack(weights), biases))
+
+        if use_cache:
+            self._fused_weights_cache[key] = fused_weights
+        return fused_weights
+
+    def train(self, mode: bool = True) -> "TaskHeads":
+        self._fused_weights_cache.clear()
+        return super().train(mode)
+
+    def _apply(self, *args, **kwargs):
+        # The parameters are replaced when moving the module to another device or dtype
+        self._fused_weights_cache.clear()
+        return super()._apply(*args, **kwargs)
+
+    def _load_from_state_dict(self, *args, **kwargs):
+        self._fused_weights_cache.clear()
+        return super()._load_from_state_dict(*args, **kwargs)
+
+    def _forward_fused_heads(self, task_names: List[str], h: Tensor) -> Dict[str, Tensor]:
+        r"""
+        Apply a group of compatible heads on the same input features, with one batched
+        matrix multiplication per layer.
+
+        Parameters:
+            task_names: The names of the heads to apply
+            h: `torch.Tensor[..., Din]`: The input features of the heads
+
+        Returns:
+            Dictionary of the outputs `torch.Tensor[..., Dout]` of each head
+        """
+        # All the heads of the group share the same dropouts and activations
+        first_head = self.task_heads[task_names[0]]
+        batch_shape = h.shape[:-1]
+        h = h.reshape(1, -1, h.shape[-1]).expand(len(task_names), -1, -1)
+
+        for layer, (weights, biases) in zip(first_head.layers, self._get_fused_weights(task_names)):
+            if biases is not None:
+                h = torch.baddbmm(biases, h, weights)
+            else:
+                h = torch.bmm(h, weights)
+
+            if layer.dropout is not None:
+                h = layer.dropout(h)
+            if layer.activation is not None:
+                h = layer.activation(h)
+
+        return {task_name: out.reshape(*batch_shape, -1) for task_name, out in zip(task_names, h.unbind(0))}
+
     def forward(self, g: Batch) -> Dict[str, torch.Tensor]:
         r"""
         forward function of the task head
@@ -2222,8 +2368,20 @@ class TaskHeads(nn.Module, MupMixin):
         """
         features = {task_level: self.graph_output_nn[task_level](g) for task_level in self.task_levels}
 
+        fused_outputs = {}
+        for task_names in self._fused_groups:
+            task_level = self.task_heads_kwargs[task_names[0]]["task_level"]
+            h = features[task_level]
+            # Empty inputs and readout caches are handled by the heads themselves
+            if (h.numel() == 0) or any(self.task_heads[name].cache_readouts for name in task_names):
+                continue
+            fused_outputs.update(self._forward_fused_heads(task_names, h))
+
         task_head_outputs = {}
         for task_name, head in self.task_heads.items():
+            if task_name in fused_outputs:
+                task_head_outputs[task_name] = fused_outputs[task_name]
+                continue
             task_level = self.task_heads_kwargs[task_name].get(
                 "task_level", None
             )  # Get task_level without modifying head_kwargs
@@ -2263,6 +2421,7 @@ class TaskHeads(nn.Module, MupMixin):
             last_layer_is_readout=self.last_layer_is_readout,
             task_heads_kwargs=task_heads_kwargs,
             graph_output_nn_kwargs=graph_output_nn_kwargs,
+            fuse_heads=self.fuse_heads,
         )
         return kwargs
 
@@ -0,0 +1,324 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+r"""Batch inference of a pretrained `PredictorModule` on streams of SMILES,
+without a datamodule, a featurization cache or a Lightning trainer."""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import partial
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from loguru import logger
+
+from graphium.data.collate import graphium_collate_fn
+from graphium.data.sampler import SizeBucketBatchSampler
+from graphium.data.smiles_transform import BatchingSmilesTransform, did_featurization_fail
+from graphium.features import mol_to_graph_dict, mol_to_graph_dict_batch
+from graphium.trainer.predictor import PredictorModule
+
+
+def iter_dataframe_chunks(
+    path: Union[str, os.PathLike], columns: List[str], chunk_size: int
+) -> Iterator[pd.DataFrame]:
+    r"""
+    Read the given columns of a CSV or Parquet file by chunks of at most `chunk_size` rows,
+    without loading the full file in memory.
+
+    Parameters:
+        path: The path of a `.csv`, `.csv.gz` or `.parquet` file
+        columns: The columns to read, in the order of the returned chunks
+        chunk_size: The maximum number of rows per chunk
+
+    Returns:
+        An iterator over the chunks of the file, as DataFrames
+    """
+    path = str(path)
+    if path.endswith(".parquet"):
+        # Only the requested columns of at most `chunk_size` rows are decoded at a time
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size, columns=columns):
+            yield record_batch.to_pandas()[columns].reset_index(drop=True)
+    elif path.endswith(".csv") or path.endswith(".csv.gz"):
+        for chunk in pd.read_csv(path, usecols=columns, chunksize=chunk_size):
+            yield chunk[columns].reset_index(drop=True)
+    else:
+        raise ValueError(f"Unsupported file extension for `{path}`, must be `.csv`, `.csv.gz` or `.parquet`")
+
+
+class InferenceEngine:
+    def __init__(
+        self,
+        predictor: PredictorModule,
+        featurization: Optional[Dict[str, Any]] = None,
+        max_num_nodes: Optional[int] = 8192,
+        max_num_edges: Optional[int] = None,
+        max_batch_size: Optional[int] = 1024,
+        featurization_n_jobs: int = 0,
+        featurization_batch_size: int = 1000,
+        precision: str = "32",
+        num_threads: Optional[int] = None,
+        device: Optional[Union[str, torch.device]] = None,
+    ):
+        r"""
+        Predict the graph-level tasks of a pretrained `PredictorModule` for large streams of molecules.
+
+        The SMILES are processed by chunks. The molecules of a chunk are featurized in a pool of
+        processes while the model runs on the previous chunk. Within a chunk, the molecules are
+        sorted by size and grouped into batches under a budget of nodes, edges and graphs, using
+        the `SizeBucketBatchSampler`. The predictions are returned in the original order, with NaNs
+        for the molecules that failed featurization.
+
+        Parameters:
+            predictor: The pretrained model
+            featurization: The featurization arguments of `mol_to_graph_dict`. By default, the ones
+                saved with the predictor, i.e. the featurization used during training.
+            max_num_nodes: The maximum total number of nodes in a batch
+            max_num_edges: The maximum total number of edges in a batch
+            max_batch_size: The maximum number of molecules in a batch
+            featurization_n_jobs: The number of processes used for the featurization.
+                With `0`, the molecules are featurized in the main process, without overlapping the model.
+            featurization_batch_size: The number of molecules featurized at once by each process
+            precision: Either `"32"`, or `"bf16"` to run the model under a bfloat16 autocast
+            num_threads: The number of threads used by torch while running the model on CPU.
+                It is restored after each chunk. Default is unchanged.
+            device: The device of the model. Default is the current device of the predictor.
+        """
+        if precision not in ["32", "bf16"]:
+            raise ValueError(f"`precision` must be either '32' or 'bf16', provided `{precision}`")
+
+        if featurization is None:
+            featurization = predictor.featurization
+        if featurization is None:
+            raise ValueError("The predictor has no saved featurization, the `featurization` must be provided")
+
+        self.predictor = predictor.eval()
+        if device is not None:
+            self.predictor.to(device)
+        self.device = next(self.predictor.parameters()).device
+        self.featurization = dict(featurization)
+        self.max_num_nodes = max_num_nodes
+        self.max_num_edges = max_num_edges
+        self.max_batch_size = max_batch_size
+        self.featurization_n_jobs = featurization_n_jobs
+        self.featurization_batch_size = featurization_batch_size
+        self.precision = precision
+        self.num_threads = num_threads
+
+        self.smiles_transformer = BatchingSmilesTransform(
+            partial(mol_to_graph_dict, **self.featurization),
+            partial(mol_to_graph_dict_batch, **self.featurization),
+        )
+
+        # Only the graph-level tasks have one prediction per molecule
+        self.tasks = [task for task, level in predictor.task_levels.items() if level == "graph"]
+        skipped_tasks = sorted(set(predictor.task_levels.keys()) - set(self.tasks))
+        if len(skipped_tasks) > 0:
+            logger.warning(f"Only the graph-level tasks are predicted. Skipping the tasks {skipped_tasks}")
+
+        # The width of the predictions is known even for the chunks where all the molecules failed
+        task_out_dims = self.predictor.model.task_heads.out_dim
+        self.out_dims = {task: task_out_dims[task] for task in self.tasks}
+
+    @classmethod
+    def from_pretrained(
+        cls, name_or_path: str, device: Optional[str] = None, **kwargs: Any
+    ) -> "InferenceEngine":
+        r"""
+        Create an engine from a pretrained model name or a checkpoint path.
+        See `PredictorModule.load_pretrained_model`.
+        """
+        predictor = PredictorModule.load_pretrained_model(name_or_path, device=device)
+        return cls(predictor, device=device, **kwargs)
+
+    def _featurize_async(self, pool: Optional[ProcessPoolExecutor], smiles: List[str]) -> Callable[[], List]:
+        """Start the featurization of a chunk, returning a function waiting for its features"""
+        if pool is None:
+            features = self.smiles_transformer(smiles)
+            return lambda: features
+
+        size = self.featurization_batch_size
+        futures = [
+            pool.submit(self.smiles_transformer, smiles[start : start + size])
+            for start in range(0, len(smiles), size)
+        ]
+        return lambda: [feat for future in futures for feat in future.result()]
+
+    def predict_features(self, features: Sequence[Any]) -> Dict[str, np.ndarray]:
+        r"""
+        Predict the graph-level tasks for a chunk of featurized molecules.
+
+        Parameters:
+            features: The features of each molecule, as returned by `mol_to_graph_dict`.
+                The failed featurizations are given by their error message.
+
+        Returns:
+            The predictions of each task, of shape `(num_molecules, out_dim)`
+        """
+        valid = [ii for ii, feat in enumerate(features) if not did_featurization_fail(feat)]
+        valid = np.asarray(valid, dtype=np.int64)
+        num_nodes = np.asarray([features[ii].num_nodes for ii in valid], dtype=np.int64)
+        num_edges = np.asarray([features[ii].num_edges for ii in valid], dtype=np.int64)
+
+        # Batches of molecules of similar sizes, to limit the padding of the dense layers
+        batch_sampler = SizeBucketBatchSampler(
+            num_nodes,
+            num_edges,
+            max_num_nodes=self.max_num_nodes,
+            max_num_edges=self.max_num_edges,
+            max_batch_size=self.max_batch_size,
+            shuffle=False,
+            bucket_size=max(len(valid), 1),
+            sampler=np.argsort(num_nodes, kind="stable"),
+        )
+
+        # The molecules that failed featurization are left as NaNs
+        preds = {
+            task: np.full((len(features), out_dim), np.nan, dtype=np.float32)
+            for task, out_dim in self.out_dims.items()
+        }
+        autocast = torch.autocast(
+            device_type=self.device.type, dtype=torch.bfloat16, enabled=self.precision == "bf16"
+        )
+
+        # The number of threads is process-wide, so it is only changed while the model runs
+        num_threads = torch.get_num_threads()
+        if self.num_threads is not None:
+            torch.set_num_threads(self.num_threads)
+        try:
+            with torch.inference_mode(), autocast:
+                for batch_idx in batch_sampler:
+                    mol_idx = valid[batch_idx]
+                    batch = graphium_collate_fn([{"features": features[ii]} for ii in mol_idx], mask_nan=0)
+                    batch["features"] = batch["features"].to(self.device)
+                    batch_preds = self.predictor.forward(batch)["preds"]
+
+                    for task in self.tasks:
+                        pred = self._denormalize(task, batch_preds[task]).float().cpu().numpy()
+                        preds[task][mol_idx] = pred.reshape(len(mol_idx), -1)
+        finally:
+            torch.set_num_threads(num_threads)
+
+        return preds
+
+    def _denormalize(self, task: str, pred: torch.Tensor) -> torch.Tensor:
+        """Revert the normalization of the labels used during training, as done for the validation"""
+        if self.predictor.task_norms is None:
+            return pred
+        task_key = self.predictor._get_task_key(task_level=self.predictor.task_levels[task], task=task)
+        task_norm = self.predictor.task_norms.get(task_key, None)
+        if hasattr(task_norm, "denormalize"):
+            pred = task_norm.denormalize(pred)
+        return pred
+
+    def predict_smiles(self, smiles_chunks: Iterable[Sequence[str]]) -> Iterator[Dict[str, np.ndarray]]:
+        r"""
+        Predict the graph-level tasks for a stream of chunks of SMILES. The featurization
+        of the next chunk runs in the pool of processes while the model runs on the current one.
+
+        Parameters:
+            smiles_chunks: The chunks of SMILES. Their size controls the memory used by the features.
+
+        Returns:
+            An iterator over the predictions of each chunk, in order. See `predict_features`.
+        """
+        if self.featurization_n_jobs > 0:
+            pool_context = ProcessPoolExecutor(max_workers=self.featurization_n_jobs)
+        else:
+            pool_context = nullcontext()
+
+        with pool_context as pool:
+            pending = None
+            for smiles in smiles_chunks:
+                next_features = self._featurize_async(pool, list(smiles))
+                if pending is not None:
+                    yield self.predict_features(pending())
+                pending = next_features
+            if pending is not None:
+                yield self.predict_features(pending())
+
+    def predictions_to_dataframe(self, preds: Dict[str, np.ndarray]) -> pd.DataFrame:
+        """Convert the predictions of a chunk to a DataFrame, with one column per task and output"""
+        columns = {}
+        for task, pred in preds.items():
+            if pred.shape[1] == 1:
+                columns[task] = pred[:, 0]
+            else:
+                columns.update({f"{task}-{ii}": pred[:, ii] for ii in range(pred.shape[1])})
+        return pd.DataFrame(columns)
+
+    def predict_file(
+        self,
+        input_path: Union[str, os.PathLike],
+        output_path: Union[str, os.PathLike],
+        smiles_col: str = "smiles",
+        keep_cols: Optional[List[str]] = None,
+        chunk_size: int = 100_000,
+    ) -> int:
+        r"""
+        Stream the SMILES of a CSV or Parquet file through the model, and append the predictions
+        of each chunk to a CSV or Parquet file, such that neither is ever fully loaded in memory.
+
+        Parameters:
+            input_path: The `.csv`, `.csv.gz` or `.parquet` file containing the SMILES
+            output_path: The `.csv` or `.parquet` file of the predictions. It is overwritten.
+            smiles_col: The column of the SMILES
+            keep_cols: Other columns of the input to copy in the output, e.g. the molecule IDs.
+                The SMILES are always copied.
+            chunk_size: The number of molecules per chunk
+
+        Returns:
+            The number of molecules predicted
+        """
+        output_path = str(output_path)
+        if not (output_path.endswith(".csv") or output_path.endswith(".parquet")):
+            raise ValueError(f"Unsupported file extension for `{output_path}`, must be `.csv` or `.parquet`")
+        if os.path.exists(output_path):
+            os.remove(output_path)
+
+        keep_cols = [smiles_col] + [col for col in (keep_cols or []) if col != smiles_col]
+        chunks = deque()
+
+        def _smiles_chunks():
+            for chunk in iter_dataframe_chunks(input_path, columns=keep_cols, chunk_size=chunk_size):
+                chunks.append(chunk)
+                yield chunk[smiles_col].astype(str).tolist()
+
+        num_molecules = 0
+        parquet_writer = None
+        try:
+            for preds in self.predict_smiles(_smiles_chunks()):
+                out = pd.concat([chunks.popleft(), self.predictions_to_dataframe(preds)], axis=1)
+                if output_path.endswith(".parquet"):
+                    # A single writer, with the schema of the first chunk, adds one row group per chunk
+                    if parquet_writer is None:
+                        table = pa.Table.from_pandas(out, preserve_index=False)
+                        parquet_writer = pq.ParquetWriter(output_path, table.schema)
+                    else:
+                        table = pa.Table.from_pandas(out, schema=parquet_writer.schema, preserve_index=False)
+                    parquet_writer.write_table(table)
+                else:
+                    out.to_csv(output_path, mode="a", header=num_molecules == 0, index=False)
+                num_molecules += len(out)
+                logger.info(f"Predicted {num_molecules} molecules")
+        finally:
+            if parquet_writer is not None:
+                parquet_writer.close()
+
+        return num_molecules
@@ -17,11 +17,13 @@ import sys
 
 import torch
 from torch import Tensor
+import torch.nn.functional as F
 import operator as op
 
 from torchmetrics.utilities.distributed import reduce
 import torchmetrics.functional.regression.mae
 
+from graphium.trainer.streaming_metrics import STREAMING_METRICS, MomentsState, StreamingState
 from graphium.utils.tensor import nan_mean
 
 # NOTE(hadim): the below is a fix to be able to import previously saved Graphium model that are incompatible
@@ -32,6 +34,14 @@ sys.modules["torchmetrics.functional.regression.mean_absolute_error"] = torchmet
 
 EPS = 1e-5
 
+# Losses of `torch.nn` computed element by element, such that all the label columns are processed at once
+_ELEMENTWISE_LOSSES = {
+    torch.nn.MSELoss: F.mse_loss,
+    torch.nn.L1Loss: F.l1_loss,
+    torch.nn.BCELoss: F.binary_cross_entropy,
+    torch.nn.BCEWithLogitsLoss: F.binary_cross_entropy_with_logits,
+}
+
 
 class Thresholder:
     def __init__(
@@ -313,6 +323,9 @@ class MetricWrapper:
             if self.target_to_int:
                 target = target.to(int)
             metric_val = self.metric(preds, target, **self.kwargs)
+        elif (self.multitask_handling == "mean-per-label") and self._is_batchable(classifigression):
+            # Compute the metrics of all the columns at once, with a mask of the NaNs, then average them
+            metric_val = self._compute_mean_per_label_batched(preds, target)
         elif self.multitask_handling == "mean-per-label":
             # Loop the columns (last dim) of the tensors, apply the nan filtering, compute the metrics per column, then average the metrics
             target_list = [target[..., ii][~target_nans[..., ii]] for ii in range(target.shape[-1])]
@@ -330,8 +343,8 @@ class MetricWrapper:
                     if self.target_to_int:
                         this_target = this_target.to(int)
                     metric_val.append(self.metric(this_preds, this_target, **self.kwargs))
-                except:
-                    pass
+                except Exception:
+                    pass  # Columns without enough labels are ignored in the average
             # Average the metric
             metric_val = nan_mean(torch.stack(metric_val))
         else:
@@ -340,6 +353,118 @@ class MetricWrapper:
 
         return metric_val
 
+    def _is_batchable(self, classifigression: bool) -> bool:
+        """Whether `_compute_mean_per_label_batched` supports the metric"""
+        if classifigression or self.squeeze_targets:
+            return False
+        if type(self.metric) in _ELEMENTWISE_LOSSES:
+            is_weighted = (getattr(self.metric, "weight", None) is not None) or (
+                getattr(self.metric, "pos_weight", None) is not None
+            )
+            return (self.metric.reduction == "mean") and (not is_weighted) and (len(self.kwargs) == 0)
+        return self.is_streamable() and (STREAMING_METRICS[self.metric_name][0] is MomentsState)
+
+    def _compute_mean_per_label_batched(self, preds: Tensor, target: Tensor) -> Tensor:
+        r"""
+        Compute the metric of every label column at once and average them, equivalent to computing
+        the metric on the non-NaN elements of each column. Supports the elementwise losses of `torch.nn`,
+        and the metrics computed from running moments (see `graphium.trainer.streaming_metrics`).
+        """
+        preds, target = preds.reshape(-1, preds.shape[-1]), target.reshape(-1, target.shape[-1])
+        if self.target_nan_mask == "ignore":
+            mask = ~torch.isnan(target)
+        else:
+            mask = torch.ones_like(target, dtype=torch.bool)
+            preds, target = self._filter_nans(preds, target)
+        if self.target_to_int:
+            target = target.to(int)
+
+        if type(self.metric) in _ELEMENTWISE_LOSSES:
+            # The NaNs are replaced before the loss, otherwise their gradient is NaN even when masked
+            target = torch.where(mask, target, torch.zeros_like(target))
+            losses = _ELEMENTWISE_LOSSES[type(self.metric)](preds, target, reduction="none")
+            losses = torch.where(mask, losses, torch.zeros_like(losses))
+            metric_val = losses.sum(dim=0) / mask.sum(dim=0)
+        else:
+            state = MomentsState(num_cols=target.shape[-1], device=target.device)
+            state.update(preds, target, mask)
+            metric_val = STREAMING_METRICS[self.metric_name][1](state).to(preds.dtype)
+
+        # Columns without labels are NaN, and ignored in the average
+        return nan_mean(metric_val)
+
+    def is_streamable(self) -> bool:
+        r"""
+        Whether the metric can be accumulated batch by batch with `update_state` and `compute_state`,
+        instead of being computed on the predictions and targets of the full split.
+        """
+        return (
+            (self.metric_name in STREAMING_METRICS)
+            and (self.thresholder is None)
+            and (not self.squeeze_targets)
+            and (set(self.kwargs.keys()) <= {"task"})
+            and (self.kwargs.get("task", "binary") == "binary")
+        )
+
+    def update_state(self, state: Optional[StreamingState], preds: Tensor, target: Tensor) -> StreamingState:
+        r"""
+        Accumulate a batch of predictions and targets into the state of the metric, with the same
+        handling of the NaNs and of the multiple labels as `compute`. With `multitask_handling=None`,
+        the labels are flattened.
+
+        Parameters:
+            state: The state returned by the previous call, or `None` for the first batch
+            preds: The predictions of the batch
+            target: The targets of the batch
+
+        Returns:
+            state: The updated state, to pass to `compute_state` at the end of the split
+
+        Raises:
+            ValueError: If the metric, or the shape of the predictions, cannot be accumulated.
+                Check `is_streamable` before accumulating a metric.
+        """
+        if not self.is_streamable():
+            raise ValueError(f"Metric `{self}` cannot be accumulated")
+        if preds.ndim == 1:
+            preds = preds.unsqueeze(-1)
+        if target.ndim == 1:
+            target = target.unsqueeze(-1)
+        if preds.shape != target.shape:
+            raise ValueError(
+                f"Only predictions of the same shape as the targets can be accumulated, "
+                f"got {tuple(preds.shape)} and {tuple(target.shape)}"
+            )
+
+        if self.multitask_handling == "mean-per-label":
+            preds, target = preds.reshape(-1, preds.shape[-1]), target.reshape(-1, target.shape[-1])
+        else:
+            preds, target = preds.reshape(-1, 1), target.reshape(-1, 1)
+
+        if self.target_nan_mask == "ignore":
+            mask = ~torch.isnan(target)
+        else:
+            mask = torch.ones_like(target, dtype=torch.bool)
+            preds, target = self._filter_nans(preds, target)
+        if self.target_to_int:
+            target = target.to(int)
+
+        state_class, _ = STREAMING_METRICS[self.metric_name]
+        if state is None:
+            state = state_class(num_cols=target.shape[1], device=target.device)
+        state.update(preds.detach(), target.detach(), mask)
+        return state
+
+    def compute_state(self, state: StreamingState) -> Tensor:
+        r"""
+        Compute the metric from the state accumulated with `update_state`
+        """
+        _, compute_fn = STREAMING_METRICS[self.metric_name]
+        metric_val = compute_fn(state)
+        if self.multitask_handling == "mean-per-label":
+            return nan_mean(metric_val)
+        return metric_val[0]
+
     def _filter_nans(self, preds: Tensor, target: Tensor):
         """Handle the NaNs according to the chosen options"""
         target_nans = torch.isnan(target)
@@ -62,6 +62,7 @@ class PredictorModule(lightning.LightningModule):
         replicas: int = 1,
         gradient_acc: int = 1,
         global_bs: Optional[int] = 1,
+        streaming_metrics: bool = False,
     ):
         """
         The Lightning module responsible for handling the predictions, losses, metrics, optimization, etc.
@@ -83,6 +84,10 @@ class PredictorModule(lightning.LightningModule):
             task_norms: the normalization for each task
             metrics_every_n_train_steps: Compute and log metrics every n training steps.
                 Set to `None` to never log the training metrics and statistics (the default). Set to `1` to log at every step.
+            streaming_metrics: Whether to accumulate the validation and test metrics batch by batch,
+                on the device of the model, instead of keeping all the predictions and targets until
+                the end of the epoch. The loss of the split is then the average of the batch losses,
+                weighted by their number of labels. See `TaskSummaries.update_streaming_state`.
         """
         self.save_hyperparameters()
 
@@ -156,6 +161,17 @@ class PredictorModule(lightning.LightningModule):
             )
         self.n_params = sum(p.numel() for p in self.parameters() if p.requires_grad)
 
+        # The losses are wrapped once, instead of at every step
+        self._wrapped_loss_fun = {
+            task: MetricWrapper(
+                metric=loss,
+                threshold_kwargs=None,
+                target_nan_mask=self.target_nan_mask,
+                multitask_handling=self.multitask_handling,
+            )
+            for task, loss in self.loss_fun.items()
+        }
+
         # Set the parameters and default values for the FLAG adversarial augmentation, and check values
         self._flag_options.set_kwargs()
         self.flag_kwargs = self._flag_options.flag_kwargs
@@ -184,6 +200,7 @@ class PredictorModule(lightning.LightningModule):
         self.mean_val_tput_tracker = MovingAverageTracker()
         self.validation_step_outputs = []
         self.test_step_outputs = []
+        self.streaming_metrics = streaming_metrics
         self.epoch_start_time = None
 
         # Decide whether to log every step or once at the end
@@ -295,7 +312,8 @@ class PredictorModule(lightning.LightningModule):
                   *This option might slowdown the computation if there are too many labels*
 
             loss_fun:
-                Loss function to use
+                Loss function to use for each task. The losses that are already a `MetricWrapper`
+                are used as is, ignoring `target_nan_mask` and `multitask_handling`.
 
         Returns:
             Tensor:
@@ -304,11 +322,15 @@ class PredictorModule(lightning.LightningModule):
         """
 
         wrapped_loss_fun_dict = {
-            task: MetricWrapper(
-                metric=loss,
-                threshold_kwargs=None,
-                target_nan_mask=target_nan_mask,
-                multitask_handling=multitask_handling,
+            task: (
+                loss
+                if isinstance(loss, MetricWrapper)
+                else MetricWrapper(
+                    metric=loss,
+                    threshold_kwargs=None,
+                    target_nan_mask=target_nan_mask,
+                    multitask_handling=multitask_handling,
+                )
             )
             for task, loss in loss_fun.items()
         }
@@ -360,7 +382,7 @@ class PredictorModule(lightning.LightningModule):
             preds=preds,
             targets=targets_dict,
             weights=weights,
-            loss_fun=self.loss_fun,
+            loss_fun=self._wrapped_loss_fun,
             target_nan_mask=self.target_nan_mask,
             multitask_handling=self.multitask_handling,
         )
@@ -396,7 +418,6 @@ class PredictorModule(lightning.LightningModule):
         step_dict["loss"] = loss
         # print("loss ", self.global_step, self.current_epoch, loss)
         step_dict["task_losses"] = task_losses
-        step_dict["gradient_norm"] = self.get_gradient_norm()
         return step_dict
 
     def flag_step(self, batch: Dict[str, Tensor], step_name: str, to_cpu: bool) -> Dict[str, Any]:
@@ -430,7 +451,7 @@ class PredictorModule(lightning.LightningModule):
             weights=weights,
             target_nan_mask=self.target_nan_mask,
             multitask_handling=self.multitask_handling,
-            loss_fun=self.loss_fun,
+            loss_fun=self._wrapped_loss_fun,
         )
 
         loss = loss / n_steps
@@ -451,7 +472,7 @@ class PredictorModule(lightning.LightningModule):
                 weights=weights,
                 target_nan_mask=self.target_nan_mask,
                 multitask_handling=self.multitask_handling,
-                loss_fun=self.loss_fun,
+                loss_fun=self._wrapped_loss_fun,
             )
             loss = loss / n_steps
 
@@ -478,7 +499,7 @@ class PredictorModule(lightning.LightningModule):
     def on_train_batch_end(self, outputs, batch: Any, batch_idx: int) -> None:
         train_batch_time = time.time() - self.train_batch_start_time  # To be used for throughput calculation
 
-        # Get the metrics that are logged at every step (loss, grad_norm, batch_time, batch_tput)
+        # Get the metrics that are logged at every step (loss, epoch_count, samples_seen)
         concatenated_metrics_logs = {}
         concatenated_metrics_logs["train/loss"] = outputs["loss"]
         concatenated_metrics_logs["epoch_count"] = self.current_epoch
@@ -551,20 +572,28 @@ class PredictorModule(lightning.LightningModule):
             step_dict.pop("targets")
         return step_dict  # Returning the metrics_logs with the loss
 
-    def get_gradient_norm(self):
-        # compute the norm
-        total_norm = torch.tensor(0.0)
-        for p in self.parameters():
-            if p.grad is not None:
-                param_norm = p.grad.detach().data.norm(2)
-                total_norm += param_norm.detach().cpu() ** 2
-        total_norm = total_norm**0.5
+    def get_gradient_norm(self) -> Tensor:
+        r"""
+        Compute the L2 norm of all the gradients of the model, on their device and without
+        synchronizing with the host. It is only called on the training steps where the
+        metrics are logged, see `metrics_every_n_train_steps`.
+        """
+        grads = [p.grad.detach() for p in self.parameters() if p.grad is not None]
+        if len(grads) == 0:
+            return torch.tensor(0.0)
+
+        # A single fused reduction over all the gradients, instead of one norm per parameter
+        norms = torch._foreach_norm(grads, 2.0)
+        total_norm = torch.linalg.vector_norm(torch.stack([norm.float() for norm in norms]), 2.0)
         return total_norm
 
     def validation_step(self, batch: Dict[str, Tensor], to_cpu: bool = True) -> Dict[str, Any]:
+        # The streaming metrics are accumulated on the device of the model
+        to_cpu = to_cpu and not self.streaming_metrics
         return self._general_step(batch=batch, step_name="val", to_cpu=to_cpu)
 
     def test_step(self, batch: Dict[str, Tensor], to_cpu: bool = True) -> Dict[str, Any]:
+        to_cpu = to_cpu and not self.streaming_metrics
         return self._general_step(batch=batch, step_name="test", to_cpu=to_cpu)
 
     def _general_epoch_end(self, outputs: Dict[str, Any], step_name: str, device: str) -> None:
@@ -588,7 +617,7 @@ class PredictorModule(lightning.LightningModule):
             weights=weights,
             target_nan_mask=self.target_nan_mask,
             multitask_handling=self.multitask_handling,
-            loss_fun=self.loss_fun,
+            loss_fun=self._wrapped_loss_fun,
         )
 
         self.task_epoch_summary.update_predictor_state(
@@ -604,6 +633,28 @@ class PredictorModule(lightning.LightningModule):
 
         return metrics_logs  # Consider returning concatenated dict for logging
 
+    def _streaming_epoch_end(self, step_name: str) -> Dict[str, Any]:
+        r"""Common code for the validation and test epoch ends, with the metrics accumulated at each batch"""
+        metrics_logs = self.task_epoch_summary.get_streaming_metrics_logs(
+            step_name=step_name, n_epochs=self.current_epoch
+        )
+        self.task_epoch_summary.set_results(task_metrics=metrics_logs)
+        return metrics_logs
+
+    def _store_step_outputs(self, outputs: Dict[str, Any], step_name: str) -> None:
+        r"""Keep the outputs of a validation or test step, or accumulate them with streaming metrics"""
+        if self.streaming_metrics:
+            self.task_epoch_summary.update_streaming_state(
+                step_name=step_name,
+                targets=outputs["targets"],
+                preds=outputs["preds"],
+                task_losses=outputs["task_losses"],
+            )
+        elif step_name == "val":
+            self.validation_step_outputs.append(outputs)
+        else:
+            self.test_step_outputs.append(outputs)
+
     def on_train_epoch_start(self) -> None:
         self.epoch_start_time = time.time()
 
@@ -628,16 +679,19 @@ class PredictorModule(lightning.LightningModule):
         self, outputs: Any, batch: Any, batch_idx: int, dataloader_idx: int = 0
     ) -> None:
         val_batch_time = time.time() - self.validation_batch_start_time
-        self.validation_step_outputs.append(outputs)
+        self._store_step_outputs(outputs, step_name="val")
         self.mean_val_time_tracker.update(val_batch_time)
         num_graphs = self.get_num_graphs(batch["features"])
         self.mean_val_tput_tracker.update(num_graphs / val_batch_time)
         return super().on_validation_batch_end(outputs, batch, batch_idx, dataloader_idx)
 
     def on_validation_epoch_end(self) -> None:
-        metrics_logs = self._general_epoch_end(
-            outputs=self.validation_step_outputs, step_name="val", device="cpu"
-        )
+        if self.streaming_metrics:
+            metrics_logs = self._streaming_epoch_end(step_name="val")
+        else:
+            metrics_logs = self._general_epoch_end(
+                outputs=self.validation_step_outputs, step_name="val", device="cpu"
+            )
         self.validation_step_outputs.clear()
         concatenated_metrics_logs = self.task_epoch_summary.concatenate_metrics_logs(metrics_logs)
         concatenated_metrics_logs["val/mean_time"] = torch.tensor(self.mean_val_time_tracker.mean_value)
@@ -649,10 +703,15 @@ class PredictorModule(lightning.LightningModule):
         full_dict.update(self.task_epoch_summary.get_dict_summary())
 
     def on_test_batch_end(self, outputs: Any, batch: Any, batch_idx: int, dataloader_idx: int = 0) -> None:
-        self.test_step_outputs.append(outputs)
+        self._store_step_outputs(outputs, step_name="test")
 
     def on_test_epoch_end(self) -> None:
-        metrics_logs = self._general_epoch_end(outputs=self.test_step_outputs, step_name="test", device="cpu")
+        if self.streaming_metrics:
+            metrics_logs = self._streaming_epoch_end(step_name="test")
+        else:
+            metrics_logs = self._general_epoch_end(
+                outputs=self.test_step_outputs, step_name="test", device="cpu"
+            )
         self.test_step_outputs.clear()
         concatenated_metrics_logs = self.task_epoch_summary.concatenate_metrics_logs(metrics_logs)
 
@@ -20,6 +20,7 @@ import numpy as np
 import torch
 from torch import Tensor
 
+from graphium.trainer.metrics import MetricWrapper
 from graphium.utils.tensor import nan_mean, nan_std, nan_median, tensor_fp16_to_fp32
 
 
@@ -100,6 +101,14 @@ class Summary(SummaryInterface):
         self.task_name = task_name
         self.logged_metrics_exceptions = []  # Track which metric exceptions have been logged
 
+        # States accumulated batch by batch, and metrics that must be computed on the full split instead
+        self._streaming_states = {}
+        self.non_streamable_metrics = {
+            key
+            for key, metric in self.metrics.items()
+            if not (isinstance(metric, MetricWrapper) and metric.is_streamable())
+        }
+
     def update_predictor_state(
         self, step_name: str, targets: Tensor, preds: Tensor, loss: Tensor, n_epochs: int
     ):
@@ -262,25 +271,15 @@ class Summary(SummaryInterface):
             targets
         )
 
-        # Specify which metrics to use
-        metrics_to_use = self.metrics
-        if self.step_name == "train":
-            metrics_to_use = {
-                key: metric for key, metric in metrics_to_use.items() if key in self.metrics_on_training_set
-            }
         # Compute the additional metrics
-        for key, metric in metrics_to_use.items():
+        for key, metric in self._get_metrics_to_use(self.step_name).items():
             metric_name = self.metric_log_name(
                 self.task_name, key, self.step_name
             )  # f"{key}/{self.step_name}"
             try:
                 metric_logs[metric_name] = metric(preds, targets)
             except Exception as e:
-                metric_logs[metric_name] = torch.as_tensor(float("nan"))
-                # Warn only if it's the first warning for that metric
-                if metric_name not in self.logged_metrics_exceptions:
-                    self.logged_metrics_exceptions.append(metric_name)
-                    logger.warning(f"Error for metric {metric_name}. NaN is returned. Exception: {e}")
+                metric_logs[metric_name] = self._metric_exception(metric_name, e)
 
         # Convert all metrics to CPU, except for the loss
         # metric_logs[f"{self.loss_fun._get_name()}/{self.step_name}"] = self.loss.detach().cpu()
@@ -292,6 +291,127 @@ class Summary(SummaryInterface):
 
         return metric_logs
 
+    def _get_metrics_to_use(self, step_name: str) -> Dict[str, Callable]:
+        """The metrics to compute for a given step, with only a subset on the training set"""
+        if step_name == "train":
+            return {
+                key: metric for key, metric in self.metrics.items() if key in self.metrics_on_training_set
+            }
+        return self.metrics
+
+    def _metric_exception(self, metric_name: str, e: Exception) -> Tensor:
+        """Warn about an error of a metric, only the first time, and return NaN"""
+        if metric_name not in self.logged_metrics_exceptions:
+            self.logged_metrics_exceptions.append(metric_name)
+            logger.warning(f"Error for metric {metric_name}. NaN is returned. Exception: {e}")
+        return torch.as_tensor(float("nan"))
+
+    def update_streaming_state(self, step_name: str, targets: Tensor, preds: Tensor, loss: Tensor):
+        r"""
+        Accumulate the statistics and metrics of a batch, on the device of the predictions, such that
+        `get_streaming_metrics_logs` computes them on the full split without keeping every batch.
+        The metrics that cannot be accumulated (see `MetricWrapper.is_streamable`) are computed at
+        the end of the split, on the predictions and targets of this task kept on CPU.
+        Parameters:
+            step_name: which stage you are in, e.g. "val"
+            targets: the targets tensor of the batch
+            preds: the predictions tensor of the batch
+            loss: the loss tensor of the batch
+        """
+        state = self._streaming_states.get(step_name, None)
+        if state is None:
+            state = {
+                "metrics": {},  # The state of each metric that is accumulated
+                "errors": {},  # The first error of each metric that failed
+                "moments": {},  # The count, sum and sum of squares of the predictions and targets
+                "loss": [0.0, 0.0],  # The sum of the weighted batch losses and of their weights
+                "preds": [],  # The predictions and targets of the metrics that are not accumulated
+                "targets": [],
+            }
+            self._streaming_states[step_name] = state
+
+        preds = tensor_fp16_to_fp32(preds.detach())
+        targets = tensor_fp16_to_fp32(targets.detach()).to(dtype=preds.dtype, device=preds.device)
+
+        # The loss of the split is the average of the batch losses, weighted by their number of labels
+        num_labels = (~torch.isnan(targets)).sum().to(torch.float64)
+        weighted_loss = torch.where(num_labels > 0, loss.detach().to(torch.float64) * num_labels, 0.0)
+        state["loss"] = [state["loss"][0] + weighted_loss, state["loss"][1] + num_labels]
+
+        # Count, sum and sum of squares of the predictions and targets, ignoring the NaNs
+        for name, values in [("pred", preds), ("target", targets)]:
+            values = values.to(torch.float64).flatten()
+            is_valid = ~torch.isnan(values)
+            values = torch.where(is_valid, values, 0.0)
+            moments = torch.stack([is_valid.sum(dtype=torch.float64), values.sum(), (values * values).sum()])
+            state["moments"][name] = state["moments"].get(name, 0.0) + moments
+
+        # A metric failing on a batch, e.g. on predictions of an unsupported shape, is NaN for the split
+        metrics = self._get_metrics_to_use(step_name)
+        for key, metric in metrics.items():
+            if (key in self.non_streamable_metrics) or (key in state["errors"]):
+                continue
+            try:
+                state["metrics"][key] = metric.update_state(state["metrics"].get(key, None), preds, targets)
+            except Exception as e:
+                state["errors"][key] = e
+
+        if any(key in self.non_streamable_metrics for key in metrics.keys()):
+            state["preds"].append(preds.cpu())
+            state["targets"].append(targets.cpu())
+
+    def get_streaming_metrics_logs(self, step_name: str, n_epochs: int) -> Dict[str, Any]:
+        r"""
+        Get the metrics to log from the states accumulated with `update_streaming_state`, and reset them.
+        The medians of the predictions and targets are only logged when the predictions and
+        targets are kept for some metrics that cannot be accumulated.
+        Parameters:
+            step_name: which stage you are in, e.g. "val"
+            n_epochs: the number of epochs
+        Returns:
+            A dictionary of metrics to log.
+        """
+        state = self._streaming_states.pop(step_name, None)
+        if state is None:
+            raise ValueError(f"No batch was accumulated for the step `{step_name}`")
+
+        self.step_name = step_name
+        self.n_epochs = n_epochs
+        self.targets = None
+        self.preds = None
+        self.loss = (torch.as_tensor(state["loss"][0]) / torch.as_tensor(state["loss"][1])).float()
+
+        metric_logs = {}
+        for name, (count, total, total_sq) in state["moments"].items():
+            mean = total / count
+            std = torch.sqrt((total_sq - total * mean).clamp(min=0) / (count - 1))
+            metric_logs[self.metric_log_name(self.task_name, f"mean_{name}", step_name)] = mean.float()
+            metric_logs[self.metric_log_name(self.task_name, f"std_{name}", step_name)] = std.float()
+
+        preds, targets = None, None
+        if len(state["preds"]) > 0:
+            preds, targets = torch.cat(state["preds"], dim=0), torch.cat(state["targets"], dim=0)
+            for name, values in [("pred", preds), ("target", targets)]:
+                log_name = self.metric_log_name(self.task_name, f"median_{name}", step_name)
+                metric_logs[log_name] = nan_median(values)
+
+        for key, metric in self._get_metrics_to_use(step_name).items():
+            metric_name = self.metric_log_name(self.task_name, key, step_name)
+            try:
+                if key in state["errors"]:
+                    raise state["errors"][key]
+                if key in self.non_streamable_metrics:
+                    metric_logs[metric_name] = metric(preds, targets)
+                else:
+                    metric_logs[metric_name] = metric.compute_state(state["metrics"][key])
+            except Exception as e:
+                metric_logs[metric_name] = self._metric_exception(metric_name, e)
+
+        metric_logs[self.metric_log_name(self.task_name, self.loss_fun._get_name(), step_name)] = self.loss
+        metric_logs = {key: metric.detach().cpu() for key, metric in metric_logs.items()}
+
+        return metric_logs
+
     def metric_log_name(self, task_name, metric_name, step_name):
         if task_name is None:
             return f"{metric_name}/{step_name}"
@@ -318,8 +438,8 @@ class Summary(SummaryInterface):
                 monitored_metric: the monitored metric
                 n_epochs: the number of epochs
             """
-            self.targets = targets.detach().cpu()
-            self.preds = preds.detach().cpu()
+            self.targets = targets.detach().cpu() if targets is not None else None
+            self.preds = preds.detach().cpu() if preds is not None else None
             self.loss = loss.item() if isinstance(loss, Tensor) else loss
             self.monitored_metric = monitored_metric
             if monitored_metric in metrics.keys():
@@ -495,20 +615,65 @@ class TaskSummaries(SummaryInterface):
         """
         task_metrics_logs = {}
         for task in self.tasks:
-            task_metrics_logs[task] = self.task_summaries[task].get_metrics_logs()
-            # average metrics
-            for key in task_metrics_logs[task]:
-                if isinstance(task_metrics_logs[task][key], torch.Tensor):
-                    if task_metrics_logs[task][key].numel() > 1:
-                        task_metrics_logs[task][key] = task_metrics_logs[task][key][
-                            task_metrics_logs[task][key] != 0
-                        ].mean()
+            task_metrics_logs[task] = self._average_metrics_logs(self.task_summaries[task].get_metrics_logs())
 
         # Include global (weighted loss)
         task_metrics_logs["_global"] = {}
         task_metrics_logs["_global"][f"loss/{self.step_name}"] = self.weighted_loss.detach().cpu()
         return task_metrics_logs
 
+    def update_streaming_state(
+        self,
+        step_name: str,
+        targets: Dict[str, Tensor],
+        preds: Dict[str, Tensor],
+        task_losses: Dict[str, Tensor],
+    ):
+        r"""
+        Accumulate the statistics and metrics of a batch for all tasks, instead of keeping the predictions
+        and targets of every batch until the end of the split. See `Summary.update_streaming_state`.
+        Parameters:
+            step_name: the name of the step
+            targets: the target tensors of the batch
+            preds: the prediction tensors of the batch
+            task_losses: the task losses of the batch
+        """
+        for task in self.tasks:
+            self.task_summaries[task].update_streaming_state(
+                step_name, targets[task], preds[task], task_losses[task]
+            )
+
+    def get_streaming_metrics_logs(self, step_name: str, n_epochs: int) -> Dict[str, Dict[str, Tensor]]:
+        r"""
+        get the logs for the metrics accumulated with `update_streaming_state`, and reset them
+        Parameters:
+            step_name: the name of the step
+            n_epochs: the number of epochs
+        Returns:
+            the task logs for the metrics
+        """
+        self.step_name = step_name
+        task_metrics_logs = {}
+        for task in self.tasks:
+            task_metrics_logs[task] = self._average_metrics_logs(
+                self.task_summaries[task].get_streaming_metrics_logs(step_name, n_epochs)
+            )
+
+        # Include global (weighted loss), averaged over the tasks as in `PredictorModule.compute_loss`
+        self.weighted_loss = torch.stack([self.task_summaries[task].loss for task in self.tasks]).mean()
+        task_metrics_logs["_global"] = {}
+        task_metrics_logs["_global"][f"loss/{self.step_name}"] = self.weighted_loss.detach().cpu()
+        return task_metrics_logs
+
+    @staticmethod
+    def _average_metrics_logs(metrics_logs: Dict[str, Tensor]) -> Dict[str, Tensor]:
+        """Average the non-zero values of the metrics with more than one element"""
+        for key in metrics_logs:
+            if isinstance(metrics_logs[key], torch.Tensor):
+                if metrics_logs[key].numel() > 1:
+                    metrics_logs[key] = metrics_logs[key][metrics_logs[key] != 0].mean()
+        return metrics_logs
+
     # TODO (Gabriela): This works to fix the logging on TB, but make it more efficient
     def concatenate_metrics_logs(
         self,
@@ -0,0 +1,157 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+r"""Metric states that are updated at every batch, such that the metrics of a full split
+are computed without keeping all the predictions and targets in memory."""
+
+import abc
+from typing import Callable, Dict, Optional, Tuple, Type
+
+import torch
+from torch import Tensor
+
+# Number of bins of the histograms of the predicted probabilities, used by the classification metrics
+NUM_HISTOGRAM_BINS = 4096
+
+
+class StreamingState(abc.ABC):
+    r"""
+    Interface of the states accumulated for each label column, from batches of
+    predictions and targets of shape `(num_samples, num_cols)`.
+    The subclasses are built with `(num_cols, device)`.
+    """
+
+    @abc.abstractmethod
+    def update(self, preds: Tensor, target: Tensor, mask: Tensor) -> None:
+        r"""
+        Accumulate a batch of predictions and targets
+
+        Parameters:
+            preds: The predictions, of shape `(num_samples, num_cols)`
+            target: The targets, of shape `(num_samples, num_cols)`
+            mask: Which elements to accumulate, of shape `(num_samples, num_cols)`
+        """
+        ...
+
+
+class MomentsState(StreamingState):
+    def __init__(self, num_cols: int, device: torch.device):
+        r"""
+        Running sums of the predictions, targets, and their products and errors, for each column.
+        They are accumulated in float64 to limit the cancellation errors of the variances.
+        """
+        names = ["n", "sum_p", "sum_t", "sum_pp", "sum_tt", "sum_pt", "sum_abs_err", "sum_sq_err"]
+        self.sums = {name: torch.zeros(num_cols, dtype=torch.float64, device=device) for name in names}
+
+    def update(self, preds: Tensor, target: Tensor, mask: Tensor) -> None:
+        # Masked elements are set to zero, since they can be NaNs
+        preds = torch.where(mask, preds.to(torch.float64), 0.0)
+        target = torch.where(mask, target.to(torch.float64), 0.0)
+        err = preds - target
+        self.sums["n"] += mask.sum(dim=0, dtype=torch.float64)
+        self.sums["sum_p"] += preds.sum(dim=0)
+        self.sums["sum_t"] += target.sum(dim=0)
+        self.sums["sum_pp"] += (preds * preds).sum(dim=0)
+        self.sums["sum_tt"] += (target * target).sum(dim=0)
+        self.sums["sum_pt"] += (preds * target).sum(dim=0)
+        self.sums["sum_abs_err"] += err.abs().sum(dim=0)
+        self.sums["sum_sq_err"] += (err * err).sum(dim=0)
+
+
+class HistogramState(StreamingState):
+    def __init__(self, num_cols: int, device: torch.device, num_bins: int = NUM_HISTOGRAM_BINS):
+        r"""
+        Histograms of the predicted probabilities of the positive and negative samples, for each column.
+        The ranking metrics computed from them are exact up to the ties within a bin.
+
+        Whether the predictions are logits, as detected by `torchmetrics` when some are outside of [0, 1],
+        is decided once on the first batch with labels, such that all the batches are binned the same way.
+        """
+        self.num_bins = num_bins
+        self.pos = torch.zeros(num_cols, num_bins, dtype=torch.float64, device=device)
+        self.neg = torch.zeros(num_cols, num_bins, dtype=torch.float64, device=device)
+        self.apply_sigmoid: Optional[bool] = None
+
+    def update(self, preds: Tensor, target: Tensor, mask: Tensor) -> None:
+        preds = torch.where(mask, preds.float(), 0.0)
+        if (self.apply_sigmoid is None) and mask.any():
+            self.apply_sigmoid = bool(((preds < 0) | (preds > 1)).any())
+        if self.apply_sigmoid:
+            preds = torch.sigmoid(preds)
+        num_cols = preds.shape[1]
+        bins = (preds * self.num_bins).long().clamp_(0, self.num_bins - 1)
+        bins = bins + self.num_bins * torch.arange(num_cols, device=preds.device)
+        for hist, is_class in [(self.pos, mask & (target == 1)), (self.neg, mask & (target == 0))]:
+            counts = torch.bincount(bins[is_class], minlength=num_cols * self.num_bins)
+            hist += counts.view(num_cols, self.num_bins)
+
+
+def _safe_div(num: Tensor, den: Tensor) -> Tensor:
+    return torch.where(den > 0, num / den.clamp(min=1e-300), torch.full_like(num, float("nan")))
+
+
+def mae_from_state(state: MomentsState) -> Tensor:
+    return _safe_div(state.sums["sum_abs_err"], state.sums["n"])
+
+
+def mse_from_state(state: MomentsState) -> Tensor:
+    return _safe_div(state.sums["sum_sq_err"], state.sums["n"])
+
+
+def pearsonr_from_state(state: MomentsState) -> Tensor:
+    s = state.sums
+    cov = s["n"] * s["sum_pt"] - s["sum_p"] * s["sum_t"]
+    var_p = (s["n"] * s["sum_pp"] - s["sum_p"] ** 2).clamp(min=0)
+    var_t = (s["n"] * s["sum_tt"] - s["sum_t"] ** 2).clamp(min=0)
+    return _safe_div(cov, torch.sqrt(var_p * var_t))
+
+
+def r2_score_from_state(state: MomentsState) -> Tensor:
+    s = state.sums
+    ss_tot = s["sum_tt"] - _safe_div(s["sum_t"] ** 2, s["n"])
+    return 1 - _safe_div(s["sum_sq_err"], ss_tot)
+
+
+def _cumulative_counts(state: HistogramState) -> Tuple[Tensor, Tensor]:
+    """True and false positives when thresholding at each bin, from the highest to the lowest"""
+    tps = torch.cumsum(state.pos.flip(-1), dim=-1)
+    fps = torch.cumsum(state.neg.flip(-1), dim=-1)
+    return tps, fps
+
+
+def auroc_from_state(state: HistogramState) -> Tensor:
+    tps, fps = _cumulative_counts(state)
+    tpr = _safe_div(tps, tps[:, -1:].expand_as(tps))
+    fpr = _safe_div(fps, fps[:, -1:].expand_as(fps))
+    tpr = torch.nn.functional.pad(tpr, (1, 0))
+    fpr = torch.nn.functional.pad(fpr, (1, 0))
+    return torch.trapezoid(tpr, fpr, dim=-1)
+
+
+def average_precision_from_state(state: HistogramState) -> Tensor:
+    tps, fps = _cumulative_counts(state)
+    precision = torch.nan_to_num(_safe_div(tps, tps + fps))
+    recall = _safe_div(tps, tps[:, -1:].expand_as(tps))
+    delta_recall = torch.diff(torch.nn.functional.pad(recall, (1, 0)), dim=-1)
+    return (delta_recall * precision).sum(dim=-1)
+
+
+# The metrics of `METRICS_DICT` that can be accumulated, with their state and the function computing them
+STREAMING_METRICS: Dict[str, Tuple[Type[StreamingState], Callable[[StreamingState], Tensor]]] = {
+    "mae": (MomentsState, mae_from_state),
+    "mse": (MomentsState, mse_from_state),
+    "pearsonr": (MomentsState, pearsonr_from_state),
+    "r2_score": (MomentsState, r2_score_from_state),
+    "auroc": (HistogramState, auroc_from_state),
+    "averageprecision": (HistogramState, average_precision_from_state),
+}
@@ -11,11 +11,14 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
-from typing import Union
+from typing import Any, Dict, List, Union
 from typing import Optional
 
 import os
 import io
+import json
+import shutil
+import fnmatch
 import platformdirs
 import pathlib
 
@@ -224,3 +227,59 @@ def copy(
                     pbar.update(chunk_size)
 
                 pbar.close()
+
+
+def start_resumable_write(
+    path: Union[str, os.PathLike],
+    manifest: Dict[str, Any],
+    manifest_file: str,
+    index_file: str,
+    owned_patterns: List[str],
+    resume: bool = True,
+) -> bool:
+    """Prepare a local folder for a write that can be resumed, such as the shards of a store.
+    The manifest identifying the write is saved in the folder. The files of a previous write
+    are kept only if it had the same manifest, otherwise only the files owned by the writer are removed.
+    A non-empty folder without a manifest was not written by a writer, and is refused.
+    Args:
+        path: a local folder.
+        manifest: the information identifying the write, e.g. the layout of the shards.
+        manifest_file: the name of the file of the manifest in the folder.
+        index_file: the name of the file written once the write is finalized. It is removed,
+            since the write is only complete again once finalized.
+        owned_patterns: the glob patterns of the names of the files and folders written by the writer.
+        resume: whether to keep the files of a previous write with the same manifest.
+    Returns:
+        Whether the files of a previous write are kept.
+    """
+    path = str(path)
+    manifest_path = os.path.join(path, manifest_file)
+    if os.path.isdir(path) and (len(os.listdir(path)) > 0) and not os.path.isfile(manifest_path):
+        raise FileExistsError(
+            f"The folder `{path}` is not empty and has no `{manifest_file}`, so it was not written "
+            "by a resumable writer. Use an empty or a new folder."
+        )
+
+    previous_manifest = None
+    if resume and os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as f:
+            previous_manifest = json.load(f)
+
+    resumed = previous_manifest == manifest
+    if (not resumed) and os.path.isdir(path):
+        for name in os.listdir(path):
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in owned_patterns):
+                continue
+            entry = os.path.join(path, name)
+            if os.path.isdir(entry):
+                shutil.rmtree(entry)
+            else:
+                os.remove(entry)
+    os.makedirs(path, exist_ok=True)
+
+    index_path = os.path.join(path, index_file)
+    if os.path.isfile(index_path):
+        os.remove(index_path)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return resumed
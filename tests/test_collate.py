@@ -21,7 +21,14 @@ import torch
 import numpy as np
 from torch_geometric.data import Data
 
-from graphium.data.collate import collate_labels, graphium_collate_fn
+from graphium.data.collate import (
+    collage_pyg_graph,
+    collate_graph_dicts,
+    collate_labels,
+    graphium_collate_fn,
+    pad_nodepairs,
+)
+from graphium.features import mol_to_graph_dict
 
 
 class test_Collate(ut.TestCase):
@@ -161,6 +168,85 @@ class test_Collate(ut.TestCase):
             collated_labels["node_label4"].numpy(), label4_true.flatten(0, 1).numpy()
         )
 
+    def test_collate_many_graph_labels(self):
+        # Many graph-level tasks, each with a label for a random subset of the molecules
+        rng = np.random.default_rng(42)
+        num_graphs, num_tasks = 16, 50
+        expected = np.full((num_tasks, num_graphs), np.nan, dtype=np.float32)
+        labels = []
+        for graph_idx in range(num_graphs):
+            label = Data(x=torch.empty(3, 0), edge_index=torch.empty(2, 4))
+            for task_idx in np.flatnonzero(rng.random(num_tasks) < 0.3):
+                expected[task_idx, graph_idx] = rng.random()
+                label[f"graph_task{task_idx}"] = np.asarray([expected[task_idx, graph_idx]], dtype=np.float32)
+            labels.append(label)
+        labels_size_dict = {f"graph_task{task_idx}": [1] for task_idx in range(num_tasks)}
+        labels_dtype_dict = {f"graph_task{task_idx}": torch.float32 for task_idx in range(num_tasks)}
+
+        collated_labels = collate_labels(labels, labels_size_dict, labels_dtype_dict)
+        self.assertEqual(collated_labels.num_graphs, num_graphs)
+        for task_idx in range(num_tasks):
+            task_labels = collated_labels[f"graph_task{task_idx}"]
+            self.assertEqual(task_labels.shape, torch.Size([num_graphs, 1]))
+            np.testing.assert_array_equal(task_labels[:, 0].numpy(), expected[task_idx])
+
+    def test_collate_graph_dicts(self):
+        featurization = {
+            "atom_property_list_onehot": ["atomic-number", "degree"],
+            "edge_property_list": ["bond-type-onehot"],
+            "pos_encoding_as_features": {
+                "pos_types": {
+                    "rw_pos": {"pos_level": "node", "pos_type": "rw_return_probs", "ksteps": 3},
+                    "electrostatic": {"pos_level": "nodepair", "pos_type": "electrostatic"},
+                }
+            },
+        }
+        smiles_list = ["CCO", "C", "c1ccccc1O", "CC#N"]
+        graph_dicts = [mol_to_graph_dict(smiles, **featurization) for smiles in smiles_list]
+
+        batch = collate_graph_dicts(graph_dicts)
+        expected = collage_pyg_graph([graph_dict.make_pyg_graph() for graph_dict in graph_dicts])
+
+        self.assertEqual(batch.num_graphs, expected.num_graphs)
+        self.assertEqual(batch.num_nodes, expected.num_nodes)
+        self.assertEqual(set(batch.keys()), set(expected.keys()))
+        for key in expected.keys():
+            self.assertEqual(batch[key].dtype, expected[key].dtype, msg=key)
+            np.testing.assert_array_equal(batch[key].numpy(), expected[key].numpy(), err_msg=key)
+
+        # The graphs can be recovered from the batch
+        for ii, graph_dict in enumerate(graph_dicts):
+            graph = batch.get_example(ii)
+            self.assertEqual(graph.num_nodes, graph_dict.num_nodes)
+            np.testing.assert_array_equal(graph.feat.numpy(), graph_dict["feat"].astype(np.float16))
+            expected_graph = expected.get_example(ii)
+            np.testing.assert_array_equal(graph.edge_index.numpy(), expected_graph.edge_index.numpy())
+
+        # The collate function uses the fast path for `GraphDict`
+        collated = graphium_collate_fn([{"features": graph_dict} for graph_dict in graph_dicts])
+        np.testing.assert_array_equal(collated["features"].batch.numpy(), expected.batch.numpy())
+
+    def test_collate_nodepairs(self):
+        pyg_graphs = []
+        for num_nodes in [3, 1, 5, 2]:
+            pe = torch.rand(num_nodes, num_nodes, 2)
+            edge_index = torch.zeros(2, 0, dtype=torch.int32)
+            pyg_graphs.append(Data(edge_index=edge_index, num_nodes=num_nodes, nodepair_pe=pe, feat=pe[:, 0]))
+        original_pes = [graph.nodepair_pe for graph in pyg_graphs]
+
+        batch = collage_pyg_graph(pyg_graphs)
+        expected = torch.cat([pad_nodepairs(pe, pe.shape[0], 5) for pe in original_pes])
+        np.testing.assert_array_equal(batch.nodepair_pe.numpy(), expected.numpy())
+        self.assertEqual(batch.edge_index.dtype, torch.int64)
+
+        # The graphs are not modified, and can be recovered from the batch
+        for ii, graph in enumerate(pyg_graphs):
+            self.assertIs(graph.nodepair_pe, original_pes[ii])
+            self.assertEqual(graph.edge_index.dtype, torch.int32)
+            example = batch.get_example(ii)
+            expected_pe = expected[batch.ptr[ii] : batch.ptr[ii + 1]].numpy()
+            np.testing.assert_array_equal(example.nodepair_pe.numpy(), expected_pe)
+
 
 if __name__ == "__main__":
     ut.main()
@@ -494,6 +494,27 @@ class Test_DataModule(ut.TestCase):
 
         self.assertEqual(len(ds.train_ds), 20)
 
+    def test_read_parquet(self):
+        # Only the requested columns are read, and multiple files are read as a single table
+        parquet_files = ["tests/data/micro_ZINC_shard_1.parquet", "tests/data/micro_ZINC_shard_2.parquet"]
+        df = MultitaskFromSmilesDataModule._read_parquet(parquet_files, usecols=["score", "SMILES"])
+        expected = pd.concat([pd.read_parquet(file) for file in parquet_files], ignore_index=True)
+        self.assertListEqual(list(df.columns), ["score", "SMILES"])
+        np.testing.assert_array_equal(df["score"].values, expected["score"].values)
+        self.assertListEqual(df["SMILES"].tolist(), expected["SMILES"].tolist())
+
+        # The lists of floats are converted to float16
+        with tempfile.TemporaryDirectory() as tmpdir:
+            parquet_file = f"{tmpdir}/labels.parquet"
+            expected = pd.DataFrame({"smiles": ["CC", "CO", "C"], "label": [[1.5, 2.0], [], [3.25]]})
+            expected.to_parquet(parquet_file, engine="pyarrow", row_group_size=2)
+            df = MultitaskFromSmilesDataModule._read_parquet(parquet_file)
+        self.assertListEqual(list(df.columns), ["smiles", "label"])
+        self.assertListEqual(df["smiles"].tolist(), expected["smiles"].tolist())
+        for value, expected_value in zip(df["label"], expected["label"]):
+            self.assertEqual(value.dtype, np.float16)
+            np.testing.assert_array_equal(value, expected_value)
+
     def test_splits_file(self):
         # Test single CSV files
         csv_file = "tests/data/micro_ZINC_shard_1.csv"
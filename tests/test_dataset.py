@@ -11,12 +11,20 @@ Refer to the LICENSE file for the full terms and conditions.
 --------------------------------------------------------------------------------
 """
 
+import os
+import tempfile
 import unittest as ut
 
+import numpy as np
+import torch
+from torch.utils.data import Subset
+from torch_geometric.data import Data
+
 from graphium.data import load_micro_zinc
-from graphium.data.dataset import SingleTaskDataset, MultitaskDataset
+from graphium.data.dataset import TASK_INDICES_FILE, SingleTaskDataset, MultitaskDataset
 from graphium.data.smiles_transform import smiles_to_unique_mol_ids
 from graphium.data.utils import get_keys
+from graphium.features import PositionalEncodingTransform
 
 
 class Test_Multitask_Dataset(ut.TestCase):
@@ -207,6 +215,80 @@ class Test_Multitask_Dataset(ut.TestCase):
         # The multitask dataset has as many molecules as there are unique smiles across the single task datasets.
         self.assertEqual(total_data_points, multitask_microzinc.__len__())
 
+    def test_multitask_dataset_merge_columns(self):
+        """Case: stacked graph labels in a `Subset`, node labels as a list, and a molecule repeated in a task
+        - Check that the smiles of each molecule are grouped in order
+        - Check that the features and labels of the last entry of a molecule are kept
+        """
+        num_nodes = {"A": 2, "B": 3, "C": 1, "D": 4}
+
+        def _features(ids):
+            edge_index = torch.zeros(2, 0, dtype=torch.long)
+            return [Data(x=torch.zeros(num_nodes[id], 1), edge_index=edge_index) for id in ids]
+
+        # The graph task only keeps "D", "B" and "A" in its subset
+        graph_ids = ["A", "B", "C", "D"]
+        ds_graph = SingleTaskDataset(
+            labels=np.arange(8, dtype=np.float32).reshape(4, 2),
+            features=_features(graph_ids),
+            smiles=[f"smiles_{id}_graph" for id in graph_ids],
+            unique_ids=graph_ids,
+        )
+        ds_graph = Subset(ds_graph, [3, 1, 0])
+
+        node_ids = ["B", "C", "B"]
+        ds_node = SingleTaskDataset(
+            labels=[np.full((num_nodes[id], 1), ii, dtype=np.float64) for ii, id in enumerate(node_ids)],
+            features=_features(node_ids),
+            smiles=[f"smiles_{id}_node{ii}" for ii, id in enumerate(node_ids)],
+            unique_ids=node_ids,
+        )
+
+        dataset = MultitaskDataset({"graph_a": ds_graph, "node_b": ds_node}, save_smiles_and_ids=True)
+        self.assertEqual(list(dataset.mol_ids), ["A", "B", "C", "D"])
+        self.assertEqual(dataset.smiles[1], ["smiles_B_graph", "smiles_B_node0", "smiles_B_node2"])
+        self.assertEqual(dataset.smiles[3], ["smiles_D_graph"])
+        self.assertEqual(dataset.num_nodes_list, [2, 3, 1, 4])
+
+        np.testing.assert_array_equal(dataset[0]["labels"]["graph_a"], [0, 1])
+        np.testing.assert_array_equal(dataset[3]["labels"]["graph_a"], [6, 7])
+        self.assertNotIn("graph_a", dataset[2]["labels"])
+        np.testing.assert_array_equal(dataset[1]["labels"]["node_b"], np.full((3, 1), 2))
+        np.testing.assert_array_equal(dataset[2]["labels"]["node_b"], np.full((1, 1), 1))
+        np.testing.assert_array_equal(dataset.get_task_indices()["node_b"], [1, 2])
+
+        # The task indices are saved along with the metadata
+        with tempfile.TemporaryDirectory() as path:
+            dataset.save_metadata(path)
+            with np.load(os.path.join(path, TASK_INDICES_FILE)) as saved:
+                np.testing.assert_array_equal(saved["graph_a"], [0, 1, 3])
+                np.testing.assert_array_equal(saved["node_b"], [1, 2])
+
+    def test_multitask_dataset_pos_encoding_transform(self):
+        """Case: the train and val datasets share the positional encoding transform of the datamodule
+        - Check that the cached encodings of a dataset are not returned for the same index in the other
+        """
+
+        def _dataset(num_nodes):
+            # A single path graph of `num_nodes` nodes
+            edge_index = torch.as_tensor([[0, 1], [1, 0]], dtype=torch.long).repeat(1, num_nodes - 1)
+            edge_index = edge_index + torch.arange(num_nodes - 1).repeat_interleave(2)
+            features = [Data(x=torch.zeros(num_nodes, 1), edge_index=edge_index, num_nodes=num_nodes)]
+            dataset = SingleTaskDataset(labels=[1.0], features=features, smiles=["C"], unique_ids=["A"])
+            return {"graph_a": dataset}
+
+        pos_encoding_as_features = {
+            "pos_types": {"rw_pos": {"pos_level": "node", "pos_type": "rw_return_probs", "ksteps": 4}}
+        }
+        transform = PositionalEncodingTransform(pos_encoding_as_features, mask_nan=0.0, cache_size=8)
+        train_dataset = MultitaskDataset(_dataset(num_nodes=2), pos_encoding_transform=transform)
+        val_dataset = MultitaskDataset(_dataset(num_nodes=5), pos_encoding_transform=transform)
+
+        self.assertEqual(train_dataset[0]["features"]["rw_return_probs"].shape[0], 2)
+        self.assertEqual(val_dataset[0]["features"]["rw_return_probs"].shape[0], 5)
+        self.assertEqual(len(train_dataset.pos_encoding_transform._cache), 1)
+        self.assertEqual(len(transform._cache), 0)
+
 
 if __name__ == "__main__":
     ut.main()
@@ -0,0 +1,119 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the persistent featurization cache
+"""
+
+import tempfile
+import unittest as ut
+from functools import partial
+
+import numpy as np
+
+from graphium.data.featurization_cache import FeaturizationCache
+from graphium.data.smiles_transform import GraphStoreSmilesTransform, smiles_to_unique_mol_id
+from graphium.features import mol_to_pyggraph
+
+SMILES = ["CCO", "c1ccccc1O", "C", "CC(=O)NC1=CC=C(O)C=C1", "O=C=O", "CCN(CC)CC"]
+
+FEATURIZATION = {
+    "atom_property_list_onehot": ["atomic-number", "degree"],
+    "edge_property_list": ["bond-type-onehot"],
+}
+
+
+class test_FeaturizationCache(ut.TestCase):
+    def test_lookup_and_add(self):
+        keys = [smiles_to_unique_mol_id(smiles) for smiles in SMILES]
+        graphs = [mol_to_pyggraph(smiles, **FEATURIZATION) for smiles in SMILES]
+
+        with tempfile.TemporaryDirectory() as path:
+            cache = FeaturizationCache(path, featurizer_args=FEATURIZATION, shard_size=2)
+            features, idx_missing = cache.lookup(keys)
+            np.testing.assert_array_equal(idx_missing, np.arange(len(keys)))
+            self.assertTrue(all(feat is None for feat in features))
+
+            # Add the first molecules in one run, with a failed one, and the others in a second run
+            cache.add(keys[:3] + ["failed_key"], graphs[:3] + ["Error message"])
+            cache.add(keys[3:], graphs[3:])
+            self.assertEqual(len(cache.segments()), 2)
+
+            # The failed molecules are not cached
+            features, idx_missing = cache.lookup(keys[::-1] + ["failed_key", "unknown_key", ""])
+            np.testing.assert_array_equal(idx_missing, [len(keys), len(keys) + 1, len(keys) + 2])
+            for feat, graph in zip(features[: len(keys)], graphs[::-1]):
+                np.testing.assert_array_equal(feat["feat"].numpy(), graph["feat"].numpy())
+                np.testing.assert_array_equal(feat["edge_index"].numpy(), graph["edge_index"].numpy())
+            self.assertIsNone(features[len(keys)])
+
+            # A different featurizer signature does not share the cached molecules
+            other_cache = FeaturizationCache(path, featurizer_args={"explicit_H": True})
+            self.assertNotEqual(other_cache.path, cache.path)
+            _, idx_missing = other_cache.lookup(keys)
+            self.assertEqual(len(idx_missing), len(keys))
+
+            # The same signature finds the cached molecules in a new instance
+            _, idx_missing = FeaturizationCache(path, featurizer_args=FEATURIZATION).lookup(keys)
+            self.assertEqual(len(idx_missing), 0)
+
+    def test_add_segment(self):
+        smiles = SMILES + ["not_a_smiles"]
+        keys = [smiles_to_unique_mol_id(this_smiles) for this_smiles in SMILES] + ["failed_key"]
+        transform = partial(mol_to_pyggraph, **FEATURIZATION)
+
+        with tempfile.TemporaryDirectory() as path:
+            cache = FeaturizationCache(path, featurizer_args=FEATURIZATION, shard_size=3)
+            cache.add(keys[:2], [transform(this_smiles) for this_smiles in smiles[:2]])
+            features, idx_missing = cache.lookup(keys)
+            np.testing.assert_array_equal(idx_missing, np.arange(2, len(keys)))
+
+            # The shards of the missing molecules are written directly into a new segment
+            writer = cache.segment_writer()
+            completed = writer.start(len(idx_missing))
+            shard_params = [(0, smiles[2:5]), (1, smiles[5:])]
+            write_fn = GraphStoreSmilesTransform(transform, writer)
+            writer.write_shards(shard_params, completed, write_fn=write_fn)
+            segment_path = cache.add_segment(writer, keys[2:])
+            features.set_segment(idx_missing, segment_path, np.arange(len(idx_missing)))
+
+            self.assertEqual(features.idx_none, [len(keys) - 1])
+            self.assertIsInstance(features[len(keys) - 1], str)
+            for feat, this_smiles in zip(features[:-1], SMILES):
+                np.testing.assert_array_equal(feat["feat"].numpy(), transform(this_smiles)["feat"].numpy())
+
+            # Only the failed molecule is missing in the next lookup
+            _, idx_missing = cache.lookup(keys)
+            np.testing.assert_array_equal(idx_missing, [len(keys) - 1])
+
+    def test_merge_segments(self):
+        keys = [smiles_to_unique_mol_id(smiles) for smiles in SMILES]
+        graphs = [mol_to_pyggraph(smiles, **FEATURIZATION) for smiles in SMILES]
+
+        with tempfile.TemporaryDirectory() as path:
+            cache = FeaturizationCache(path, featurizer_args=FEATURIZATION, shard_size=2, max_segments=2)
+            cache.add(keys[:3], graphs[:3])
+            for key, graph in zip(keys[3:], graphs[3:]):
+                cache.add([key], [graph])
+            self.assertEqual(len(cache.segments()), 4)
+
+            # The 3 smallest segments are merged before the lookup
+            features, idx_missing = cache.lookup(keys)
+            self.assertEqual(len(cache.segments()), 2)
+            self.assertEqual(len(idx_missing), 0)
+            for feat, graph in zip(features, graphs):
+                np.testing.assert_array_equal(feat["feat"].numpy(), graph["feat"].numpy())
+
+
+if __name__ == "__main__":
+    ut.main()
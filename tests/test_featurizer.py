@@ -21,12 +21,19 @@ from copy import deepcopy
 from rdkit import Chem
 import datamol as dm
 
+from graphium.features import nmp
+from graphium.utils.tensor import one_of_k_encoding
 from graphium.features.featurizer import (
     get_mol_atomic_features_onehot,
+    get_mols_atomic_features_onehot,
     get_mol_atomic_features_float,
     get_mol_edge_features,
     mol_to_adj_and_features,
+    mol_to_graph_dict,
+    mol_to_graph_dict_batch,
     mol_to_pyggraph,
+    mol_to_pyggraph_batch,
+    PositionalEncodingTransform,
 )
 
 
@@ -120,6 +127,32 @@ class test_featurizer(ut.TestCase):
             with self.assertRaises(ValueError, msg=err_msg):
                 get_mol_atomic_features_onehot(mol, property_list=bad_props)
 
+    def test_get_mols_atomic_features_onehot(self):
+        mols = [dm.to_mol(s) for s in self.smiles + self.smiles_noble]
+        batched_dict = get_mols_atomic_features_onehot(mols, property_list=self.atomic_onehot_props)
+        single_dicts = [get_mol_atomic_features_onehot(mol, self.atomic_onehot_props) for mol in mols]
+
+        # The batched features are the concatenation of the features of each molecule
+        for key, val in batched_dict.items():
+            self.assertEqual(val.dtype, np.float16)
+            expected = np.concatenate([single_dict[key] for single_dict in single_dicts], axis=0)
+            np.testing.assert_array_equal(val, expected, err_msg=key)
+
+        # The lookup tables give the same encoding as `one_of_k_encoding`
+        atoms = [atom for mol in mols for atom in mol.GetAtoms()]
+        expected = {
+            "atomic-number": [one_of_k_encoding(atom.GetSymbol(), nmp.ATOM_LIST) for atom in atoms],
+            "degree": [one_of_k_encoding(atom.GetDegree(), nmp.ATOM_DEGREE_LIST) for atom in atoms],
+            "hybridization": [
+                one_of_k_encoding(atom.GetHybridization(), nmp.HYBRIDIZATION_LIST) for atom in atoms
+            ],
+            "period": [
+                one_of_k_encoding(nmp.PERIOD[atom.GetAtomicNum() - 1], nmp.PERIOD_SET) for atom in atoms
+            ],
+        }
+        for key, val in expected.items():
+            np.testing.assert_array_equal(batched_dict[key], np.asarray(val, dtype=np.float16), err_msg=key)
+
     def test_get_mol_atomic_features_float(self):
         props = deepcopy(self.atomic_float_props)
 
@@ -309,6 +342,71 @@ class test_featurizer(ut.TestCase):
                         self.assertGreaterEqual(ndata.shape[1], num_props, msg=err_msg2)
                         self.assertGreaterEqual(edata.shape[1], num_props, msg=err_msg2)
 
+    def test_mol_to_graph_dict_batch(self):
+        # The one-hot features of the chunk are appended after the float features, as for a single molecule
+        featurization = {
+            "atom_property_list_onehot": self.atomic_onehot_props,
+            "atom_property_list_float": ["mass", "electronegativity"],
+            "edge_property_list": ["bond-type-onehot"],
+            "explicit_H": True,
+            "mask_nan": 0.0,
+            "max_num_atoms": 40,
+        }
+        smiles = self.smiles + ["not_a_smiles"] + self.smiles_noble
+        graph_dicts = mol_to_graph_dict_batch(smiles, **featurization)
+        self.assertEqual(len(graph_dicts), len(smiles))
+        for this_smiles, graph_dict in zip(smiles, graph_dicts):
+            expected = mol_to_graph_dict(this_smiles, **featurization)
+            if isinstance(expected, str):
+                self.assertIsInstance(graph_dict, str, msg=this_smiles)
+                continue
+            self.assertEqual(list(graph_dict["data"].keys()), list(expected["data"].keys()))
+            for key, val in expected["data"].items():
+                self.assertEqual(graph_dict["data"][key].dtype, val.dtype, msg=key)
+                np.testing.assert_array_equal(graph_dict["data"][key], val, err_msg=key)
+
+        # Without one-hot features
+        featurization["atom_property_list_onehot"] = []
+        graph_dicts = mol_to_graph_dict_batch(self.smiles, **featurization)
+        for this_smiles, graph_dict in zip(self.smiles, graph_dicts):
+            expected = mol_to_graph_dict(this_smiles, **featurization)
+            np.testing.assert_array_equal(graph_dict["data"]["feat"], expected["data"]["feat"])
+
+    def test_positional_encodings_batch_and_on_the_fly(self):
+        pos_encoding_as_features = {
+            "pos_types": {
+                "lap_eigval": {"pos_level": "node", "pos_type": "laplacian_eigval", "num_pos": 3},
+                "rw_pos": {"pos_level": "node", "pos_type": "rw_return_probs", "ksteps": 4},
+                "electrostatic": {"pos_level": "nodepair", "pos_type": "electrostatic"},
+            }
+        }
+        featurization = {"atom_property_list_onehot": ["atomic-number"], "mask_nan": 0.0}
+        smiles = self.smiles + ["not_a_smiles"]
+
+        pe_featurization = dict(featurization, pos_encoding_as_features=pos_encoding_as_features)
+        graphs = [mol_to_pyggraph(this_smiles, **pe_featurization) for this_smiles in smiles]
+        batch_graphs = mol_to_pyggraph_batch(smiles, **pe_featurization)
+        transform = PositionalEncodingTransform(pos_encoding_as_features, mask_nan=0.0, cache_size=2)
+
+        self.assertIsInstance(batch_graphs[-1], str)
+        for ii, (graph, batch_graph) in enumerate(zip(graphs[:-1], batch_graphs[:-1])):
+            self.assertEqual(list(batch_graph.keys()), list(graph.keys()))
+
+            # PE computed on the fly from the graph without PE, and from a graph dict
+            no_pe_graph = mol_to_pyggraph(smiles[ii], **featurization)
+            no_pe_dict = mol_to_graph_dict(smiles[ii], **featurization)
+            lazy_graph = transform(no_pe_graph, key=ii)
+            lazy_dict = transform(no_pe_dict)
+            self.assertNotIn("nodepair_electrostatic", no_pe_graph.keys())
+
+            for key in ["feat", "laplacian_eigval", "rw_return_probs", "nodepair_electrostatic"]:
+                expected = graph[key].float().numpy()
+                np.testing.assert_allclose(batch_graph[key].float().numpy(), expected, atol=1e-3)
+                np.testing.assert_allclose(lazy_graph[key].float().numpy(), expected, atol=1e-3)
+                np.testing.assert_allclose(np.asarray(lazy_dict[key], dtype=np.float32), expected, atol=1e-3)
+
+        self.assertEqual(len(transform._cache), 2)
+
 
 if __name__ == "__main__":
     ut.main()
@@ -0,0 +1,90 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the streaming of the fingerprints to disk
+"""
+
+import os
+import tempfile
+import unittest as ut
+
+import numpy as np
+
+from graphium.finetuning.fingerprinting import FingerprintShardWriter, load_fingerprint_shards
+
+
+class test_FingerprintShardWriter(ut.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.batches = [rng.standard_normal((num_rows, 3)).astype(np.float32) for num_rows in [5, 3, 0, 7, 2]]
+        self.expected = np.concatenate(self.batches, axis=0)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as path:
+            writer = FingerprintShardWriter(path, shard_size=4)
+            self.assertEqual(writer.start(manifest={"spec": ["gnn:1"]}), (0, 0))
+            for batch_idx, batch in enumerate(self.batches):
+                writer.append(batch, batch_idx=batch_idx)
+            index = writer.finalize(num_batches=len(self.batches))
+
+            self.assertEqual(index["num_rows"], len(self.expected))
+            self.assertEqual(index["shard_sizes"], [4, 4, 4, 4, 1])
+            shards = load_fingerprint_shards(path)
+            self.assertTrue(all(isinstance(shard, np.memmap) for shard in shards))
+            np.testing.assert_array_equal(np.concatenate(shards, axis=0), self.expected)
+
+    def test_resume(self):
+        with tempfile.TemporaryDirectory() as path:
+            # Interrupted after the second batch, such that the second shard ends within the 2nd batch
+            writer = FingerprintShardWriter(path, shard_size=3)
+            writer.start(manifest={"spec": ["gnn:1"]})
+            writer.append(self.batches[0], batch_idx=0)
+            writer.append(self.batches[1], batch_idx=1)
+            with self.assertRaises(FileNotFoundError):
+                load_fingerprint_shards(path)
+
+            # Resume from the row following the completed shards
+            writer = FingerprintShardWriter(path, shard_size=3)
+            batch_idx, offset = writer.start(manifest={"spec": ["gnn:1"]})
+            self.assertEqual((batch_idx, offset), (1, 1))
+            writer.append(self.batches[batch_idx][offset:], batch_idx=batch_idx, offset=offset)
+            for batch_idx in range(batch_idx + 1, len(self.batches)):
+                writer.append(self.batches[batch_idx], batch_idx=batch_idx)
+            writer.finalize(num_batches=len(self.batches))
+            np.testing.assert_array_equal(np.concatenate(load_fingerprint_shards(path)), self.expected)
+
+            # A finalized write is fully skipped
+            self.assertEqual(writer.start(manifest={"spec": ["gnn:1"]}), (len(self.batches), 0))
+
+            # A different manifest clears the shards, but not the other files of the folder
+            with open(os.path.join(path, "notes.txt"), "w") as f:
+                f.write("not a shard")
+            writer = FingerprintShardWriter(path, shard_size=3)
+            self.assertEqual(writer.start(manifest={"spec": ["gnn:2"]}), (0, 0))
+            self.assertFalse(os.path.exists(writer.shard_path(0)))
+            self.assertTrue(os.path.isfile(os.path.join(path, "notes.txt")))
+
+    def test_non_empty_folder(self):
+        # A folder with files that were not written by a writer is never cleared
+        with tempfile.TemporaryDirectory() as path:
+            with open(os.path.join(path, "data.npy"), "wb") as f:
+                np.save(f, self.expected)
+            writer = FingerprintShardWriter(path, shard_size=3)
+            with self.assertRaises(FileExistsError):
+                writer.start(manifest={"spec": ["gnn:1"]}, resume=False)
+            np.testing.assert_array_equal(np.load(os.path.join(path, "data.npy")), self.expected)
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,208 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the memory-mapped graph store
+"""
+
+import os
+import pickle
+import tempfile
+import unittest as ut
+from functools import partial
+
+import numpy as np
+import torch
+from torch_geometric.data import Data
+
+from graphium.data.graph_store import GraphStore, GraphStoreSequence, GraphStoreWriter
+from graphium.data.label_store import LabelStore, MoleculeLabels
+from graphium.data.smiles_transform import GraphStoreSmilesTransform, did_featurization_fail
+from graphium.features import mol_to_graph_dict, mol_to_pyggraph, to_dense_array
+
+SMILES = ["CCO", "c1ccccc1O", "C", "CC(=O)NC1=CC=C(O)C=C1", "O=C=O", "CCN(CC)CC"]
+
+FEATURIZATION = {
+    "atom_property_list_onehot": ["atomic-number", "degree"],
+    "atom_property_list_float": ["mass"],
+    "edge_property_list": ["bond-type-onehot"],
+    "pos_encoding_as_features": {
+        "pos_types": {
+            "lap_eigvec": {"pos_level": "node", "pos_type": "laplacian_eigvec", "num_pos": 3},
+            "electrostatic": {"pos_level": "nodepair", "pos_type": "electrostatic"},
+        }
+    },
+}
+
+
+def _make_labels(graphs):
+    labels = []
+    for ii, graph in enumerate(graphs):
+        label = Data(x=torch.empty((graph.num_nodes, 1)), edge_index=torch.empty((2, graph.num_edges)))
+        label["graph_a"] = np.array([ii, 2 * ii], dtype=np.float32)
+        if ii % 2 == 0:  # Missing labels for half of the molecules
+            label["node_b"] = np.arange(graph.num_nodes, dtype=np.float16)[:, None]
+        labels.append(label)
+    return labels
+
+
+class test_GraphStore(ut.TestCase):
+    def test_pyg_graphs(self):
+        graphs = [mol_to_pyggraph(smiles, **FEATURIZATION) for smiles in SMILES]
+        labels = _make_labels(graphs)
+
+        with tempfile.TemporaryDirectory() as path:
+            GraphStoreWriter(path, shard_size=4).write(graphs, labels)
+            self.assertTrue(GraphStore.exists(path))
+            store = GraphStore(path)
+            self.assertEqual(len(store), len(SMILES))
+
+            num_nodes, num_edges = store.get_num_nodes_and_edges()
+            np.testing.assert_array_equal(num_nodes, [g.num_nodes for g in graphs])
+            np.testing.assert_array_equal(num_edges, [g.num_edges for g in graphs])
+
+            labeled_indices = store.get_labeled_indices()
+            np.testing.assert_array_equal(labeled_indices["graph_a"], np.arange(len(SMILES)))
+            np.testing.assert_array_equal(labeled_indices["node_b"], np.arange(0, len(SMILES), 2))
+
+            # The labels of a task are read shard by shard
+            graph_a = np.concatenate(list(store.iter_task_labels("graph_a")))
+            np.testing.assert_array_equal(graph_a, np.stack([label["graph_a"] for label in labels]))
+            node_b = np.concatenate(list(store.iter_task_labels("node_b")))
+            np.testing.assert_array_equal(node_b, np.concatenate([label["node_b"] for label in labels[::2]]))
+
+            # Pickling does not carry the memory-mapped arrays
+            store = pickle.loads(pickle.dumps(store))
+
+            for ii, (graph, label) in enumerate(zip(graphs, labels)):
+                datum = store[ii]
+                loaded_graph, loaded_label = datum["graph_with_features"], datum["labels"]
+                self.assertEqual(loaded_graph.num_nodes, graph.num_nodes)
+                self.assertEqual(set(loaded_graph.keys()), set(graph.keys()))
+                for key in graph.keys():
+                    if isinstance(graph[key], torch.Tensor):
+                        self.assertEqual(loaded_graph[key].dtype, graph[key].dtype)
+                        np.testing.assert_array_equal(loaded_graph[key].numpy(), graph[key].numpy())
+
+                # The labels are views of the columnar label store, with the sizes of the graph
+                self.assertIsInstance(loaded_label, MoleculeLabels)
+                self.assertEqual(set(loaded_label.keys()), set(label.keys()) - {"x", "edge_index"})
+                np.testing.assert_array_equal(loaded_label["graph_a"], label["graph_a"])
+                if ii % 2 == 0:
+                    self.assertEqual(loaded_label["node_b"].dtype, np.float16)
+                    np.testing.assert_array_equal(loaded_label["node_b"], label["node_b"])
+                self.assertEqual(loaded_label.num_nodes, graph.num_nodes)
+                self.assertEqual(loaded_label.num_edges, graph.num_edges)
+
+            label_store = store.label_store
+            self.assertIsInstance(label_store, LabelStore)
+            np.testing.assert_array_equal(label_store.mol_indices["node_b"], labeled_indices["node_b"])
+            np.testing.assert_array_equal(label_store.get_task_values("node_b"), node_b)
+
+    def test_graph_dict(self):
+        graphs = [mol_to_graph_dict(smiles, **FEATURIZATION) for smiles in SMILES]
+
+        with tempfile.TemporaryDirectory() as path:
+            GraphStoreWriter(path, shard_size=2).write(graphs)
+            store = GraphStore(path)
+
+            for ii, graph in enumerate(graphs):
+                loaded_graph = store.get_features(ii)
+                self.assertEqual(loaded_graph.dtype, graph.dtype)
+                self.assertEqual(loaded_graph.mask_nan, graph.mask_nan)
+                np.testing.assert_array_equal(to_dense_array(loaded_graph.adj), to_dense_array(graph.adj))
+                for key in ["feat", "edge_feat", "laplacian_eigvec", "nodepair_electrostatic"]:
+                    np.testing.assert_array_equal(loaded_graph[key], graph[key])
+
+                # The PyG graphs built from the store are identical
+                pyg_graph, loaded_pyg_graph = graph.make_pyg_graph(), loaded_graph.make_pyg_graph()
+                for key in pyg_graph.keys():
+                    if isinstance(pyg_graph[key], torch.Tensor):
+                        np.testing.assert_array_equal(loaded_pyg_graph[key].numpy(), pyg_graph[key].numpy())
+
+            with self.assertRaises(IndexError):
+                store.get_features(len(graphs))
+
+    def test_resume(self):
+        graphs = [mol_to_pyggraph(smiles, **FEATURIZATION) for smiles in SMILES]
+        labels = _make_labels(graphs)
+
+        with tempfile.TemporaryDirectory() as path:
+            # Simulate a write interrupted after the second shard
+            writer = GraphStoreWriter(path, shard_size=2)
+            self.assertEqual(writer.start(len(graphs)), {})
+            writer.write_shard(1, graphs[2:4], labels[2:4])
+            self.assertTrue(GraphStoreWriter.is_partial(path))
+            self.assertFalse(GraphStore.exists(path))
+            self.assertEqual(list(writer.completed_shards(len(graphs)).keys()), [1])
+
+            # The completed shard is not written again
+            mtime = os.path.getmtime(os.path.join(writer.shard_path(1), "edge_index.npy"))
+            writer.write(graphs, labels)
+            self.assertEqual(os.path.getmtime(os.path.join(writer.shard_path(1), "edge_index.npy")), mtime)
+            self.assertFalse(GraphStoreWriter.is_partial(path))
+
+            store = GraphStore(path)
+            self.assertEqual(len(store), len(graphs))
+            for ii, graph in enumerate(graphs):
+                np.testing.assert_array_equal(store.get_features(ii)["feat"].numpy(), graph["feat"].numpy())
+
+            # A different layout clears the previous shards, but not the other files of the folder
+            with open(os.path.join(path, "notes.txt"), "w") as f:
+                f.write("not a shard")
+            writer = GraphStoreWriter(path, shard_size=4)
+            self.assertEqual(writer.start(len(graphs)), {})
+            self.assertFalse(os.path.exists(GraphStoreWriter(path, shard_size=2).shard_path(2)))
+            self.assertTrue(os.path.isfile(os.path.join(path, "notes.txt")))
+
+        # A non-empty folder that was not written by a writer is refused
+        with tempfile.TemporaryDirectory() as path:
+            with open(os.path.join(path, "notes.txt"), "w") as f:
+                f.write("not a shard")
+            with self.assertRaises(FileExistsError):
+                GraphStoreWriter(path, shard_size=2).start(len(graphs))
+
+    def test_streaming_featurization(self):
+        smiles = SMILES[:3] + ["not_a_smiles"] + SMILES[3:]
+        transform = partial(mol_to_pyggraph, **FEATURIZATION)
+
+        with tempfile.TemporaryDirectory() as path:
+            writer = GraphStoreWriter(path, shard_size=3)
+            completed = writer.start(len(smiles))
+            num_shards = writer.num_shards(len(smiles))
+            shard_params = [(ii, smiles[3 * ii : 3 * ii + 3]) for ii in range(num_shards)]
+            writer.write_shards(
+                shard_params, completed, write_fn=GraphStoreSmilesTransform(transform, writer)
+            )
+
+            features = GraphStoreSequence(GraphStore(path))
+            self.assertEqual(len(features), len(smiles))
+            self.assertEqual(features.idx_none, [3])
+            self.assertTrue(did_featurization_fail(features[3]))
+            for ii, this_smiles in enumerate(smiles):
+                if ii == 3:
+                    continue
+                graph = transform(this_smiles)
+                np.testing.assert_array_equal(features[ii]["feat"].numpy(), graph["feat"].numpy())
+                np.testing.assert_array_equal(features[ii]["edge_index"].numpy(), graph["edge_index"].numpy())
+
+    def test_empty(self):
+        with tempfile.TemporaryDirectory() as path:
+            GraphStoreWriter(path).write([], [])
+            store = GraphStore(path)
+            self.assertEqual(len(store), 0)
+            self.assertEqual(len(store.get_num_nodes_and_edges()[0]), 0)
+
+
+if __name__ == "__main__":
+    ut.main()
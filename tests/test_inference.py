@@ -0,0 +1,116 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the batch inference engine
+"""
+
+import os
+import tempfile
+import unittest as ut
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import torch
+
+from graphium.features import mol_to_graph_dict
+from graphium.trainer.inference import InferenceEngine
+
+SMILES = ["CCO", "c1ccccc1O", "C", "not_a_smiles", "CC(=O)NC1=CC=C(O)C=C1", "O=C=O", "CCN(CC)CC"]
+
+FEATURIZATION = {
+    "atom_property_list_onehot": ["atomic-number", "degree"],
+    "atom_property_list_float": ["mass"],
+    "edge_property_list": ["bond-type-onehot"],
+}
+
+
+class _NodeSumPredictor(torch.nn.Module):
+    """Predicts the sum of the node features of each molecule, and of each node"""
+
+    def __init__(self):
+        super().__init__()
+        self.scale = torch.nn.Parameter(torch.ones(1))
+        self.featurization = FEATURIZATION
+        self.task_levels = {"graph_sum": "graph", "node_sum": "node"}
+        self.task_norms = None
+        self.model = SimpleNamespace(task_heads=SimpleNamespace(out_dim={"graph_sum": 1, "node_sum": 1}))
+
+    def forward(self, inputs):
+        feats = inputs["features"]
+        node_sum = feats["feat"].sum(dim=-1) * self.scale
+        graph_sum = torch.zeros(feats.num_graphs, dtype=node_sum.dtype)
+        graph_sum = graph_sum.index_add_(0, feats["batch"], node_sum)
+        return {"preds": {"graph_sum": graph_sum[:, None], "node_sum": node_sum[:, None]}}
+
+
+class test_InferenceEngine(ut.TestCase):
+    def setUp(self):
+        self.expected = []
+        for smiles in SMILES:
+            graph = mol_to_graph_dict(smiles, **FEATURIZATION)
+            self.expected.append(np.nan if isinstance(graph, str) else np.asarray(graph["feat"]).sum())
+
+    def test_predict_smiles(self):
+        engine = InferenceEngine(_NodeSumPredictor(), max_num_nodes=20, max_batch_size=2)
+        self.assertEqual(engine.tasks, ["graph_sum"])
+
+        chunks = [SMILES[:4], SMILES[4:]]
+        preds = list(engine.predict_smiles(chunks))
+        self.assertEqual(len(preds), 2)
+        for chunk_preds, chunk in zip(preds, chunks):
+            self.assertEqual(chunk_preds["graph_sum"].shape, (len(chunk), 1))
+        all_preds = np.concatenate([chunk_preds["graph_sum"][:, 0] for chunk_preds in preds])
+        np.testing.assert_allclose(all_preds, self.expected, rtol=1e-5)
+
+    def test_failed_chunk(self):
+        predictor = _NodeSumPredictor()
+        predictor.model.task_heads.out_dim["graph_sum"] = 3
+        engine = InferenceEngine(predictor, num_threads=1)
+        num_threads = torch.get_num_threads()
+
+        # The width of the predictions comes from the task heads, even if all the molecules failed
+        preds = engine.predict_features(["failed", "failed"])
+        self.assertEqual(preds["graph_sum"].shape, (2, 3))
+        self.assertTrue(np.isnan(preds["graph_sum"]).all())
+        columns = list(engine.predictions_to_dataframe(preds).columns)
+        self.assertListEqual(columns, ["graph_sum-0", "graph_sum-1", "graph_sum-2"])
+
+        # The number of threads of the process is left unchanged
+        self.assertEqual(torch.get_num_threads(), num_threads)
+
+    def test_predict_file(self):
+        engine = InferenceEngine(_NodeSumPredictor(), max_batch_size=3)
+        with tempfile.TemporaryDirectory() as path:
+            input_path = os.path.join(path, "molecules.csv")
+            ids = [f"mol_{ii}" for ii in range(len(SMILES))]
+            pd.DataFrame({"mol_id": ids, "SMILES": SMILES, "other": 0}).to_csv(input_path, index=False)
+
+            for output_path in [os.path.join(path, "preds.csv"), os.path.join(path, "preds.parquet")]:
+                num_molecules = engine.predict_file(
+                    input_path, output_path, smiles_col="SMILES", keep_cols=["mol_id"], chunk_size=3
+                )
+                self.assertEqual(num_molecules, len(SMILES))
+
+                if output_path.endswith(".csv"):
+                    df = pd.read_csv(output_path)
+                else:
+                    df = pd.read_parquet(output_path)
+                self.assertListEqual(list(df.columns), ["SMILES", "mol_id", "graph_sum"])
+                self.assertListEqual(df["mol_id"].tolist(), ids)
+                np.testing.assert_allclose(df["graph_sum"].to_numpy(), self.expected, rtol=1e-5)
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -0,0 +1,166 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the columnar label store
+"""
+
+import pickle
+import unittest as ut
+
+import numpy as np
+import torch
+from torch_geometric.data import Data
+
+from graphium.data.collate import collate_labels
+from graphium.data.label_store import LabelStore, MoleculeLabels
+
+NUM_NODES = [3, 1, 4, 2, 5]
+NUM_EDGES = [4, 0, 6, 2, 8]
+
+
+def _make_entries():
+    mol_indices, tasks, labels = [], [], []
+    for ii, num_nodes in enumerate(NUM_NODES):
+        if ii != 1:
+            mol_indices.append(ii)
+            tasks.append("graph_a")
+            labels.append(np.array([ii, 2 * ii], dtype=np.float32))
+        if ii % 2 == 0:  # Missing labels for half of the molecules
+            mol_indices.append(ii)
+            tasks.append("node_b")
+            labels.append(np.arange(num_nodes, dtype=np.float64)[:, None] + ii)
+    mol_indices.append(3)
+    tasks.append("graph_c")
+    labels.append(1.5)
+    return mol_indices, tasks, labels
+
+
+class test_LabelStore(ut.TestCase):
+    def setUp(self):
+        mol_indices, tasks, labels = _make_entries()
+        # The entries are not sorted by molecule, and the last label of a molecule is kept
+        order = np.random.default_rng(42).permutation(len(labels))
+        mol_indices = [mol_indices[ii] for ii in order] + [0]
+        tasks = [tasks[ii] for ii in order] + ["graph_a"]
+        labels = [labels[ii] for ii in order] + [np.array([-1, -2], dtype=np.float32)]
+        self.store = LabelStore.from_entries(len(NUM_NODES), mol_indices, tasks, labels)
+        self.store.set_graph_sizes(NUM_NODES, NUM_EDGES)
+
+    def test_getitem(self):
+        self.assertEqual(len(self.store), len(NUM_NODES))
+        np.testing.assert_array_equal(self.store.get_labeled_indices()["graph_a"], [0, 2, 3, 4])
+        np.testing.assert_array_equal(self.store.get_labeled_indices()["node_b"], [0, 2, 4])
+
+        label = self.store[0]
+        self.assertEqual(set(label.keys()), {"graph_a", "node_b"})
+        np.testing.assert_array_equal(label["graph_a"], [-1, -2])
+        self.assertEqual(label["graph_a"].dtype, np.float32)
+        np.testing.assert_array_equal(label["node_b"], np.arange(3)[:, None])
+        self.assertEqual((label.num_nodes, label.num_edges), (3, 4))
+
+        self.assertEqual(set(self.store[1].keys()), set())
+        self.assertEqual(self.store[3]["graph_c"].shape, ())
+        self.assertEqual(self.store[3]["graph_c"], 1.5)
+        np.testing.assert_array_equal(self.store[-1]["node_b"], np.arange(5)[:, None] + 4)
+        with self.assertRaises(IndexError):
+            self.store[len(NUM_NODES)]
+
+    def test_setitem(self):
+        label = self.store[2]
+        label["node_b"] = label["node_b"] * 10
+        np.testing.assert_array_equal(self.store[2]["node_b"], 10 * (np.arange(4)[:, None] + 2))
+        np.testing.assert_array_equal(self.store[4]["node_b"], np.arange(5)[:, None] + 4)
+        with self.assertRaises(KeyError):
+            label["graph_c"] = 1.0
+
+    def test_task_values(self):
+        expected = [[-1, -2], [2, 4], [3, 6], [4, 8]]
+        np.testing.assert_array_equal(self.store.get_task_values("graph_a"), expected)
+        self.assertEqual(self.store.get_task_values("graph_c").shape, (1,))
+        self.assertEqual(self.store.get_task_values("node_b").shape, (3 + 4 + 5, 1))
+
+        # The labels are replaced in bulk, and seen by the views of each molecule
+        self.store.set_task_values("node_b", self.store.get_task_values("node_b") - 1)
+        np.testing.assert_array_equal(self.store[2]["node_b"], np.arange(4)[:, None] + 1)
+        with self.assertRaises(ValueError):
+            self.store.set_task_values("graph_a", np.zeros(3))
+
+    def test_take(self):
+        indices = [4, 1, 0, 0]
+        store = self.store.take(indices)
+        self.assertEqual(len(store), len(indices))
+        for ii, idx in enumerate(indices):
+            self.assertEqual(set(store[ii].keys()), set(self.store[idx].keys()))
+            self.assertEqual(store[ii].num_nodes, NUM_NODES[idx])
+            for task in store[ii].keys():
+                np.testing.assert_array_equal(store[ii][task], self.store[idx][task])
+
+        store = self.store[1:4]
+        self.assertIsInstance(store, LabelStore)
+        np.testing.assert_array_equal(store[2]["graph_c"], self.store[3]["graph_c"])
+
+    def test_pickle(self):
+        # A single view does not carry the full store
+        label = pickle.loads(pickle.dumps(self.store[2]))
+        self.assertIsInstance(label, MoleculeLabels)
+        self.assertEqual(len(label._store), 1)
+        np.testing.assert_array_equal(label["node_b"], self.store[2]["node_b"])
+        self.assertEqual(label.num_edges, NUM_EDGES[2])
+
+        store = pickle.loads(pickle.dumps(self.store))
+        np.testing.assert_array_equal(store[4]["graph_a"], self.store[4]["graph_a"])
+
+    def test_collate(self):
+        # Collating the views is the same as collating the label `Data` with placeholders of the sizes
+        labels_size_dict = {"graph_a": [2], "node_b": [1], "graph_c": [1]}
+        labels_dtype_dict = {"graph_a": torch.float32, "node_b": torch.float64, "graph_c": torch.float64}
+        views = list(self.store)
+        data_labels = []
+        for view in views:
+            label = Data(x=torch.empty((view.num_nodes, 1)), edge_index=torch.empty((2, view.num_edges)))
+            for task, value in view.items():
+                label[task] = value.copy()
+            data_labels.append(label)
+
+        collated = collate_labels(views, labels_size_dict, labels_dtype_dict)
+        expected = collate_labels(data_labels, labels_size_dict, labels_dtype_dict)
+        for key in list(labels_size_dict.keys()) + ["batch", "ptr"]:
+            self.assertEqual(collated[key].dtype, expected[key].dtype)
+            np.testing.assert_array_equal(collated[key].numpy(), expected[key].numpy())
+        self.assertEqual(collated["x"].shape, expected["x"].shape)
+        self.assertEqual(collated["edge_index"].shape, expected["edge_index"].shape)
+
+        # A shuffled subset of the molecules, as in a batch of the dataloader, gathered from the store
+        order = [3, 0, 4, 2]
+        collated = collate_labels([views[ii] for ii in order], labels_size_dict, labels_dtype_dict)
+        expected = collate_labels([data_labels[ii] for ii in order], labels_size_dict, labels_dtype_dict)
+        for key in list(labels_size_dict.keys()) + ["batch", "ptr"]:
+            self.assertEqual(collated[key].dtype, expected[key].dtype)
+            np.testing.assert_array_equal(collated[key].numpy(), expected[key].numpy())
+
+        # Labels of another shape than the expected one are reshaped per molecule, as for `Data`
+        labels_size_dict = {"graph_a": [3], "node_b": [1], "graph_c": [1]}
+        collated = collate_labels([views[ii] for ii in order], labels_size_dict, labels_dtype_dict)
+        expected = collate_labels([data_labels[ii] for ii in order], labels_size_dict, labels_dtype_dict)
+        self.assertEqual(collated["graph_a"].shape, torch.Size([4, 3]))
+        np.testing.assert_array_equal(collated["graph_a"].numpy(), expected["graph_a"].numpy())
+
+        # Without the label sizes, the views are converted to `Data`
+        collated = collate_labels([views[0], views[2], views[4]])
+        self.assertEqual(collated.num_graphs, 3)
+        np.testing.assert_array_equal(collated["graph_a"].numpy(), [-1, -2, 2, 4, 4, 8])
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -226,6 +226,94 @@ class test_MetricWrapper(ut.TestCase):
 
             assert score == expected_score
 
+    def test_streaming(self):
+        torch.manual_seed(42)
+        preds = torch.rand(500, 3)
+        target = preds + 0.3 * torch.randn(500, 3)
+        target[torch.rand(500, 3) > 0.8] = float("nan")
+        binary_target = (target > 0.5).float()
+        binary_target[target.isnan()] = float("nan")
+
+        for metric in ["mae", "mse", "pearsonr", "r2_score", "auroc", "averageprecision"]:
+            for multitask_handling in ["flatten", "mean-per-label"]:
+                err_msg = f"{metric} - {multitask_handling}"
+                this_target = binary_target if metric in ["auroc", "averageprecision"] else target
+                kwargs = {"task": "binary"} if metric in ["auroc", "averageprecision"] else {}
+                metric_wrapper = MetricWrapper(
+                    metric=metric,
+                    target_nan_mask="ignore",
+                    multitask_handling=multitask_handling,
+                    target_to_int=metric in ["auroc", "averageprecision"],
+                    **kwargs,
+                )
+                self.assertTrue(metric_wrapper.is_streamable())
+
+                # Accumulate the batches, then compare to the metric of the full tensors
+                state = None
+                for start in range(0, len(preds), 64):
+                    end = start + 64
+                    state = metric_wrapper.update_state(state, preds[start:end], this_target[start:end])
+                expected = metric_wrapper(preds, this_target)
+                streamed = metric_wrapper.compute_state(state)
+                self.assertAlmostEqual(streamed.item(), expected.item(), places=3, msg=err_msg)
+
+        # Logits are detected on the first batch, even if a later batch is within [0, 1]
+        logits = 3 * torch.randn(500, 1)
+        logits[64:128] = torch.rand(64, 1)
+        metric_wrapper = MetricWrapper(
+            metric="auroc", target_nan_mask="ignore", task="binary", target_to_int=True
+        )
+        state = None
+        for start in range(0, len(logits), 64):
+            end = start + 64
+            state = metric_wrapper.update_state(state, logits[start:end], binary_target[start:end, :1])
+        self.assertTrue(state.apply_sigmoid)
+        expected = metric_wrapper(logits, binary_target[:, :1])
+        self.assertAlmostEqual(metric_wrapper.compute_state(state).item(), expected.item(), places=3)
+
+        # Metrics that cannot be accumulated
+        self.assertFalse(MetricWrapper(metric="spearmanr").is_streamable())
+        self.assertFalse(MetricWrapper(metric="mse", threshold_kwargs={"threshold": 0.5}).is_streamable())
+        self.assertFalse(MetricWrapper(metric="mae", squeeze_targets=True).is_streamable())
+        with self.assertRaises(ValueError):
+            MetricWrapper(metric="spearmanr").update_state(None, preds, target)
+        with self.assertRaises(ValueError):
+            MetricWrapper(metric="mse").update_state(None, preds[:, :1], target)
+
+    def test_mean_per_label_batched(self):
+        torch.manual_seed(42)
+        preds = torch.rand(200, 5)
+        target = preds + 0.3 * torch.randn(200, 5)
+        target[torch.rand(200, 5) > 0.7] = float("nan")
+        target[:, 4] = float("nan")  # A column without labels is ignored
+        binary_target = (target > 0.5).float()
+        binary_target[target.isnan()] = float("nan")
+
+        metrics = ["mae", "mse", "pearsonr", "r2_score", torch.nn.MSELoss(), torch.nn.BCEWithLogitsLoss()]
+        for metric in metrics:
+            this_target = binary_target if isinstance(metric, torch.nn.BCEWithLogitsLoss) else target
+            metric_wrapper = MetricWrapper(
+                metric, target_nan_mask="ignore", multitask_handling="mean-per-label"
+            )
+            self.assertTrue(metric_wrapper._is_batchable(classifigression=False), msg=str(metric))
+
+            # Compare to the metric computed on each column
+            expected = []
+            for ii in range(4):
+                is_valid = ~this_target[:, ii].isnan()
+                expected.append(metric_wrapper.metric(preds[is_valid, ii], this_target[is_valid, ii]))
+            expected = torch.stack(expected).mean()
+            self.assertAlmostEqual(metric_wrapper(preds, this_target).item(), expected.item(), places=4)
+
+        # The gradient of the loss is not affected by the NaNs
+        preds.requires_grad_(True)
+        loss_wrapper = MetricWrapper(
+            torch.nn.MSELoss(), target_nan_mask="ignore", multitask_handling="mean-per-label"
+        )
+        loss_wrapper(preds, target).backward()
+        self.assertTrue(torch.isfinite(preds.grad).all())
+        self.assertTrue((preds.grad[:, 4] == 0).all())
+
 
 if __name__ == "__main__":
     ut.main()
@@ -0,0 +1,82 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the persistent index of molecule IDs
+"""
+
+import tempfile
+import unittest as ut
+from unittest import mock
+
+import numpy as np
+
+from graphium.data import smiles_transform
+from graphium.data.mol_id_index import MolIdIndex
+from graphium.data.smiles_transform import smiles_to_unique_mol_id, smiles_to_unique_mol_ids
+
+SMILES = ["CCO", "c1ccccc1O", "C", "CC(=O)NC1=CC=C(O)C=C1", "O=C=O", "CCN(CC)CC"]
+
+
+class test_MolIdIndex(ut.TestCase):
+    def test_lookup_and_add(self):
+        mol_ids = [smiles_to_unique_mol_id(smiles) for smiles in SMILES]
+
+        with tempfile.TemporaryDirectory() as path:
+            index = MolIdIndex(path, max_segments=2)
+            found_ids, idx_missing = index.lookup(SMILES)
+            np.testing.assert_array_equal(idx_missing, np.arange(len(SMILES)))
+            self.assertTrue(all(mol_id == "" for mol_id in found_ids))
+
+            # Add the first smiles in one run, with a failed one, and the others in a second run
+            index.add(SMILES[:3] + ["not_a_smiles"], mol_ids[:3] + [""])
+            index.add(SMILES[3:], mol_ids[3:])
+            self.assertEqual(len(index.segments()), 2)
+
+            found_ids, idx_missing = MolIdIndex(path).lookup(SMILES[::-1] + ["not_a_smiles", "CCCC"])
+            np.testing.assert_array_equal(idx_missing, [len(SMILES) + 1])
+            self.assertEqual(found_ids[: len(SMILES)].tolist(), mol_ids[::-1])
+            self.assertEqual(found_ids[len(SMILES)], "")
+
+            # Too many segments are merged into one
+            index.add(["CCCC"], [smiles_to_unique_mol_id("CCCC")])
+            self.assertEqual(len(index.segments()), 1)
+            _, idx_missing = index.lookup(SMILES + ["CCCC"])
+            self.assertEqual(len(idx_missing), 0)
+
+            with self.assertRaises(ValueError):
+                index.add(["CC"], [])
+
+    def test_smiles_to_unique_mol_ids(self):
+        smiles = SMILES + SMILES[:2] + ["not_a_smiles"]
+        expected = smiles_to_unique_mol_ids(smiles, n_jobs=0, progress=False)
+        self.assertEqual(expected[:-1], [smiles_to_unique_mol_id(this_smiles) for this_smiles in smiles[:-1]])
+        self.assertEqual(expected[-1], "")
+
+        with tempfile.TemporaryDirectory() as path:
+            index = MolIdIndex(path)
+            mol_ids = smiles_to_unique_mol_ids(smiles, n_jobs=0, progress=False, mol_id_index=index)
+            self.assertEqual(mol_ids, expected)
+
+            # Only the smiles that are not in the index are converted
+            wrapped = mock.Mock(wraps=smiles_transform.smiles_to_unique_mol_id)
+            with mock.patch.object(smiles_transform, "smiles_to_unique_mol_id", wrapped):
+                mol_ids = smiles_to_unique_mol_ids(
+                    ["CCCC"] + smiles, n_jobs=0, progress=False, mol_id_index=index
+                )
+            self.assertEqual(mol_ids, [smiles_to_unique_mol_id("CCCC")] + expected)
+            self.assertEqual(wrapped.call_count, 1)
+
+
+if __name__ == "__main__":
+    ut.main()
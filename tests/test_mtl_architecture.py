@@ -339,6 +339,79 @@ class test_TaskHeads(ut.TestCase):
             list(feat_out["task_4"].shape), [batch_graph, batch_nodepair, task_4_kwargs["out_dim"]]
         )  # nodepair level task
 
+    def test_task_heads_fused(self):
+        in_dim = 8  # Dimension of the incoming data
+        in_dim_edges = 8
+
+        # Heads `task_1` and `task_5` are fused, `task_6` has a different depth and `task_7` a normalization
+        task_5_params = deepcopy(task_1_params)
+        task_5_params["out_dim"] = 2
+        task_6_params = deepcopy(task_1_params)
+        task_6_params["hidden_dims"] = [5, 6]
+        task_7_params = deepcopy(task_1_params)
+        task_7_params["normalization"] = "layer_norm"
+        task_heads_params = {
+            "task_1": task_1_params,
+            "task_2": task_2_params,
+            "task_3": task_3_params,
+            "task_4": task_4_params,
+            "task_5": task_5_params,
+            "task_6": task_6_params,
+            "task_7": task_7_params,
+        }
+        graph_output_nn_kwargs = {
+            "node": node_level_kwargs,
+            "edge": edge_level_kwargs,
+            "graph": graph_level_kwargs,
+            "nodepair": nodepair_level_kwargs,
+        }
+
+        for last_layer_is_readout in [False, True]:
+            heads_kwargs = dict(
+                in_dim=in_dim,
+                in_dim_edges=in_dim_edges,
+                task_heads_kwargs=task_heads_params,
+                graph_output_nn_kwargs=graph_output_nn_kwargs,
+                last_layer_is_readout=last_layer_is_readout,
+            )
+            multi_head_nn = TaskHeads(**heads_kwargs)
+            fused_head_nn = TaskHeads(**heads_kwargs, fuse_heads=True)
+            fused_head_nn.load_state_dict(multi_head_nn.state_dict())
+            self.assertListEqual(fused_head_nn._fused_groups, [["task_1", "task_5"]])
+
+            multi_head_nn.eval()
+            fused_head_nn.eval()
+            bg = toy_test_data(in_dim=in_dim, in_dim_edges=in_dim_edges)[0]
+            feat_out = multi_head_nn.forward(deepcopy(bg))
+            fused_feat_out = fused_head_nn.forward(deepcopy(bg))
+
+            self.assertListEqual(list(fused_feat_out.keys()), list(feat_out.keys()))
+            for task_name, out in feat_out.items():
+                torch.testing.assert_close(fused_feat_out[task_name], out, msg=task_name)
+
+            # The gradients flow to the parameters of each fused head
+            fused_feat_out["task_5"].sum().backward()
+            self.assertTrue(fused_head_nn.task_heads["task_5"].layers[0].linear.weight.grad.any())
+            self.assertFalse(fused_head_nn.task_heads["task_1"].layers[0].linear.weight.grad.any())
+            self.assertEqual(len(fused_head_nn._fused_weights_cache), 0)
+
+            # The stacked weights are cached for inference, until new weights are loaded
+            with torch.inference_mode():
+                fused_feat_out = fused_head_nn.forward(deepcopy(bg))
+            self.assertEqual(list(fused_head_nn._fused_weights_cache.keys()), [("task_1", "task_5")])
+            torch.testing.assert_close(fused_feat_out["task_5"], feat_out["task_5"].detach())
+
+            with torch.no_grad():
+                multi_head_nn.task_heads["task_5"].layers[0].linear.weight.mul_(2.0)
+            fused_head_nn.load_state_dict(multi_head_nn.state_dict())
+            self.assertEqual(len(fused_head_nn._fused_weights_cache), 0)
+            with torch.inference_mode():
+                feat_out = multi_head_nn.forward(deepcopy(bg))
+                fused_feat_out = fused_head_nn.forward(deepcopy(bg))
+            torch.testing.assert_close(fused_feat_out["task_5"], feat_out["task_5"])
+            fused_head_nn.train()
+            self.assertEqual(len(fused_head_nn._fused_weights_cache), 0)
+
     def test_task_heads_non_supported_level(self):
         in_dim = 8  # Dimension of the incoming data
         in_dim_edges = 8
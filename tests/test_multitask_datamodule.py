@@ -305,6 +305,19 @@ class Test_Multitask_DataModule(ut.TestCase):
         assert output.shape[0] == num_graphs
         assert output.shape[1] == len(label_cols)
 
+    def test_extract_graph_level_dtype(self):
+        # The floating dtype of the label columns is kept, and the other columns are converted to float64
+        df = pd.DataFrame({"a": np.asarray([1.0, np.nan, 3.0], dtype=np.float32), "b": [1, 2, 3]})
+        output = graphium.data.datamodule.extract_labels(df, "graph", ["a"])
+        assert output.dtype == np.float32
+        np.testing.assert_array_equal(output[:, 0], df["a"].to_numpy())
+
+        output = graphium.data.datamodule.extract_labels(df, "graph", ["b"])
+        assert output.dtype == np.float64
+        output = graphium.data.datamodule.extract_labels(df.astype({"b": "Int64"}), "graph", ["a", "b"])
+        assert output.dtype == np.float64
+        assert np.isnan(output[1, 0])
+
     def test_extract_graph_level_multitask_missing_cols(self):
         df = pd.read_parquet(f"tests/converted_fake_multilevel_data.parquet")
         num_graphs = len(df)
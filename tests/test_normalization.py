@@ -0,0 +1,59 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the label normalization
+"""
+
+import unittest as ut
+
+import numpy as np
+
+from graphium.data.normalization import LabelNormalization
+
+
+class test_LabelNormalization(ut.TestCase):
+    def test_statistics_from_chunks(self):
+        rng = np.random.default_rng(42)
+        labels = rng.normal(loc=3.0, scale=2.0, size=(1000, 3)).astype(np.float32)
+        labels[rng.random(labels.shape) < 0.2] = np.nan
+        labels[:, 2] = np.nan
+        labels[700:, 2] = 5.0  # A column only labeled in the last chunk
+
+        expected, streamed = LabelNormalization(verbose=False), LabelNormalization(verbose=False)
+        expected.calculate_statistics(labels)
+        chunks = [labels[:300], labels[300:300], labels[300:650], labels[650:]]
+        streamed.calculate_statistics_from_chunks(chunks)
+        for name in ["data_max", "data_min", "data_mean", "data_std"]:
+            np.testing.assert_allclose(getattr(streamed, name), getattr(expected, name), rtol=1e-4)
+
+        # Scalar labels give scalar statistics
+        streamed.calculate_statistics_from_chunks([labels[:500, 0], labels[500:, 0]])
+        self.assertIsInstance(streamed.data_mean, float)
+        self.assertAlmostEqual(streamed.data_mean, float(np.nanmean(labels[:, 0])), places=4)
+
+        with self.assertRaises(ValueError):
+            streamed.calculate_statistics_from_chunks([])
+
+    def test_normalize(self):
+        labels = np.asarray([[1.0, 10.0], [3.0, 30.0], [np.nan, 20.0]])
+        norm = LabelNormalization(method="normal", verbose=False)
+        norm.calculate_statistics(labels)
+        normalized = norm.normalize(labels)
+        np.testing.assert_allclose(np.nanmean(normalized, axis=0), [0.0, 0.0], atol=1e-12)
+        np.testing.assert_allclose(np.nanstd(normalized, axis=0), [1.0, 1.0])
+        self.assertTrue(np.isnan(normalized[2, 0]))
+
+
+if __name__ == "__main__":
+    ut.main()
@@ -21,9 +21,16 @@ import unittest as ut
 
 # from graphium.features.spectral import compute_laplacian_positional_eigvecs # TODO: add tests
 # from graphium.features.rw import compute_rwse # TODO: add tests
-from graphium.features.electrostatic import compute_electrostatic_interactions
-from graphium.features.commute import compute_commute_distances
-from graphium.features.graphormer import compute_graphormer_distances
+from graphium.features.electrostatic import (
+    compute_electrostatic_interactions,
+    compute_electrostatic_interactions_batch,
+)
+from graphium.features.commute import compute_commute_distances, compute_commute_distances_batch
+from graphium.features.graphormer import compute_graphormer_distances, get_shortest_path_distances_batch
+from graphium.features.positional_encoding import (
+    get_all_positional_encodings,
+    get_all_positional_encodings_batch,
+)
 
 
 class test_positional_encodings(ut.TestCase):
@@ -86,6 +93,64 @@ class test_positional_encodings(ut.TestCase):
             pe, _, _ = compute_graphormer_distances(adj, adj.shape[0], cache={})
             np.testing.assert_array_almost_equal(pe.max(), self.max_dict[key])
 
+    def test_graphormer_distances(self):
+        for _, adj in self.adj_dict.items():
+            pe, _, _ = compute_graphormer_distances(adj, adj.shape[0], cache={})
+            expected = nx.floyd_warshall_numpy(nx.from_numpy_array(adj), weight=None)
+            np.testing.assert_array_equal(pe, expected)
+
+        # Disconnected nodes have no distance
+        adj = nx.to_numpy_array(nx.disjoint_union(nx.path_graph(2), nx.path_graph(3)))
+        with self.assertRaises(ValueError):
+            compute_graphormer_distances(adj, adj.shape[0], cache={})
+
+        # The batched distances are the same, with `inf` between disconnected nodes
+        adjs = np.stack([self.adj_dict["5-path"], nx.to_numpy_array(nx.star_graph(4)), adj])
+        dist = get_shortest_path_distances_batch(adjs)
+        for ii, this_adj in enumerate(adjs):
+            expected = nx.floyd_warshall_numpy(nx.from_numpy_array(this_adj), weight=None)
+            np.testing.assert_array_equal(dist[ii], expected)
+
+    def test_pinv_encodings_batch(self):
+        adjs = np.stack([self.adj_dict["5-path"], nx.to_numpy_array(nx.star_graph(4))])
+        commute = compute_commute_distances_batch(adjs)
+        electrostatic = compute_electrostatic_interactions_batch(adjs)
+        for ii, adj in enumerate(adjs):
+            pe, _, _ = compute_commute_distances(adj, adj.shape[0], cache={})
+            np.testing.assert_allclose(commute[ii], pe, atol=1e-8)
+            pe, _, _ = compute_electrostatic_interactions(adj, cache={})
+            np.testing.assert_allclose(electrostatic[ii], pe, atol=1e-8)
+
+    def test_batch(self):
+        pos_kwargs = {
+            "pos_types": {
+                "rw_pos": {"pos_level": "node", "pos_type": "rw_return_probs", "ksteps": [2, 4]},
+                "rw_nodepair": {"pos_level": "nodepair", "pos_type": "rw_transition_probs", "ksteps": 3},
+                "lap_eigval": {"pos_level": "node", "pos_type": "laplacian_eigval", "num_pos": 3},
+                "electrostatic": {"pos_level": "nodepair", "pos_type": "electrostatic"},
+                "commute": {"pos_level": "nodepair", "pos_type": "commute"},
+            }
+        }
+
+        # Graphs of the same size are batched together, including a disconnected one
+        adjs = [
+            self.adj_dict["5-path"],
+            nx.to_numpy_array(nx.star_graph(4)),
+            nx.to_numpy_array(nx.disjoint_union(nx.path_graph(2), nx.path_graph(3))),
+            self.adj_dict["4-clique"],
+            np.zeros((1, 1)),
+        ]
+        num_nodes = [adj.shape[0] for adj in adjs]
+
+        batch_pe_dicts = get_all_positional_encodings_batch(adjs, num_nodes, pos_kwargs)
+        self.assertEqual(len(batch_pe_dicts), len(adjs))
+        for adj, batch_pe_dict in zip(adjs, batch_pe_dicts):
+            pe_dict = get_all_positional_encodings(adj, adj.shape[0], pos_kwargs)
+            self.assertEqual(list(batch_pe_dict.keys()), list(pe_dict.keys()))
+            for key, pe in pe_dict.items():
+                self.assertEqual(batch_pe_dict[key].shape, pe.shape)
+                np.testing.assert_allclose(batch_pe_dict[key], pe, atol=1e-5)
+
 
 if __name__ == "__main__":
     ut.main()
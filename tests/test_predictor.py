@@ -19,6 +19,7 @@ import torch
 from torch.nn import BCELoss, MSELoss
 import unittest as ut
 
+from graphium.trainer.predictor import PredictorModule
 from graphium.trainer.predictor_options import EvalOptions
 
 
@@ -31,6 +32,14 @@ class test_Predictor(ut.TestCase):
             loss_fun = EvalOptions.parse_loss_fun(this_loss)
             loss = loss_fun(preds, target)
 
+    def test_gradient_norm(self):
+        model = torch.nn.Sequential(torch.nn.Linear(5, 8), torch.nn.ReLU(), torch.nn.Linear(8, 2, bias=False))
+        self.assertEqual(PredictorModule.get_gradient_norm(model).item(), 0.0)
+
+        model(torch.randn(10, 5)).sum().backward()
+        expected = torch.sqrt(sum(p.grad.norm() ** 2 for p in model.parameters()))
+        torch.testing.assert_close(PredictorModule.get_gradient_norm(model), expected)
+
 
 if __name__ == "__main__":
     ut.main()
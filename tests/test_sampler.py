@@ -0,0 +1,175 @@
+"""
+--------------------------------------------------------------------------------
+Copyright (c) 2023 Valence Labs, Recursion Pharmaceuticals and Graphcore Limited.
+
+Use of this software is subject to the terms and conditions outlined in the LICENSE file.
+Unauthorized modification, distribution, or use is prohibited. Provided 'as is' without
+warranties of any kind.
+
+Valence Labs, Recursion Pharmaceuticals and Graphcore Limited are not liable for any damages arising from its use.
+Refer to the LICENSE file for the full terms and conditions.
+--------------------------------------------------------------------------------
+"""
+
+"""
+Unit tests for the samplers of the dataloader
+"""
+
+import unittest as ut
+
+import numpy as np
+from torch.utils.data.distributed import DistributedSampler
+
+from graphium.data.sampler import DatasetSubSampler, SizeBucketBatchSampler
+
+
+class _TaskIndicesDataset:
+    def __init__(self, task_indices, length):
+        self.task_indices = task_indices
+        self.length = length
+
+    def get_task_indices(self):
+        return self.task_indices
+
+    def __len__(self):
+        return self.length
+
+
+class test_SizeBucketBatchSampler(ut.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.num_nodes = rng.integers(1, 60, size=500)
+        self.num_nodes[7] = 200  # Larger than the budget
+        self.num_edges = 2 * self.num_nodes
+
+    def test_budget(self):
+        sampler = SizeBucketBatchSampler(
+            self.num_nodes,
+            self.num_edges,
+            max_num_nodes=150,
+            max_num_edges=250,
+            max_batch_size=16,
+            bucket_size=100,
+        )
+        batches = list(sampler)
+
+        # All the graphs are sampled exactly once
+        np.testing.assert_array_equal(np.sort(np.concatenate(batches)), np.arange(len(self.num_nodes)))
+        for batch in batches:
+            self.assertLessEqual(len(batch), 16)
+            if batch == [7]:
+                continue
+            self.assertLessEqual(self.num_nodes[batch].sum(), 150)
+            self.assertLessEqual(self.num_edges[batch].sum(), 250)
+
+    def test_shuffle(self):
+        kwargs = dict(num_nodes=self.num_nodes, max_num_nodes=150, bucket_size=100, seed=1)
+
+        # Deterministic given the seed and the epoch
+        sampler, other_sampler = SizeBucketBatchSampler(**kwargs), SizeBucketBatchSampler(**kwargs)
+        self.assertEqual(len(sampler), len(list(sampler)))
+        sampler.set_epoch(3)
+        other_sampler.set_epoch(3)
+        batches = list(sampler)
+        self.assertEqual(batches, list(other_sampler))
+        self.assertEqual(batches, list(sampler))
+
+        # Reshuffled at every epoch
+        sampler.set_epoch(4)
+        self.assertNotEqual(batches, list(sampler))
+
+        # The order is kept without shuffling
+        sampler = SizeBucketBatchSampler(**kwargs, shuffle=False)
+        np.testing.assert_array_equal(np.concatenate(list(sampler)), np.arange(len(self.num_nodes)))
+
+    def test_sampler(self):
+        indices = [5, 3, 3, 100, 42]
+        sampler = SizeBucketBatchSampler(self.num_nodes, max_batch_size=2, sampler=indices, shuffle=False)
+        self.assertEqual(list(sampler), [[5, 3], [3, 100], [42]])
+
+        with self.assertRaises(ValueError):
+            SizeBucketBatchSampler(self.num_nodes)
+        with self.assertRaises(ValueError):
+            SizeBucketBatchSampler(self.num_nodes, max_num_edges=100)
+
+    def test_drop_last(self):
+        num_nodes = [5, 5, 5, 5, 5, 5, 5]
+        sampler = SizeBucketBatchSampler(num_nodes, max_num_nodes=10, shuffle=False, drop_last=True)
+        self.assertEqual(list(sampler), [[0, 1], [2, 3], [4, 5]])
+
+        # The last batch is kept if it reaches the budget
+        sampler = SizeBucketBatchSampler(num_nodes[:6], max_num_nodes=10, shuffle=False, drop_last=True)
+        self.assertEqual(list(sampler), [[0, 1], [2, 3], [4, 5]])
+        sampler = SizeBucketBatchSampler(num_nodes, max_batch_size=1, shuffle=False, drop_last=True)
+        self.assertEqual(len(sampler), len(num_nodes))
+
+    def test_distributed(self):
+        kwargs = dict(num_nodes=self.num_nodes, max_num_nodes=150, bucket_size=100, seed=1)
+        samplers = [SizeBucketBatchSampler(**kwargs, num_replicas=3, rank=rank) for rank in range(3)]
+        for sampler in samplers:
+            sampler.set_epoch(2)
+        all_batches = [list(sampler) for sampler in samplers]
+
+        # The processes have the same number of batches, and all the batches are split across them
+        self.assertEqual(len(set(len(batches) for batches in all_batches)), 1)
+        sampler = SizeBucketBatchSampler(**kwargs)
+        sampler.set_epoch(2)
+        batches = list(sampler)
+        self.assertEqual(sum(len(batches) for batches in all_batches), -(-len(batches) // 3) * 3)
+        self.assertEqual(all_batches[0][0], batches[0])
+        self.assertEqual(all_batches[1][0], batches[1])
+        self.assertEqual(sampler.batch_size, None)
+
+
+class test_DatasetSubSampler(ut.TestCase):
+    def setUp(self):
+        # The molecules of `graph_c` are also labeled for `graph_a`
+        task_indices = {"graph_a": np.arange(0, 1000), "graph_b": np.arange(1000, 2000)}
+        task_indices["graph_c"] = np.arange(900, 1000)
+        self.dataset = _TaskIndicesDataset(task_indices, length=2100)
+        self.sampler_task_dict = {"graph_a": 1.0, "graph_b": 0.2, "graph_c": None}
+
+    def test_sampling(self):
+        sampler = DatasetSubSampler(self.dataset, self.sampler_task_dict, seed=1)
+        indices = np.asarray(list(sampler))
+        self.assertEqual(len(np.unique(indices)), len(indices))
+
+        # All the molecules of the tasks with a fraction of 1 are sampled
+        self.assertTrue(np.isin(np.arange(1000), indices).all())
+        self.assertEqual(np.isin(np.arange(1000, 2000), indices).sum(), 200)
+
+        # Deterministic given the seed and the epoch
+        sampler.set_epoch(2)
+        indices = list(sampler)
+        self.assertEqual(len(sampler), len(indices))
+        other_sampler = DatasetSubSampler(self.dataset, self.sampler_task_dict, seed=1)
+        other_sampler.set_epoch(2)
+        self.assertEqual(indices, list(other_sampler))
+        sampler.set_epoch(3)
+        self.assertNotEqual(indices, list(sampler))
+
+    def test_distributed(self):
+        samplers = [
+            DatasetSubSampler(self.dataset, self.sampler_task_dict, num_replicas=3, rank=rank)
+            for rank in range(3)
+        ]
+        for sampler in samplers:
+            sampler.set_epoch(5)
+        all_indices = [list(sampler) for sampler in samplers]
+        self.assertEqual(len(set(len(indices) for indices in all_indices)), 1)
+        for sampler, indices in zip(samplers, all_indices):
+            self.assertEqual(sampler.num_samples, len(indices))
+            self.assertEqual(sampler.total_size, 3 * len(indices))
+
+        sampler = DatasetSubSampler(self.dataset, self.sampler_task_dict)
+        sampler.set_epoch(5)
+        self.assertEqual(set(np.concatenate(all_indices).tolist()), set(sampler))
+
+        # Lightning does not wrap it in another distributed sampler
+        self.assertIsInstance(sampler, DistributedSampler)
+        self.assertEqual((sampler.num_replicas, sampler.rank, sampler.drop_last), (1, 0, False))
+        self.assertEqual(sampler.num_samples, len(sampler))
+
+
+if __name__ == "__main__":
+    ut.main()